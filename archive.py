@@ -0,0 +1,185 @@
+"""
+Local message archive for Telegram Vault Userbot
+Everything delivered to the vault is indexed in SQLite FTS5 (written in batches), so /search
+answers locally and the newest archived ID per chat can restore lost checkpoints
+"""
+import asyncio
+import logging
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+# /search shows at most this many hits
+SEARCH_LIMIT = 10
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS messages ("
+    " id INTEGER PRIMARY KEY,"
+    " chat_id INTEGER NOT NULL,"
+    " message_id INTEGER NOT NULL,"
+    " chat_title TEXT,"
+    " sender TEXT,"
+    " date REAL,"
+    " media TEXT,"
+    " text TEXT,"
+    " kind TEXT NOT NULL,"
+    " vault_chat_id INTEGER,"
+    " vault_username TEXT,"
+    " vault_message_id INTEGER,"
+    " archived_at REAL NOT NULL,"
+    " UNIQUE (chat_id, message_id))",
+    # External-content index: the text lives once, in messages
+    "CREATE VIRTUAL TABLE IF NOT EXISTS messages_fts USING fts5("
+    " text, chat_title, sender, content='messages', content_rowid='id',"
+    " tokenize='unicode61 remove_diacritics 2')",
+    # INSERT OR IGNORE skips the trigger for messages already archived
+    "CREATE TRIGGER IF NOT EXISTS messages_ai AFTER INSERT ON messages BEGIN"
+    " INSERT INTO messages_fts (rowid, text, chat_title, sender)"
+    " VALUES (new.id, new.text, new.chat_title, new.sender); END",
+)
+
+
+def _sender(message):
+    user = message.from_user
+    if user is not None:
+        name = " ".join(part for part in (user.first_name, user.last_name) if part)
+        return name or user.username or str(user.id)
+    if message.author_signature:
+        return message.author_signature
+    if message.sender_chat is not None:
+        return message.sender_chat.title
+    return None
+
+
+def message_link(chat_id, message_id, username=None):
+    """t.me link to a message, or None for chats that have no public or /c/ links"""
+    if message_id is None:
+        return None
+    if username:
+        return f"https://t.me/{username}/{message_id}"
+    if chat_id is not None and str(chat_id).startswith("-100"):
+        return f"https://t.me/c/{str(chat_id)[4:]}/{message_id}"
+    return None
+
+
+def _quoted(query):
+    """Query with every term quoted, for input that isn't valid FTS5 syntax (e.g. 'c++' or 'a:b')"""
+    return " ".join('"{}"'.format(term.replace('"', '""')) for term in query.split())
+
+
+class SearchHit:
+    __slots__ = ("chat_id", "message_id", "chat_title", "date", "snippet", "link")
+
+    def __init__(self, chat_id, message_id, chat_title, date, snippet, link):
+        self.chat_id = chat_id
+        self.message_id = message_id
+        self.chat_title = chat_title
+        self.date = date
+        self.snippet = snippet
+        self.link = link
+
+
+class Archive:
+    """
+    Append-only archive of delivered messages
+    record() only keeps a small row tuple in memory; flush() inserts all pending rows in one
+    transaction. A message is archived once, however often it is delivered.
+    """
+
+    def __init__(self, path="archive.db"):
+        self.path = path
+        self._db = None
+        self._pending = []
+
+    def open(self):
+        if self._db is not None:
+            return
+        self._db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self._db.execute(statement)
+
+    def record(self, message, vault_message=None, kind="forward"):
+        """Queue one delivered message (and the vault message it became, if known)"""
+        vault_chat = vault_message.chat if vault_message is not None else None
+        media = message.media.name.lower() if message.media is not None else None
+        self._pending.append((
+            message.chat.id, message.id,
+            message.chat.title or message.chat.first_name,
+            _sender(message),
+            message.date.timestamp() if message.date is not None else None,
+            media,
+            message.text or message.caption or "",
+            kind,
+            vault_chat.id if vault_chat is not None else None,
+            vault_chat.username if vault_chat is not None else None,
+            vault_message.id if vault_message is not None else None,
+            time.time(),
+        ))
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def flush(self):
+        """Insert all pending rows in one transaction"""
+        if not self._pending:
+            return 0
+        self.open()
+        pending, self._pending = self._pending, []
+        try:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.executemany(
+                    "INSERT OR IGNORE INTO messages (chat_id, message_id, chat_title, sender, date, media, text,"
+                    " kind, vault_chat_id, vault_username, vault_message_id, archived_at)"
+                    " VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                    pending
+                )
+        except sqlite3.Error as e:
+            # Keep the rows so the next flush retries them
+            self._pending = pending + self._pending
+            logger.error(f"❌ Failed to write archive: {e}")
+            return 0
+        return len(pending)
+
+    async def autoflush(self, interval=5):
+        while True:
+            await asyncio.sleep(interval)
+            self.flush()
+
+    def search(self, query, limit=SEARCH_LIMIT):
+        """Best-matching archived messages for an FTS5 query (plain words work too)"""
+        self.flush()
+        self.open()
+        sql = (
+            "SELECT m.chat_id, m.message_id, m.chat_title, m.date,"
+            " snippet(messages_fts, 0, '«', '»', '…', 12),"
+            " m.vault_chat_id, m.vault_username, m.vault_message_id"
+            " FROM messages_fts JOIN messages m ON m.id = messages_fts.rowid"
+            " WHERE messages_fts MATCH ? ORDER BY bm25(messages_fts) LIMIT ?"
+        )
+        try:
+            rows = self._db.execute(sql, (query, limit)).fetchall()
+        except sqlite3.OperationalError:
+            rows = self._db.execute(sql, (_quoted(query), limit)).fetchall()
+        return [
+            SearchHit(chat_id, message_id, title, date, snippet,
+                      message_link(vault_chat_id, vault_message_id, vault_username)
+                      or message_link(chat_id, message_id))
+            for chat_id, message_id, title, date, snippet, vault_chat_id, vault_username, vault_message_id in rows
+        ]
+
+    def last_ids(self):
+        """{chat_id: newest archived message id}, used to recover missing checkpoints"""
+        self.flush()
+        self.open()
+        return dict(self._db.execute("SELECT chat_id, MAX(message_id) FROM messages GROUP BY chat_id"))
+
+    def close(self):
+        self.flush()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
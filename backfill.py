@@ -0,0 +1,155 @@
+"""
+Historical backfill jobs for Telegram Vault Userbot
+A job copies one chat's messages in an ID range to the vault; its cursor (the last message
+ID known to be delivered) is stored in SQLite so an interrupted backfill resumes where it stopped
+"""
+import asyncio
+import logging
+import sqlite3
+import time
+from fanout import parse_chat_id
+
+logger = logging.getLogger(__name__)
+
+
+class BackfillJob:
+    """Messages first_id..last_id of chat_id; everything up to `cursor` is already in the vault"""
+    __slots__ = ("chat_id", "first_id", "last_id", "cursor", "started_at")
+
+    def __init__(self, chat_id, first_id, last_id, cursor=None, started_at=None):
+        self.chat_id = chat_id
+        self.first_id = first_id
+        self.last_id = last_id
+        self.cursor = first_id - 1 if cursor is None else cursor
+        self.started_at = time.time() if started_at is None else started_at
+
+    @property
+    def done(self):
+        return self.cursor >= self.last_id
+
+    @property
+    def progress(self):
+        """Fraction of the ID range behind the cursor (IDs, not messages: deleted ones count too)"""
+        span = self.last_id - self.first_id + 1
+        return 1.0 if span <= 0 else min(1.0, (self.cursor - self.first_id + 1) / span)
+
+    def describe(self):
+        return f"{self.chat_id}: {self.first_id}..{self.last_id} at {self.cursor} ({self.progress:.0%})"
+
+
+class BackfillStore:
+    """
+    Backfill jobs by chat ID, one row each in the checkpoint database
+    advance() only records the new cursor in memory; flush() writes all pending cursors in one
+    transaction. Cursors only ever move forward. Finished jobs stay until a new job replaces them.
+    """
+
+    def __init__(self, path="checkpoints.db", table="backfill_jobs"):
+        self.path = path
+        self.table = table
+        self._db = None
+        self._pending = {}
+
+    def open(self):
+        if self._db is not None:
+            return
+        self._db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            " chat_id INTEGER PRIMARY KEY,"
+            " first_id INTEGER NOT NULL,"
+            " last_id INTEGER NOT NULL,"
+            " cursor INTEGER NOT NULL,"
+            " started_at REAL NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+
+    def start(self, job):
+        """Store a new job for its chat, replacing any earlier one; written right away"""
+        self.open()
+        self._pending.pop(job.chat_id, None)
+        self._db.execute(
+            f"INSERT OR REPLACE INTO {self.table} (chat_id, first_id, last_id, cursor, started_at, updated_at)"
+            " VALUES (?, ?, ?, ?, ?, ?)",
+            (job.chat_id, job.first_id, job.last_id, job.cursor, job.started_at, time.time())
+        )
+        return job
+
+    def advance(self, job, cursor):
+        if cursor > job.cursor:
+            job.cursor = cursor
+            self._pending[job.chat_id] = cursor
+
+    def load(self):
+        """Every stored job, finished or not, by chat ID"""
+        self.open()
+        return {
+            row[0]: BackfillJob(*row)
+            for row in self._db.execute(
+                f"SELECT chat_id, first_id, last_id, cursor, started_at FROM {self.table}"
+            )
+        }
+
+    def unfinished(self):
+        jobs = self.load()
+        for chat_id, cursor in self._pending.items():
+            if chat_id in jobs:
+                jobs[chat_id].cursor = max(jobs[chat_id].cursor, cursor)
+        return [job for job in jobs.values() if not job.done]
+
+    @property
+    def pending(self):
+        return len(self._pending)
+
+    def flush(self):
+        """Write all pending cursors in one transaction"""
+        if not self._pending:
+            return 0
+        self.open()
+        pending, self._pending = self._pending, {}
+        now = time.time()
+        try:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.executemany(
+                    f"UPDATE {self.table} SET cursor = MAX(cursor, ?), updated_at = ? WHERE chat_id = ?",
+                    [(cursor, now, chat_id) for chat_id, cursor in pending.items()]
+                )
+        except sqlite3.Error as e:
+            # Put the batch back so the next flush retries it
+            for chat_id, cursor in pending.items():
+                self._pending[chat_id] = max(cursor, self._pending.get(chat_id, 0))
+            logger.error(f"❌ Failed to write backfill progress: {e}")
+            return 0
+        return len(pending)
+
+    async def autoflush(self, interval=5):
+        while True:
+            await asyncio.sleep(interval)
+            self.flush()
+
+    def close(self):
+        self.flush()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
+
+
+def parse_backfill_args(args):
+    """['<chat>', '[from]', '[to]'] -> (chat_id, first_id, last_id) with None for missing IDs; [] -> ()"""
+    if not args:
+        return ()
+    if len(args) > 3:
+        raise ValueError("expected <chat> [from] [to]")
+    chat_id = parse_chat_id(args[0])
+    try:
+        ids = [int(value) for value in args[1:]]
+    except ValueError:
+        raise ValueError("message IDs must be numbers")
+    first_id = ids[0] if ids else None
+    last_id = ids[1] if len(ids) > 1 else None
+    if (first_id is not None and first_id < 1) or (last_id is not None and last_id < (first_id or 1)):
+        raise ValueError("expected 1 <= from <= to")
+    return chat_id, first_id, last_id
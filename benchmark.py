@@ -0,0 +1,603 @@
+"""
+Offline replay and benchmark harness for Telegram Vault Userbot
+Drives message_handler, poll_channels and initialize_last_message_ids against FakeClient, an
+in-process stand-in for pyrogram.Client serving synthetic chats with bursts, albums,
+forward-restricted chats and injected FloodWaits. Nothing touches the network or the real state files.
+
+    python benchmark.py                                   # every scenario with the defaults
+    python benchmark.py realtime --chats 200 --messages 20000 --rate 0
+    python benchmark.py poll --backlog 800 --json > poll.json
+    python benchmark.py --max-p99 5 --max-calls-per-message 0.5   # exit 1 on regression
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from collections import Counter, deque
+
+# Config reads these at import: keep state in a throwaway directory and logging quiet
+STATE_DIR = tempfile.mkdtemp(prefix="vault-bench-")
+os.environ["CHECKPOINT_DB"] = os.path.join(STATE_DIR, "checkpoints.db")
+os.environ["DEDUP_PATH"] = os.path.join(STATE_DIR, "dedup.state")
+os.environ["PEER_CACHE_PATH"] = os.path.join(STATE_DIR, "peer_cache.json")
+os.environ["METRICS_PORT"] = "0"
+os.environ.setdefault("LOG_LEVEL", "WARNING")
+
+from pyrogram import raw, types, utils
+from pyrogram.client import Cache
+from pyrogram.enums import ChatType
+from pyrogram.errors import ChatForwardsRestricted, FloodWait
+from config import Config
+from chat_state import ChatTable
+from checkpoints import CheckpointStore
+from dedup import Deduplicator
+from delivery import DeliveryQueue
+from fanout import VaultRouter
+from forwarding import ForwardBatcher, forward_batch
+from peer_cache import PeerCache
+from rate_limit import ApiLimiter
+from scheduler import PollScheduler
+from sharding import Account, ShardManager
+import userbot
+
+OWNER_ID = 100000001
+VAULT_ID = -1009999999999
+FIRST_CHAT_ID = -1001000000000
+
+
+class SyntheticChat:
+    """A broadcast channel whose history is generated up front"""
+    __slots__ = ("id", "title", "restricted", "history", "next_id")
+
+    def __init__(self, id, title, restricted=False):
+        self.id = id
+        self.title = title
+        self.restricted = restricted
+        self.history = []
+        self.next_id = 1
+
+    def post(self, date, text, grouped_id=None):
+        message = raw.types.Message(
+            id=self.next_id,
+            peer_id=raw.types.PeerChannel(channel_id=utils.get_channel_id(self.id)),
+            date=int(date),
+            message=text,
+            entities=[],
+            post=True,
+            noforwards=self.restricted or None,
+            grouped_id=grouped_id,
+        )
+        self.next_id += 1
+        self.history.append(message)
+        return message
+
+    def raw_chat(self):
+        return raw_channel(self.id, self.title, self.restricted)
+
+
+def raw_channel(chat_id, title, restricted=False):
+    return raw.types.Channel(
+        id=utils.get_channel_id(chat_id), title=title, photo=raw.types.ChatPhotoEmpty(), date=0,
+        broadcast=True, access_hash=abs(chat_id), noforwards=restricted or None, restriction_reason=[]
+    )
+
+
+class FakeStorage:
+    """Just enough of Pyrogram's session storage for PeerCache.restore_to_storage"""
+
+    def __init__(self):
+        self.peers = {}
+
+    async def update_peers(self, peers):
+        for peer in peers:
+            self.peers[peer[0]] = peer
+
+
+class FakeClient:
+    """
+    Serves the subset of pyrogram.Client the userbot calls, from memory
+    Every simulated API call sleeps `latency` seconds, is counted per method and raises
+    FloodWait(flood_wait) with probability `flood_rate`. Forwards from restricted chats
+    raise CHAT_FORWARDS_RESTRICTED like Telegram does.
+    """
+
+    def __init__(self, chats, latency=0.02, flood_rate=0.0, flood_wait=1, seed=0, too_long_after=1000):
+        self.chats = {chat.id: chat for chat in chats}
+        self.too_long_after = too_long_after
+        self.latency = latency
+        self.flood_rate = flood_rate
+        self.flood_wait = flood_wait
+        self.rng = random.Random(seed)
+        self.storage = FakeStorage()
+        # Message._parse writes every parsed message here, as on the real client
+        self.message_cache = Cache(10000)
+        self.calls = Counter()
+        self.flood_waits = 0
+        self.delivered = {}
+        self.copied = 0
+        self.vault = deque(maxlen=1000)
+
+    async def _api(self, method):
+        self.calls[method] += 1
+        if self.latency:
+            await asyncio.sleep(self.latency)
+        if self.flood_rate and self.rng.random() < self.flood_rate:
+            self.flood_waits += 1
+            raise FloodWait(value=self.flood_wait)
+
+    def _chat(self, chat_id):
+        chat = self.chats.get(chat_id)
+        if chat is None:
+            raise KeyError(f"unknown chat {chat_id}")
+        return chat
+
+    async def get_me(self):
+        await self._api("get_me")
+        return types.User(id=OWNER_ID, first_name="Bench", is_self=True)
+
+    async def get_users(self, user_id):
+        await self._api("get_users")
+        return types.User(id=user_id, first_name=f"user{user_id}")
+
+    async def get_chat(self, chat_id):
+        await self._api("get_chat")
+        if chat_id == VAULT_ID:
+            return types.Chat(id=VAULT_ID, type=ChatType.CHANNEL, title="Vault")
+        chat = self._chat(chat_id)
+        return types.Chat(id=chat.id, type=ChatType.CHANNEL, title=chat.title, has_protected_content=chat.restricted)
+
+    async def resolve_peer(self, peer_id):
+        # Answered from the session storage in the real client, so not counted as an API call
+        if peer_id == VAULT_ID or peer_id in self.chats:
+            return raw.types.InputPeerChannel(channel_id=utils.get_channel_id(peer_id), access_hash=abs(peer_id))
+        return raw.types.InputPeerUser(user_id=peer_id, access_hash=peer_id)
+
+    def _page(self, chat, offset_id, add_offset, limit, min_id):
+        """messages.getHistory semantics over an ascending history, newest first"""
+        newest_first = chat.history[::-1]
+        start = 0
+        if offset_id:
+            while start < len(newest_first) and newest_first[start].id >= offset_id:
+                start += 1
+        start = max(0, start + add_offset)
+        return [m for m in newest_first[start:start + limit] if m.id > min_id]
+
+    def _dialog(self, chat):
+        # Every synthetic post is one pts step, so a channel's pts is its newest message id
+        return raw.types.Dialog(
+            peer=raw.types.PeerChannel(channel_id=utils.get_channel_id(chat.id)), top_message=chat.next_id - 1,
+            read_inbox_max_id=0, read_outbox_max_id=0, unread_count=0, unread_mentions_count=0,
+            unread_reactions_count=0, notify_settings=raw.types.PeerNotifySettings(), pts=chat.next_id - 1
+        )
+
+    def _difference(self, chat, pts, limit):
+        """updates.getChannelDifference over the synthetic history (pts == message id)"""
+        head = chat.next_id - 1
+        if head <= pts:
+            return raw.types.updates.ChannelDifferenceEmpty(pts=pts, final=True, timeout=30)
+        if head - pts > self.too_long_after:
+            return raw.types.updates.ChannelDifferenceTooLong(
+                dialog=self._dialog(chat), messages=[], chats=[chat.raw_chat()], users=[], final=True
+            )
+        messages = [m for m in chat.history if m.id > pts][:limit]
+        return raw.types.updates.ChannelDifference(
+            pts=messages[-1].id, new_messages=messages, other_updates=[], chats=[chat.raw_chat()], users=[],
+            final=messages[-1].id >= head, timeout=30
+        )
+
+    async def invoke(self, request):
+        if isinstance(request, raw.functions.messages.GetPeerDialogs):
+            await self._api("messages.GetPeerDialogs")
+            chats = [self._chat(utils.get_channel_id(p.peer.channel_id)) for p in request.peers]
+            return raw.types.messages.PeerDialogs(
+                dialogs=[self._dialog(chat) for chat in chats], messages=[],
+                chats=[chat.raw_chat() for chat in chats], users=[],
+                state=raw.types.updates.State(pts=0, qts=0, date=0, seq=0, unread_count=0)
+            )
+        if isinstance(request, raw.functions.updates.GetChannelDifference):
+            await self._api("updates.GetChannelDifference")
+            chat = self._chat(utils.get_channel_id(request.channel.channel_id))
+            return self._difference(chat, request.pts, request.limit)
+        if not isinstance(request, raw.functions.messages.GetHistory):
+            raise NotImplementedError(type(request).__name__)
+        await self._api("messages.GetHistory")
+        chat = self._chat(utils.get_channel_id(request.peer.channel_id))
+        messages = self._page(chat, request.offset_id, request.add_offset, request.limit, request.min_id)
+        return raw.types.messages.Messages(messages=messages, chats=[chat.raw_chat()], users=[])
+
+    async def get_chat_history(self, chat_id, limit=0):
+        await self._api("messages.GetHistory")
+        if chat_id == VAULT_ID:
+            page = list(self.vault)[::-1][:limit or None]
+            chats = [chat.raw_chat() for chat in self.chats.values()]
+            chats.append(raw_channel(VAULT_ID, "Vault"))
+        else:
+            chat = self._chat(chat_id)
+            page = chat.history[::-1][:limit or None]
+            chats = [chat.raw_chat()]
+        for message in await utils.parse_messages(self, raw.types.messages.Messages(messages=page, chats=chats, users=[]), replies=0):
+            yield message
+
+    def _vault_post(self, text=None, source=None, source_id=None):
+        fwd_from = None
+        if source is not None:
+            fwd_from = raw.types.MessageFwdHeader(
+                date=int(time.time()),
+                from_id=raw.types.PeerChannel(channel_id=utils.get_channel_id(source)),
+                channel_post=source_id,
+            )
+        message = raw.types.Message(
+            id=len(self.vault) + 1, peer_id=raw.types.PeerChannel(channel_id=utils.get_channel_id(VAULT_ID)),
+            date=int(time.time()), message=text or "", entities=[], fwd_from=fwd_from, post=True,
+        )
+        self.vault.append(message)
+
+    async def forward_messages(self, chat_id, from_chat_id, message_ids):
+        await self._api("forward_messages")
+        if self._chat(from_chat_id).restricted:
+            raise ChatForwardsRestricted()
+        now = time.monotonic()
+        for message_id in message_ids:
+            self.delivered.setdefault((from_chat_id, message_id), now)
+        self._vault_post(source=from_chat_id, source_id=message_ids[-1])
+
+    async def send_message(self, chat_id, text, **kwargs):
+        await self._api("send_message")
+        match = userbot.COPIED_MESSAGE_RE.search(text)
+        if match:
+            self.copied += 1
+            self.delivered.setdefault((int(match.group(1)), int(match.group(2))), time.monotonic())
+        self._vault_post(text=text)
+
+
+def build_chats(count, restricted_fraction, rng):
+    chats = []
+    for i in range(count):
+        chats.append(SyntheticChat(FIRST_CHAT_ID - i, f"Channel {i}", rng.random() < restricted_fraction))
+    return chats
+
+
+def random_text(rng):
+    return " ".join(rng.choice(("job", "remote", "python", "apply", "hiring", "senior", "urgent", "link"))
+                    for _ in range(rng.randint(3, 60)))
+
+
+def generate_posts(chats, count, args, rng, start=0.0, rate=0.0):
+    """
+    Append `count` posts across `chats` (busiest chats get most traffic) and return
+    [(offset_seconds, chat, raw_message)] in arrival order. Bursts share one timestamp;
+    albums are 2-10 consecutive posts with one grouped_id.
+    """
+    weights = [1 / (rank + 1) for rank in range(len(chats))]
+    events = []
+    clock = start
+    grouped_id = 1
+    while len(events) < count:
+        if rate:
+            clock += rng.expovariate(rate)
+        chat = rng.choices(chats, weights)[0]
+        roll = rng.random()
+        if roll < args.album_rate:
+            size, group = rng.randint(2, 10), grouped_id
+            grouped_id += 1
+        elif roll < args.album_rate + args.burst_rate:
+            size, group = rng.randint(5, args.burst_size), None
+        else:
+            size, group = 1, None
+        for _ in range(min(size, count - len(events))):
+            events.append((clock, chat, chat.post(time.time() + clock, random_text(rng), group)))
+    return events
+
+
+def reset_userbot(client, args, targets):
+    """Fresh userbot state wired to `client`, mirroring what main() sets up"""
+    Config.VAULT_CHAT_ID = str(VAULT_ID)
+    Config.TARGET_USER_IDS = ()
+    Config.TARGET_CHANNEL_IDS = tuple(targets)
+    Config.FAST_CHANNEL_IDS = ()
+    run = f"{time.monotonic_ns()}"
+    userbot.api_limiter = ApiLimiter(args.api_rate, args.api_burst)
+    userbot.peer_cache = PeerCache(os.path.join(STATE_DIR, f"peers-{run}.json"), limiter=userbot.api_limiter)
+    userbot.deduplicator = Deduplicator(os.path.join(STATE_DIR, f"dedup-{run}"), Config.DEDUP_LRU_SIZE,
+                                        Config.DEDUP_CAPACITY)
+    userbot.checkpoint_store.close()
+    userbot.checkpoint_store = CheckpointStore(os.path.join(STATE_DIR, f"checkpoints-{run}.db"))
+    userbot.chat_table = ChatTable()
+    userbot.last_message_ids = userbot.chat_table.column("last_id")
+    userbot.channel_pts = userbot.chat_table.column("pts")
+    userbot.realtime_marks = userbot.chat_table.column("mark")
+    userbot.pts_unsupported.clear()
+    userbot.poll_cursors.clear()
+    userbot.poll_holds.clear()
+    userbot.realtime_holds.clear()
+    userbot.backfill_holds.clear()
+    userbot.poll_scheduler = PollScheduler(userbot.POLL_INTERVAL, Config.POLL_MIN_INTERVAL,
+                                           Config.POLL_MAX_INTERVAL, Config.POLL_FAST_INTERVAL,
+                                           table=userbot.chat_table)
+    userbot.POLL_STARTUP_DELAY = 0
+
+    async def send_to_vault(chat_id, messages, destination):
+        await forward_batch(client, destination, chat_id, messages, userbot.api_limiter)
+
+    userbot.delivery_queue = DeliveryQueue(send_to_vault, workers=Config.DELIVERY_WORKERS,
+                                           max_size=Config.DELIVERY_QUEUE_SIZE,
+                                           max_attempts=Config.DELIVERY_MAX_ATTEMPTS,
+                                           max_flood_waits=Config.DELIVERY_MAX_FLOOD_WAITS,
+                                           on_delivered=userbot.delivery_settled,
+                                           on_failed=userbot.delivery_failed)
+    # Extra vaults receive every message, so API calls per message show the fan-out cost
+    userbot.vault_router = VaultRouter(VAULT_ID, [f"* => {VAULT_ID - i}" for i in range(1, args.vaults)])
+    userbot.forward_batcher = ForwardBatcher(userbot.fan_out, max_delay=Config.FORWARD_BATCH_DELAY)
+    userbot.shards = ShardManager(Account("bench", client, userbot.api_limiter))
+    userbot.rebuild_routing_table(OWNER_ID)
+
+
+def percentile(values, q):
+    if not values:
+        return None
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(q * len(ordered))) - 1))]
+
+
+def report(name, client, expected, elapsed, latencies, peak_memory, extra=None):
+    forwarded = sum(1 for key in expected if key in client.delivered)
+    api_calls = sum(client.calls.values())
+    result = {
+        "scenario": name,
+        "messages": len(expected),
+        "delivered": forwarded,
+        "copied": client.copied,
+        "elapsed_s": round(elapsed, 3),
+        "throughput_msg_s": round(forwarded / elapsed, 1) if elapsed > 0 else None,
+        "latency_p50_s": percentile(latencies, 0.5),
+        "latency_p99_s": percentile(latencies, 0.99),
+        "api_calls": api_calls,
+        "api_calls_per_message": round(api_calls / forwarded, 4) if forwarded else None,
+        "api_calls_by_method": dict(client.calls.most_common()),
+        "flood_waits_injected": client.flood_waits,
+        "peak_memory_mib": round(peak_memory / 2 ** 20, 2) if peak_memory is not None else None,
+    }
+    if extra:
+        result.update(extra)
+    return result
+
+
+class MemoryPeak:
+    """Peak traced allocation above the level at entry (everything generated beforehand is excluded)"""
+
+    def __init__(self, enabled):
+        self.enabled = enabled
+        self.peak = None
+
+    def __enter__(self):
+        if self.enabled:
+            self.base = tracemalloc.get_traced_memory()[0]
+            tracemalloc.reset_peak()
+        return self
+
+    def __exit__(self, *exc):
+        if self.enabled:
+            self.peak = max(0, tracemalloc.get_traced_memory()[1] - self.base)
+
+
+async def wait_until(predicate, timeout):
+    deadline = time.monotonic() + timeout
+    while not predicate():
+        if time.monotonic() > deadline:
+            return False
+        await asyncio.sleep(0.05)
+    return True
+
+
+async def scenario_realtime(args):
+    """Replay a live update stream through the routing filter and message_handler"""
+    rng = random.Random(args.seed)
+    chats = build_chats(args.chats, args.restricted, rng)
+    client = FakeClient(chats, args.latency, args.flood_rate, args.flood_wait, args.seed)
+    reset_userbot(client, args, [chat.id for chat in chats])
+    events = generate_posts(chats, args.messages, args, rng, rate=args.rate)
+    raw_chats = {utils.get_channel_id(chat.id): chat.raw_chat() for chat in chats}
+    updates = []
+    for offset, chat, message in events:
+        parsed = await types.Message._parse(client, message, {}, raw_chats, replies=0)
+        updates.append((offset, parsed))
+        if rng.random() < args.duplicates:
+            updates.append((offset, parsed))
+    dispatch = userbot.dispatch_filter(lambda: userbot.routing_table)
+    expected = {(chat.id, message.id) for _, chat, message in events}
+
+    injected = {}
+    with MemoryPeak(args.memory) as memory:
+        userbot.delivery_queue.start()
+        started = time.monotonic()
+        for offset, message in updates:
+            delay = started + offset - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            injected.setdefault((message.chat.id, message.id), time.monotonic())
+            if await dispatch(client, message):
+                await userbot.message_handler(client, message)
+        await userbot.forward_batcher.flush()
+        await userbot.delivery_queue.stop(timeout=args.timeout)
+        finished = max((client.delivered.get(key, started) for key in expected), default=started)
+    latencies = [client.delivered[key] - injected[key] for key in expected if key in client.delivered]
+    return report("realtime", client, expected, finished - started, latencies, memory.peak,
+                  {"duplicates_replayed": len(updates) - len(events),
+                   "dead_letters": len(userbot.delivery_queue.dead_letters)})
+
+
+async def scenario_poll(args):
+    """Let poll_channels catch every channel up from its checkpoint to the head of its history"""
+    rng = random.Random(args.seed)
+    chats = build_chats(args.chats, args.restricted, rng)
+    client = FakeClient(chats, args.latency, args.flood_rate, args.flood_wait, args.seed)
+    reset_userbot(client, args, [chat.id for chat in chats])
+    generate_posts(chats, args.chats * 5, args, rng)
+    for chat in chats:
+        if not chat.history:
+            # Give empty channels one old post so they start from a checkpoint too
+            chat.post(time.time(), random_text(rng))
+        userbot.checkpoint_store.update(chat.id, chat.history[-1].id)
+        if rng.random() < args.pts:
+            # Synced by difference from the first poll (pts == newest message id in FakeClient)
+            userbot.checkpoint_store.update_pts(chat.id, chat.history[-1].id)
+    userbot.checkpoint_store.flush()
+    events = generate_posts(chats, args.backlog * args.chats, args, rng)
+    expected = {(chat.id, message.id) for _, chat, message in events}
+    heads = {chat.id: chat.history[-1].id for chat in chats}
+
+    with MemoryPeak(args.memory) as memory:
+        userbot.delivery_queue.start()
+        started = time.monotonic()
+        poller = asyncio.ensure_future(userbot.poll_channels(client))
+        caught_up = await wait_until(
+            lambda: all(userbot.last_message_ids.get(c, 0) >= head for c, head in heads.items()), args.timeout
+        )
+        finished = time.monotonic()
+        poller.cancel()
+        await asyncio.gather(poller, return_exceptions=True)
+        await userbot.delivery_queue.stop(timeout=args.timeout)
+    latencies = [client.delivered[key] - started for key in expected if key in client.delivered]
+    return report("poll", client, expected, finished - started, latencies, memory.peak,
+                  {"caught_up": caught_up, "dead_letters": len(userbot.delivery_queue.dead_letters)})
+
+
+async def scenario_startup(args):
+    """initialize_last_message_ids with a mix of stored checkpoints, vault-recoverable and brand new chats"""
+    rng = random.Random(args.seed)
+    chats = build_chats(args.startup_chats, args.restricted, rng)
+    client = FakeClient(chats, args.latency, args.flood_rate, args.flood_wait, args.seed)
+    reset_userbot(client, args, [chat.id for chat in chats])
+    generate_posts(chats, args.startup_chats * 5, args, rng)
+    stored = vault = fresh = 0
+    for chat in chats:
+        if not chat.history:
+            chat.post(time.time(), random_text(rng))
+        roll = rng.random()
+        if roll < args.checkpointed:
+            userbot.checkpoint_store.update(chat.id, chat.history[-1].id)
+            stored += 1
+        elif roll < args.checkpointed + (1 - args.checkpointed) / 2:
+            client._vault_post(source=chat.id, source_id=chat.history[-1].id)
+            vault += 1
+        else:
+            fresh += 1
+    userbot.checkpoint_store.flush()
+    userbot.checkpoint_store.close()
+    userbot.checkpoint_store = CheckpointStore(userbot.checkpoint_store.path)
+
+    with MemoryPeak(args.memory) as memory:
+        started = time.monotonic()
+        await userbot.initialize_last_message_ids(client)
+        finished = time.monotonic()
+    initialized = sum(1 for chat in chats if chat.id in userbot.last_message_ids)
+    result = report("startup", client, set(), finished - started, [], memory.peak,
+                    {"chats": len(chats), "initialized": initialized,
+                     "from_checkpoints": stored, "from_vault": vault, "from_head": fresh})
+    result["throughput_chats_s"] = round(len(chats) / (finished - started), 1) if finished > started else None
+    return result
+
+
+SCENARIOS = {"realtime": scenario_realtime, "poll": scenario_poll, "startup": scenario_startup}
+
+
+def _fmt_seconds(value):
+    return "-" if value is None else (f"{value * 1000:.0f}ms" if value < 1 else f"{value:.2f}s")
+
+
+def print_report(result):
+    print(f"== {result['scenario']} ==")
+    if result["messages"]:
+        print(f"  delivered        {result['delivered']}/{result['messages']} (copied as text {result['copied']})")
+        print(f"  throughput       {result['throughput_msg_s']} msg/s over {result['elapsed_s']}s")
+        print(f"  latency p50/p99  {_fmt_seconds(result['latency_p50_s'])} / {_fmt_seconds(result['latency_p99_s'])}")
+        print(f"  api calls        {result['api_calls']} ({result['api_calls_per_message']} per message)")
+    else:
+        print(f"  initialized      {result['initialized']}/{result['chats']} chats in {result['elapsed_s']}s "
+              f"(checkpoints {result['from_checkpoints']}, vault {result['from_vault']}, head {result['from_head']})")
+        print(f"  api calls        {result['api_calls']}")
+    print(f"  by method        {', '.join(f'{k}={v}' for k, v in result['api_calls_by_method'].items()) or '-'}")
+    print(f"  floodwaits       {result['flood_waits_injected']} injected")
+    if result["peak_memory_mib"] is not None:
+        print(f"  peak memory      {result['peak_memory_mib']} MiB")
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmark for Telegram Vault Userbot")
+    parser.add_argument("scenarios", nargs="*", metavar="scenario",
+                        help=f"scenarios to run: {', '.join(SCENARIOS)} (default: all)")
+    parser.add_argument("--chats", type=int, default=20, help="monitored channels")
+    parser.add_argument("--messages", type=int, default=500, help="realtime updates to replay")
+    parser.add_argument("--rate", type=float, default=100, help="realtime messages per second (0 = as fast as possible)")
+    parser.add_argument("--backlog", type=int, default=50, help="new posts per channel for the poll scenario")
+    parser.add_argument("--startup-chats", type=int, default=200, help="channels for the startup scenario")
+    parser.add_argument("--checkpointed", type=float, default=0.8, help="startup: fraction with a stored checkpoint")
+    parser.add_argument("--pts", type=float, default=1.0,
+                        help="poll: fraction of channels with a stored pts (the rest start from history)")
+    parser.add_argument("--album-rate", type=float, default=0.05, help="fraction of posts that start an album")
+    parser.add_argument("--burst-rate", type=float, default=0.05, help="fraction of posts that start a burst")
+    parser.add_argument("--burst-size", type=int, default=30, help="largest burst")
+    parser.add_argument("--vaults", type=int, default=1, help="destination vaults every message fans out to")
+    parser.add_argument("--restricted", type=float, default=0.1, help="fraction of forward-restricted chats")
+    parser.add_argument("--duplicates", type=float, default=0.02, help="realtime: fraction of updates delivered twice")
+    parser.add_argument("--latency", type=float, default=0.02, help="simulated seconds per API call")
+    parser.add_argument("--flood-rate", type=float, default=0.002, help="probability an API call raises FloodWait")
+    parser.add_argument("--flood-wait", type=int, default=1, help="FloodWait seconds")
+    parser.add_argument("--api-rate", type=float, default=Config.API_RATE, help="limiter calls per second")
+    parser.add_argument("--api-burst", type=int, default=Config.API_BURST, help="limiter burst")
+    parser.add_argument("--timeout", type=float, default=300, help="give up on a scenario after this many seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--no-memory", dest="memory", action="store_false",
+                        help="skip tracemalloc (faster, no peak memory figure)")
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    parser.add_argument("--max-p99", type=float, help="fail if any scenario's p99 latency exceeds this (seconds)")
+    parser.add_argument("--max-calls-per-message", type=float,
+                        help="fail if any scenario needs more API calls per delivered message")
+    args = parser.parse_args(argv)
+    for name in args.scenarios:
+        if name not in SCENARIOS:
+            parser.error(f"unknown scenario {name!r} (choose from {', '.join(SCENARIOS)})")
+    return args
+
+
+async def run(args):
+    results = []
+    for name in args.scenarios or list(SCENARIOS):
+        results.append(await SCENARIOS[name](args))
+    return results
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.memory:
+        tracemalloc.start()
+    results = asyncio.run(run(args))
+    if args.json:
+        print(json.dumps(results, indent=2))
+    else:
+        for result in results:
+            print_report(result)
+
+    failures = []
+    for result in results:
+        if result["delivered"] < result["messages"]:
+            failures.append(f"{result['scenario']}: only {result['delivered']}/{result['messages']} delivered")
+        p99 = result["latency_p99_s"]
+        if args.max_p99 is not None and p99 is not None and p99 > args.max_p99:
+            failures.append(f"{result['scenario']}: p99 {p99:.3f}s > {args.max_p99}s")
+        per_message = result["api_calls_per_message"]
+        if args.max_calls_per_message is not None and per_message is not None \
+                and per_message > args.max_calls_per_message:
+            failures.append(f"{result['scenario']}: {per_message} calls/message > {args.max_calls_per_message}")
+    for failure in failures:
+        print(f"❌ {failure}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,145 @@
+"""
+Difference-based channel sync for Telegram Vault Userbot
+Channels with a known pts are synced with updates.GetChannelDifference, which returns only what
+changed since then (new posts, edits, deletions); history paging is the fallback for the first
+sync and whenever the server says the difference is too long
+"""
+import logging
+from pyrogram import raw, utils
+from pyrogram.errors import PersistentTimestampEmpty, PersistentTimestampInvalid, PersistentTimestampOutdated
+from history import iter_new_messages
+from rate_limit import flood_wait_seconds, limited_call
+
+logger = logging.getLogger(__name__)
+
+# Telegram returns at most 100 messages per updates.GetChannelDifference call
+DIFFERENCE_LIMIT = 100
+
+# The stored pts can't be used any more; page history and take a fresh pts instead
+STALE_PTS_ERRORS = (PersistentTimestampEmpty, PersistentTimestampInvalid, PersistentTimestampOutdated)
+
+
+async def fetch_channel_pts(client, chat_id, limiter=None):
+    """Current pts of a channel from its dialog (one messages.GetPeerDialogs call), or None"""
+    peer = await client.resolve_peer(chat_id)
+    request = raw.functions.messages.GetPeerDialogs(peers=[raw.types.InputDialogPeer(peer=peer)])
+    response = await limited_call(limiter, "get_peer_dialogs", lambda: client.invoke(request), chat_id)
+    for dialog in response.dialogs:
+        if getattr(dialog, "pts", None):
+            return dialog.pts
+    return None
+
+
+class ChannelSync:
+    """
+    One sync of a channel: every message with id > after_id, oldest first (`async for`)
+    With a pts the messages come from updates.GetChannelDifference; otherwise (or when the
+    difference is too long) from history paging, with a pts taken first so the next sync can
+    use the difference. Afterwards `pts` is the value to store once everything yielded is
+    delivered (None: nothing to store), and `edited` / `deleted` count the other changes seen.
+    """
+
+    def __init__(self, client, chat_id, after_id, pts=None, max_messages=None, limiter=None, bootstrap=True):
+        self.client = client
+        self.chat_id = chat_id
+        self.cursor = after_id
+        self.pts = pts
+        self.max_messages = max_messages
+        self.limiter = limiter
+        self.bootstrap = bootstrap
+        self.too_long = False
+        self.used_difference = pts is not None
+        self.bootstrap_failed = False
+        self.edited = 0
+        self.deleted = 0
+        self.count = 0
+
+    def __aiter__(self):
+        return self._sync()
+
+    def _room(self):
+        return self.max_messages is None or self.count < self.max_messages
+
+    async def _sync(self):
+        if self.pts is not None:
+            async for message in self._difference():
+                yield message
+            if not self.too_long:
+                return
+        if self.pts is None and self.bootstrap:
+            # Taken before paging: anything posted while we page is in the next difference
+            try:
+                self.pts = await fetch_channel_pts(self.client, self.chat_id, self.limiter)
+            except Exception as e:
+                if flood_wait_seconds(e) is not None:
+                    raise
+                logger.debug("No pts for %s, staying on history paging: %s", self.chat_id, e)
+            self.bootstrap_failed = self.pts is None
+        remaining = None if self.max_messages is None else self.max_messages - self.count
+        paged = 0
+        async for message in iter_new_messages(
+            self.client, self.chat_id, self.cursor, max_messages=remaining, limiter=self.limiter
+        ):
+            self.cursor = message.id
+            self.count += 1
+            paged += 1
+            yield message
+        if remaining is not None and paged >= remaining:
+            # Stopped short of the head: the pts is ahead of what we read, so don't store it
+            self.pts = None
+
+    async def _difference(self):
+        peer = await self.client.resolve_peer(self.chat_id)
+        channel = raw.types.InputChannel(channel_id=peer.channel_id, access_hash=peer.access_hash)
+        while self._room():
+            request = raw.functions.updates.GetChannelDifference(
+                channel=channel,
+                filter=raw.types.ChannelMessagesFilterEmpty(),
+                pts=self.pts,
+                limit=DIFFERENCE_LIMIT
+            )
+            try:
+                response = await limited_call(
+                    self.limiter, "get_channel_difference", lambda: self.client.invoke(request), self.chat_id
+                )
+            except STALE_PTS_ERRORS as e:
+                logger.info("🔁 pts of %s is no longer valid (%s), paging history", self.chat_id, e)
+                self.too_long, self.pts = True, None
+                return
+
+            if isinstance(response, raw.types.updates.ChannelDifferenceEmpty):
+                self.pts = response.pts
+                return
+            if isinstance(response, raw.types.updates.ChannelDifferenceTooLong):
+                self.too_long = True
+                self.pts = getattr(response.dialog, "pts", None)
+                return
+
+            messages = list(response.new_messages)
+            for update in response.other_updates:
+                if isinstance(update, raw.types.UpdateEditChannelMessage):
+                    self.edited += 1
+                    # An edited post we have not delivered yet goes out in its current form
+                    if update.message.id > self.cursor:
+                        messages.append(update.message)
+                elif isinstance(update, raw.types.UpdateDeleteChannelMessages):
+                    self.deleted += len(update.messages)
+                elif isinstance(update, raw.types.UpdateNewChannelMessage):
+                    messages.append(update.message)
+            if messages:
+                parsed = await utils.parse_messages(
+                    self.client,
+                    raw.types.messages.Messages(messages=messages, chats=response.chats, users=response.users),
+                    replies=0
+                )
+                latest = {}
+                for message in parsed:
+                    if message.id > self.cursor and not message.empty:
+                        latest[message.id] = message
+                for message_id in sorted(latest):
+                    self.cursor = message_id
+                    self.count += 1
+                    yield latest[message_id]
+            self.pts = response.pts
+            if response.final:
+                return
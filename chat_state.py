@@ -0,0 +1,108 @@
+"""
+Compact per-chat tracking state for Telegram Vault Userbot
+One row per chat in parallel typed arrays (8 bytes per field) with a chat_id -> row map, instead of
+a dict entry plus boxed ints and an object per chat for every piece of state
+"""
+from array import array
+from collections.abc import MutableMapping
+
+# Stored in a column for "no value"; message IDs, pts, times and intervals are never negative
+MISSING = -1
+
+# Column name -> array typecode
+COLUMNS = {
+    "last_id": "q",       # poll checkpoint: last processed message ID
+    "pts": "q",           # channel pts delivered up to
+    "mark": "q",          # realtime high-water mark
+    "next_due": "d",      # scheduler: monotonic time of the next poll
+    "interval": "d",      # scheduler: current poll interval (MISSING = not scheduled)
+    "rate": "d",          # scheduler: EWMA of messages per second
+    "last_polled": "d",   # scheduler: monotonic time of the last poll
+    "errors": "q",        # consecutive failed polls
+}
+
+
+class ChatTable:
+    """Rows of per-chat state addressed by chat ID; rows are appended and never move"""
+
+    def __init__(self, columns=COLUMNS):
+        self.index = {}
+        self.chat_ids = array("q")
+        self.columns = {name: array(code) for name, code in columns.items()}
+
+    def __len__(self):
+        return len(self.chat_ids)
+
+    def row(self, chat_id):
+        """Row of chat_id, appending one with every field MISSING if it is new"""
+        row = self.index.get(chat_id)
+        if row is None:
+            row = self.index[chat_id] = len(self.chat_ids)
+            self.chat_ids.append(chat_id)
+            for values in self.columns.values():
+                values.append(MISSING)
+        return row
+
+    def get(self, name, chat_id, default=None):
+        row = self.index.get(chat_id)
+        if row is None:
+            return default
+        value = self.columns[name][row]
+        return default if value == MISSING else value
+
+    def set(self, name, chat_id, value):
+        self.columns[name][self.row(chat_id)] = value
+
+    def column(self, name):
+        return ChatColumn(self, name)
+
+    def nbytes(self):
+        """Bytes held by the arrays (the index dict comes on top)"""
+        return sum(values.itemsize * len(values) for values in self.columns.values()) + \
+            self.chat_ids.itemsize * len(self.chat_ids)
+
+
+class ChatColumn(MutableMapping):
+    """dict-like view of one column: chat_id -> value, MISSING values are absent"""
+    __slots__ = ("table", "values")
+
+    def __init__(self, table, name):
+        self.table = table
+        self.values = table.columns[name]
+
+    def __getitem__(self, chat_id):
+        row = self.table.index.get(chat_id)
+        if row is None or self.values[row] == MISSING:
+            raise KeyError(chat_id)
+        return self.values[row]
+
+    def get(self, chat_id, default=None):
+        row = self.table.index.get(chat_id)
+        if row is None:
+            return default
+        value = self.values[row]
+        return default if value == MISSING else value
+
+    def __contains__(self, chat_id):
+        row = self.table.index.get(chat_id)
+        return row is not None and self.values[row] != MISSING
+
+    def __setitem__(self, chat_id, value):
+        self.values[self.table.row(chat_id)] = value
+
+    def __delitem__(self, chat_id):
+        row = self.table.index.get(chat_id)
+        if row is None or self.values[row] == MISSING:
+            raise KeyError(chat_id)
+        self.values[row] = MISSING
+
+    def __iter__(self):
+        chat_ids, values = self.table.chat_ids, self.values
+        return (chat_ids[row] for row in range(len(values)) if values[row] != MISSING)
+
+    def __len__(self):
+        return len(self.values) - self.values.count(MISSING)
+
+    def clear(self):
+        for row in range(len(self.values)):
+            self.values[row] = MISSING
@@ -0,0 +1,116 @@
+"""
+Checkpoint store for Telegram Vault Userbot
+Per-chat last processed message IDs (and channel pts) in SQLite (WAL mode), written in batches
+"""
+import asyncio
+import logging
+import sqlite3
+import time
+
+logger = logging.getLogger(__name__)
+
+
+class CheckpointStore:
+    """
+    Crash-safe map of chat_id -> last processed message id
+    update() only records the new value in memory; flush() writes all pending values in one
+    transaction. Checkpoints only ever move forward, both in memory and on disk.
+    `table` lets several stores (e.g. poll checkpoints and realtime high-water marks) share one file.
+    """
+
+    def __init__(self, path="checkpoints.db", table="checkpoints"):
+        self.path = path
+        self.table = table
+        self._db = None
+        self._pending = {}
+        self._pending_pts = {}
+        self.flushes = 0
+
+    def open(self):
+        if self._db is not None:
+            return
+        self._db = sqlite3.connect(self.path, isolation_level=None, check_same_thread=False)
+        self._db.execute("PRAGMA journal_mode=WAL")
+        # NORMAL is durable across application crashes in WAL mode; only an OS crash can lose the last commit
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.execute(
+            f"CREATE TABLE IF NOT EXISTS {self.table} ("
+            " chat_id INTEGER PRIMARY KEY,"
+            " last_id INTEGER NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+        # Channel update sequence (pts) the next updates.GetChannelDifference starts from
+        self._db.execute(
+            "CREATE TABLE IF NOT EXISTS channel_pts ("
+            " chat_id INTEGER PRIMARY KEY,"
+            " pts INTEGER NOT NULL,"
+            " updated_at REAL NOT NULL)"
+        )
+
+    def load(self):
+        """Return every stored checkpoint as a dict in a single read"""
+        self.open()
+        return dict(self._db.execute(f"SELECT chat_id, last_id FROM {self.table}"))
+
+    def load_pts(self):
+        """Return every stored channel pts as a dict"""
+        self.open()
+        return dict(self._db.execute("SELECT chat_id, pts FROM channel_pts"))
+
+    def update(self, chat_id, last_id):
+        if last_id > self._pending.get(chat_id, 0):
+            self._pending[chat_id] = last_id
+
+    def update_pts(self, chat_id, pts):
+        if pts > self._pending_pts.get(chat_id, 0):
+            self._pending_pts[chat_id] = pts
+
+    @property
+    def pending(self):
+        return len(self._pending) + len(self._pending_pts)
+
+    def flush(self):
+        """Write all pending checkpoints and pts in one transaction"""
+        if not self._pending and not self._pending_pts:
+            return 0
+        self.open()
+        pending, self._pending = self._pending, {}
+        pending_pts, self._pending_pts = self._pending_pts, {}
+        now = time.time()
+        try:
+            with self._db:
+                self._db.execute("BEGIN")
+                self._db.executemany(
+                    f"INSERT INTO {self.table} (chat_id, last_id, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(chat_id) DO UPDATE SET "
+                    "last_id = MAX(last_id, excluded.last_id), updated_at = excluded.updated_at",
+                    [(chat_id, last_id, now) for chat_id, last_id in pending.items()]
+                )
+                self._db.executemany(
+                    "INSERT INTO channel_pts (chat_id, pts, updated_at) VALUES (?, ?, ?) "
+                    "ON CONFLICT(chat_id) DO UPDATE SET "
+                    "pts = MAX(pts, excluded.pts), updated_at = excluded.updated_at",
+                    [(chat_id, pts, now) for chat_id, pts in pending_pts.items()]
+                )
+        except sqlite3.Error as e:
+            # Put the batch back so the next flush retries it
+            for chat_id, last_id in pending.items():
+                self.update(chat_id, last_id)
+            for chat_id, pts in pending_pts.items():
+                self.update_pts(chat_id, pts)
+            logger.error(f"❌ Failed to write checkpoints: {e}")
+            return 0
+        self.flushes += 1
+        return len(pending) + len(pending_pts)
+
+    async def autoflush(self, interval=5):
+        """Background task that flushes pending checkpoints every `interval` seconds"""
+        while True:
+            await asyncio.sleep(interval)
+            self.flush()
+
+    def close(self):
+        self.flush()
+        if self._db is not None:
+            self._db.close()
+            self._db = None
@@ -15,7 +15,105 @@ class Config:
     # Vault (can be overridden by pinned message)
     VAULT_CHAT_ID = os.getenv('VAULT_CHAT_ID', 'your_vault_chat_id_here')
     
+    # Peer metadata cache (titles/types of monitored chats), persisted across restarts
+    PEER_CACHE_PATH = os.getenv('PEER_CACHE_PATH', 'peer_cache.json')
+    PEER_CACHE_TTL = int(os.getenv('PEER_CACHE_TTL', str(6 * 3600)))
+    PEER_CACHE_SIZE = int(os.getenv('PEER_CACHE_SIZE', '4096'))
+    # Peers resolved at once during startup warm-up (still subject to the API rate limit)
+    WARMUP_CONCURRENCY = int(os.getenv('WARMUP_CONCURRENCY', '8'))
+    
+    # Extra logged-in sessions that share channel polling and forwarding (comma separated session names;
+    # each restored from SESSION_STRING_<NAME> or SESSION_PART<n>_<NAME>), and how long an account may be
+    # flood-limited before its channels move to the next account
+    EXTRA_SESSIONS = [name.strip() for name in os.getenv('EXTRA_SESSIONS', '').split(',') if name.strip()]
+    SHARD_REBALANCE_AFTER = float(os.getenv('SHARD_REBALANCE_AFTER', '10'))
+    
+    # Channel polling: channels polled at once, and the global API budget (calls/second, burst size)
+    POLL_CONCURRENCY = int(os.getenv('POLL_CONCURRENCY', '8'))
+    API_RATE = float(os.getenv('API_RATE', '5'))
+    API_BURST = int(os.getenv('API_BURST', '10'))
+    
+    # Adaptive polling bounds in seconds; FAST channels from the pinned config use the fast lane
+    POLL_MIN_INTERVAL = int(os.getenv('POLL_MIN_INTERVAL', '30'))
+    POLL_MAX_INTERVAL = int(os.getenv('POLL_MAX_INTERVAL', '1800'))
+    POLL_FAST_INTERVAL = int(os.getenv('POLL_FAST_INTERVAL', '15'))
+    
+    # Most messages forwarded from one channel per poll; the rest are picked up on the next poll
+    POLL_MAX_PER_CYCLE = int(os.getenv('POLL_MAX_PER_CYCLE', '500'))
+    
+    # Seconds to wait for more messages (e.g. the rest of an album) before forwarding a batch
+    FORWARD_BATCH_DELAY = float(os.getenv('FORWARD_BATCH_DELAY', '1.0'))
+    
+    # Background delivery: worker count, queued batch limit, attempts before dead-lettering
+    # (FloodWaits are counted separately: a batch is dead-lettered after DELIVERY_MAX_FLOOD_WAITS of them)
+    DELIVERY_WORKERS = int(os.getenv('DELIVERY_WORKERS', '4'))
+    DELIVERY_QUEUE_SIZE = int(os.getenv('DELIVERY_QUEUE_SIZE', '1000'))
+    DELIVERY_MAX_ATTEMPTS = int(os.getenv('DELIVERY_MAX_ATTEMPTS', '5'))
+    DELIVERY_MAX_FLOOD_WAITS = int(os.getenv('DELIVERY_MAX_FLOOD_WAITS', '10'))
+    
+    # Copying media from forward-restricted chats: largest file copied, bytes held by all transfers at once,
+    # size above which a buffer spills to a temp file, concurrent downloads, and the file_unique_id cache
+    MEDIA_MAX_SIZE = int(os.getenv('MEDIA_MAX_SIZE', str(50 * 2 ** 20)))
+    MEDIA_BUDGET = int(os.getenv('MEDIA_BUDGET', str(64 * 2 ** 20)))
+    MEDIA_SPOOL_SIZE = int(os.getenv('MEDIA_SPOOL_SIZE', str(8 * 2 ** 20)))
+    MEDIA_TRANSFERS = int(os.getenv('MEDIA_TRANSFERS', '2'))
+    MEDIA_CACHE_PATH = os.getenv('MEDIA_CACHE_PATH', 'media_cache.json')
+    
+    # Duplicate suppression: exact LRU size, Bloom filter capacity per generation,
+    # and whether identical long texts from different chats also count as duplicates
+    DEDUP_PATH = os.getenv('DEDUP_PATH', 'dedup.state')
+    DEDUP_LRU_SIZE = int(os.getenv('DEDUP_LRU_SIZE', '20000'))
+    DEDUP_CAPACITY = int(os.getenv('DEDUP_CAPACITY', '200000'))
+    DEDUP_CONTENT_HASH = os.getenv('DEDUP_CONTENT_HASH', 'false').lower() == 'true'
+    
+    # Per-channel checkpoints (last processed message IDs), SQLite in WAL mode
+    CHECKPOINT_DB = os.getenv('CHECKPOINT_DB', 'checkpoints.db')
+    CHECKPOINT_FLUSH_INTERVAL = float(os.getenv('CHECKPOINT_FLUSH_INTERVAL', '5'))
+    
+    # Gap recovery for realtime-only chats (supergroups, groups, monitored users) on startup and
+    # reconnect: chats fetched at once, messages per chunk (the mark moves once a chunk is delivered;
+    # recovery always pages to the head), and seconds to wait after a disconnect
+    RECOVERY_CONCURRENCY = int(os.getenv('RECOVERY_CONCURRENCY', '4'))
+    RECOVERY_MAX_PER_CHAT = int(os.getenv('RECOVERY_MAX_PER_CHAT', '1000'))
+    RECOVERY_RECONNECT_DELAY = float(os.getenv('RECOVERY_RECONNECT_DELAY', '5'))
+    
+    # Historical backfill (/backfill and `python run.py backfill`): chats copied at once
+    BACKFILL_CONCURRENCY = int(os.getenv('BACKFILL_CONCURRENCY', '2'))
+    
+    # Digest mode (pinned DIGEST section): default seconds between a target's digests, and
+    # entries buffered per target before its digest is posted early
+    DIGEST_INTERVAL = float(os.getenv('DIGEST_INTERVAL', '3600'))
+    DIGEST_MAX_ENTRIES = int(os.getenv('DIGEST_MAX_ENTRIES', '200'))
+    
+    # Optional local full-text archive (SQLite FTS5) of everything delivered, used by /search; empty disables it
+    ARCHIVE_DB = os.getenv('ARCHIVE_DB', '')
+    
+    # Event-loop watchdog: report the loop blocked for longer than this many seconds, with the blocking
+    # stack (0 disables it), and handlers taking longer than WATCHDOG_SLOW_HANDLER seconds
+    WATCHDOG_THRESHOLD = float(os.getenv('WATCHDOG_THRESHOLD', '0'))
+    WATCHDOG_SLOW_HANDLER = float(os.getenv('WATCHDOG_SLOW_HANDLER', '5'))
+    
+    # /profile: where collapsed-stack files are written and the longest capture allowed
+    PROFILE_DIR = os.getenv('PROFILE_DIR', 'profiles')
+    PROFILE_MAX_SECONDS = int(os.getenv('PROFILE_MAX_SECONDS', '300'))
+    
+    # Local HTTP endpoint serving Prometheus metrics at /metrics (and OK for health checks); 0 disables it
+    # Bound to localhost unless METRICS_HOST says otherwise (e.g. 0.0.0.0 to let a scraper on another host in)
+    METRICS_PORT = int(os.getenv('METRICS_PORT', '0'))
+    METRICS_HOST = os.getenv('METRICS_HOST', '127.0.0.1')
+    
+    # Logging: level, JSON lines instead of text, and per-event sampling rates
+    # e.g. LOG_SAMPLE="match=0.1,forward=0.1,poll.checked=0.05"; per-message debug lines need
+    # LOG_HOT_DEBUG=true (read by log_config at import) together with LOG_LEVEL=DEBUG
+    LOG_LEVEL = os.getenv('LOG_LEVEL', 'INFO').upper()
+    LOG_JSON = os.getenv('LOG_JSON', 'false').lower() == 'true'
+    LOG_SAMPLE = os.getenv('LOG_SAMPLE', '')
+    
+    # Seconds to collect admin commands before rewriting the pinned config in one edit
+    CONFIG_WRITE_DELAY = float(os.getenv('CONFIG_WRITE_DELAY', '2'))
+    
     # Dynamic lists (loaded from pinned message)
     TARGET_USER_IDS = []
     TARGET_CHANNEL_IDS = []
     TARGET_GROUP_IDS = []
+    FAST_CHANNEL_IDS = []
@@ -0,0 +1,199 @@
+"""
+Versioned target config for Telegram Vault Userbot
+The pinned message in Saved Messages is parsed into immutable snapshots; admin commands are
+applied as diffs in memory and written back to the pinned message in batches
+"""
+import asyncio
+import logging
+import re
+
+logger = logging.getLogger(__name__)
+
+# Pinned config sections, in the order they are written back
+SECTIONS = ("USERS", "CHANNELS", "GROUPS", "FAST", "RULES", "ROUTES", "DIGEST")
+SECTION_EMOJI = {"USERS": "👤", "CHANNELS": "📢", "GROUPS": "👥", "FAST": "⚡", "RULES": "🔎", "ROUTES": "🧭", "DIGEST": "🗞️"}
+
+# Optional sections are left out of the rendered config while empty
+OPTIONAL_SECTIONS = ("FAST", "RULES", "ROUTES", "DIGEST")
+
+# Sections whose lines are kept verbatim (parsed by content_filter / fanout / digest)
+RULE_SECTIONS = ("RULES", "ROUTES", "DIGEST")
+
+CONFIG_TITLE = "🎯 USERBOT TARGETS"
+
+# "USERS: 1, 2" or a "👤 USERS:" header followed by one ID per line; any emoji before the name is ignored
+SECTION_RE = re.compile(r"^\W*(USERS|CHANNELS|GROUPS|FAST|RULES|ROUTES|DIGEST)\s*:\s*(.*)$", re.I)
+TARGET_RE = re.compile(r"^(-?\d+|@\w+)$")
+
+# Admin command target type -> section
+COMMAND_SECTIONS = {"user": "USERS", "channel": "CHANNELS", "group": "GROUPS"}
+
+
+def _target(token):
+    return int(token) if token[0] != "@" else token
+
+
+def parse_targets(text):
+    """
+    Parse pinned config text into {section: tuple of targets}; unknown lines are ignored
+    RULES, ROUTES and DIGEST lines are kept verbatim (content_filter, fanout and digest parse them)
+    """
+    sections = {name: [] for name in SECTIONS}
+    current = None
+    for raw_line in text.splitlines():
+        line = raw_line.strip()
+        if not line:
+            continue
+        match = SECTION_RE.match(line)
+        if match:
+            current = match.group(1).upper()
+            line = match.group(2)
+        elif current is None:
+            continue
+        if current in RULE_SECTIONS:
+            if line:
+                sections[current].append(line)
+            continue
+        for token in re.split(r"[\s,]+", line):
+            if not token:
+                continue
+            if TARGET_RE.match(token):
+                target = _target(token)
+                if target not in sections[current]:
+                    sections[current].append(target)
+            else:
+                # Free text (e.g. a new title line) ends the section
+                current = None
+                break
+    return {name: tuple(values) for name, values in sections.items()}
+
+
+class ConfigSnapshot:
+    """Immutable view of the monitored targets at one config version"""
+    __slots__ = ("version", "users", "channels", "groups", "fast", "rules", "routes", "digest")
+
+    def __init__(self, version=0, users=(), channels=(), groups=(), fast=(), rules=(), routes=(), digest=()):
+        self.version = version
+        self.users = tuple(users)
+        self.channels = tuple(channels)
+        self.groups = tuple(groups)
+        self.fast = tuple(fast)
+        self.rules = tuple(rules)
+        self.routes = tuple(routes)
+        self.digest = tuple(digest)
+
+    @classmethod
+    def from_text(cls, text, version=0):
+        sections = parse_targets(text)
+        return cls(version, *(sections[name] for name in SECTIONS))
+
+    def section(self, name):
+        return getattr(self, name.lower())
+
+    def targets(self):
+        return tuple(self.section(name) for name in SECTIONS)
+
+    def same_targets(self, other):
+        return other is not None and self.targets() == other.targets()
+
+    def with_change(self, action, section, target):
+        """Return a new snapshot with target added to / removed from section, or self if nothing changes"""
+        values = self.section(section)
+        if action == "add" and target not in values:
+            values = values + (target,)
+        elif action == "remove" and target in values:
+            values = tuple(v for v in values if v != target)
+        else:
+            return self
+        sections = {name: self.section(name) for name in SECTIONS}
+        sections[section] = values
+        return ConfigSnapshot(self.version + 1, *(sections[name] for name in SECTIONS))
+
+    def render(self):
+        """Pinned message text in the multi-line layout documented in README.md"""
+        blocks = [CONFIG_TITLE]
+        for name in SECTIONS:
+            values = self.section(name)
+            if values or name not in OPTIONAL_SECTIONS:
+                blocks.append("\n".join([f"{SECTION_EMOJI[name]} {name}:"] + [str(v) for v in values]))
+        return "\n\n".join(blocks)
+
+
+class ConfigStore:
+    """
+    Holds the current ConfigSnapshot and notifies listeners whenever it is replaced
+    apply() changes the snapshot immediately; `write(text)` is called once per `write_delay`
+    window, so a burst of admin commands becomes a single pinned-message edit.
+    Reloads of the pinned text that match the current targets (including our own edits) are no-ops.
+    """
+
+    def __init__(self, write=None, write_delay=2.0):
+        self.write = write
+        self.write_delay = write_delay
+        self.snapshot = ConfigSnapshot()
+        self.pinned_id = None
+        self._listeners = []
+        self._pending = []
+        self._timer = None
+        self._lock = asyncio.Lock()
+
+    @property
+    def version(self):
+        return self.snapshot.version
+
+    def subscribe(self, callback):
+        """Call `callback(old, new)` after every snapshot change"""
+        self._listeners.append(callback)
+
+    def _install(self, snapshot):
+        old, self.snapshot = self.snapshot, snapshot
+        for callback in self._listeners:
+            try:
+                callback(old, snapshot)
+            except Exception as e:
+                logger.error(f"Error in config listener: {e}")
+
+    def load_text(self, text, pinned_id=None):
+        """
+        Replace the snapshot with the parsed pinned text and return it, or None if the targets are unchanged
+        Admin changes not yet written back are re-applied on top, so a manual edit can't drop them
+        """
+        if pinned_id is not None:
+            self.pinned_id = pinned_id
+        snapshot = ConfigSnapshot.from_text(text or "", self.version + 1)
+        for action, section, target in self._pending:
+            snapshot = snapshot.with_change(action, section, target)
+        if snapshot.same_targets(self.snapshot):
+            return None
+        self._install(snapshot)
+        return snapshot
+
+    def apply(self, action, kind, target):
+        """Apply one admin command ("add"/"remove", "user"/"channel"/"group") and schedule the write-back"""
+        section = COMMAND_SECTIONS[kind]
+        snapshot = self.snapshot.with_change(action, section, target)
+        if snapshot is self.snapshot:
+            return None
+        self._pending.append((action, section, target))
+        self._install(snapshot)
+        if self.write is not None and self._timer is None:
+            loop = asyncio.get_running_loop()
+            self._timer = loop.call_later(self.write_delay, lambda: asyncio.ensure_future(self.flush()))
+        return snapshot
+
+    async def flush(self):
+        """Write the current snapshot to the pinned message if admin changes are pending"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        async with self._lock:
+            if not self._pending or self.write is None:
+                return
+            pending, self._pending = self._pending, []
+            try:
+                await self.write(self.snapshot.render())
+                logger.info(f"📌 Wrote config v{self.version} ({len(pending)} change(s)) to the pinned message")
+            except Exception as e:
+                # Keep the changes pending so the next command or flush retries the write
+                self._pending = pending + self._pending
+                logger.error(f"❌ Failed to update pinned config: {e}")
@@ -0,0 +1,197 @@
+"""
+Content filter for Telegram Vault Userbot
+Per-target include/exclude rules from the pinned config, compiled into one regex per target
+so a message's text is scanned once however many rules there are
+
+Rule lines (RULES section of the pinned config), one target per line:
+    *              +hiring +"we are looking" -/unpaid|intern(ship)?/
+    -1001234567890 +python +remote -senior
+    @somechannel   -giveaway
+`+` includes, `-` excludes; bare words match whole words case-insensitively, "quoted phrases"
+match as written and /slashes/ are regular expressions. `*` rules apply to every target.
+A message passes if no exclude matches and, when the target has includes, at least one matches.
+"""
+import logging
+import re
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+RULE_TOKEN_RE = re.compile(r'([+-])(?:"([^"]+)"|/((?:\\.|[^/\\])+)/|(\S+))')
+GLOBAL_TARGET = "*"
+
+# Album parts without a caption follow the decision made for the captioned part
+ALBUM_MEMORY = 1024
+
+
+def _trie_pattern(words):
+    """
+    Regex alternation for `words` built from a prefix trie, e.g. job|jobs|java -> (?:j(?:obs?|ava))
+    The regex engine then walks shared prefixes once instead of trying every word at every position
+    """
+    trie = {}
+    for word in words:
+        node = trie
+        for char in word:
+            node = node.setdefault(char, {})
+        node[""] = True
+
+    def build(node):
+        end = "" in node
+        branches = [re.escape(char) + build(child) for char, child in sorted(node.items()) if char]
+        if not branches:
+            return ""
+        if len(branches) == 1 and not end:
+            return branches[0]
+        group = "(?:" + "|".join(branches) + ")"
+        return group + "?" if end else group
+
+    return build(trie)
+
+
+def _alternation(keywords, phrases, regexes):
+    """One pattern matching any keyword (whole word), phrase or regex"""
+    parts = []
+    if keywords:
+        parts.append(r"(?<!\w)" + _trie_pattern(sorted(keywords)) + r"(?!\w)")
+    parts.extend(re.escape(phrase) for phrase in sorted(phrases))
+    parts.extend(f"(?:{regex})" for regex in regexes)
+    return "|".join(parts)
+
+
+class RuleSet:
+    """Include/exclude rules for one target, compiled into a single case-insensitive regex"""
+    __slots__ = ("rules", "has_includes", "has_excludes", "_pattern")
+
+    def __init__(self, rules):
+        self.rules = rules
+        includes = [r for r in rules if r[0] == "+"]
+        excludes = [r for r in rules if r[0] == "-"]
+        self.has_includes = bool(includes)
+        self.has_excludes = bool(excludes)
+        include = _alternation(*self._split(includes))
+        exclude = _alternation(*self._split(excludes))
+        if include and exclude:
+            # Zero-width so every position is tried: at each one an exclude wins over an include
+            pattern = f"(?=(?P<x>{exclude})|(?P<i>{include}))"
+        elif exclude:
+            pattern = f"(?P<x>{exclude})"
+        else:
+            pattern = f"(?P<i>{include})"
+        self._pattern = re.compile(pattern, re.IGNORECASE) if include or exclude else None
+
+    @staticmethod
+    def _split(rules):
+        keywords, phrases, regexes = set(), set(), []
+        for _, kind, value in rules:
+            if kind == "word":
+                keywords.add(value.lower())
+            elif kind == "phrase":
+                phrases.add(value.lower())
+            else:
+                regexes.append(value)
+        return keywords, phrases, regexes
+
+    def allows(self, text):
+        if self._pattern is None:
+            return True
+        if not text:
+            return not self.has_includes
+        if not self.has_excludes:
+            return self._pattern.search(text) is not None
+        if not self.has_includes:
+            return self._pattern.search(text) is None
+        included = False
+        for match in self._pattern.finditer(text):
+            if match.group("x") is not None:
+                return False
+            included = True
+        return included
+
+
+def parse_rule_line(line):
+    """'-1001 +python -/senior/' -> (target, [(sign, kind, value), ...]); target is an int, @name or '*'"""
+    head, _, rest = line.strip().partition(" ")
+    head = head.rstrip(":")
+    if head == GLOBAL_TARGET or head.startswith("@"):
+        target = head.lower() if head.startswith("@") else head
+    else:
+        try:
+            target = int(head)
+        except ValueError:
+            return None, []
+    rules = []
+    for sign, phrase, regex, word in RULE_TOKEN_RE.findall(rest):
+        if phrase:
+            rules.append((sign, "phrase", phrase))
+        elif regex:
+            try:
+                re.compile(regex)
+            except re.error as e:
+                logger.warning(f"⚠️ Skipping invalid filter regex /{regex}/: {e}")
+                continue
+            rules.append((sign, "regex", regex))
+        else:
+            rules.append((sign, "word", word))
+    return target, rules
+
+
+def matched_target(message, reason):
+    """(id, username) of the target that made `message` match, for a RoutingTable.match reason"""
+    if reason == "user":
+        return message.from_user.id, message.from_user.username
+    if reason == "sender_chat":
+        return message.sender_chat.id, message.sender_chat.username
+    chat = message.chat
+    return (chat.id, chat.username) if chat is not None else (None, None)
+
+
+class ContentFilter:
+    """
+    Immutable set of compiled RuleSets keyed by target, built from the pinned RULES lines
+    Global (`*`) rules are folded into every target's RuleSet, so checking a message is one
+    dict lookup and one regex scan
+    """
+
+    def __init__(self, lines=()):
+        by_target = OrderedDict()
+        for line in lines:
+            target, rules = parse_rule_line(line)
+            if target is None:
+                logger.warning(f"⚠️ Ignoring filter rule line without a target: {line}")
+                continue
+            by_target.setdefault(target, []).extend(rules)
+        global_rules = by_target.pop(GLOBAL_TARGET, [])
+        self.default = RuleSet(global_rules) if global_rules else None
+        self.rule_sets = {target: RuleSet(global_rules + rules) for target, rules in by_target.items()}
+        self.rule_count = len(global_rules) + sum(len(rules) for rules in by_target.values())
+        self._albums = OrderedDict()
+
+    def __bool__(self):
+        return self.default is not None or bool(self.rule_sets)
+
+    def rule_set_for(self, message, reason):
+        """The RuleSet for the target that made `message` match (see RoutingTable.match)"""
+        key, username = matched_target(message, reason)
+        rule_set = self.rule_sets.get(key)
+        if rule_set is None and username:
+            rule_set = self.rule_sets.get("@" + username.lower())
+        return rule_set or self.default
+
+    def allows(self, message, reason="chat"):
+        """True if the message should be forwarded; one scan of its text or caption"""
+        rule_set = self.rule_set_for(message, reason)
+        if rule_set is None:
+            return True
+        text = message.text or message.caption
+        group_id = message.media_group_id
+        if not text and group_id:
+            decision = self._albums.get((message.chat.id, group_id))
+            if decision is not None:
+                return decision
+        decision = rule_set.allows(text)
+        if group_id:
+            self._albums[(message.chat.id, group_id)] = decision
+            if len(self._albums) > ALBUM_MEMORY:
+                self._albums.popitem(last=False)
+        return decision
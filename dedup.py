@@ -0,0 +1,182 @@
+"""
+Deduplication for Telegram Vault Userbot
+Exact LRU of recent (chat_id, message_id) keys backed by a rotating Bloom filter, persisted to disk
+"""
+import asyncio
+import hashlib
+import json
+import logging
+import math
+import os
+from collections import OrderedDict
+
+logger = logging.getLogger(__name__)
+
+
+def _hashes(key, k, m):
+    """k bit positions from one blake2b digest (enhanced double hashing, Dillinger & Manolios)"""
+    digest = hashlib.blake2b(key.encode("utf-8"), digest_size=16).digest()
+    a = int.from_bytes(digest[:8], "little") % m
+    b = int.from_bytes(digest[8:], "little") % m
+    positions = []
+    for i in range(k):
+        positions.append(a)
+        a = (a + b) % m
+        b = (b + i + 1) % m
+    return positions
+
+
+class BloomFilter:
+    """Fixed-size Bloom filter over a bytearray"""
+    __slots__ = ("m", "k", "bits", "count")
+
+    def __init__(self, m, k, bits=None, count=0):
+        self.m = m
+        self.k = k
+        self.bits = bits if bits is not None else bytearray((m + 7) // 8)
+        self.count = count
+
+    @classmethod
+    def for_capacity(cls, capacity, error_rate):
+        m = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        k = max(1, round(m / capacity * math.log(2)))
+        return cls(m, k)
+
+    def add(self, key):
+        for bit in _hashes(key, self.k, self.m):
+            self.bits[bit >> 3] |= 1 << (bit & 7)
+        self.count += 1
+
+    def __contains__(self, key):
+        bits = self.bits
+        return all(bits[bit >> 3] & (1 << (bit & 7)) for bit in _hashes(key, self.k, self.m))
+
+
+class Deduplicator:
+    """
+    seen() answers "was this already delivered, or is it on its way?" and claims the message in
+    memory; record() makes the claim durable once the vault has it and release() drops it when
+    delivery failed, so a crash or a dead letter never hides an undelivered message. Recent keys are checked exactly in an LRU; older ones fall through to two Bloom filter
+    generations that rotate every `capacity` insertions, so memory stays fixed at roughly
+    lru_size keys plus two filters sized for `capacity` at `error_rate`.
+    """
+
+    def __init__(self, path="dedup.state", lru_size=20000, capacity=200000, error_rate=1e-6, content_hash=False):
+        self.path = path
+        self.lru_size = lru_size
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.content_hash = content_hash
+        self._recent = OrderedDict()
+        self._current = BloomFilter.for_capacity(capacity, error_rate)
+        self._previous = BloomFilter(self._current.m, self._current.k)
+        self._inflight = set()
+        self._dirty = False
+        self.duplicates = 0
+
+    @staticmethod
+    def message_key(chat_id, message_id):
+        return f"{chat_id}:{message_id}"
+
+    @staticmethod
+    def content_key(message):
+        text = message.text or message.caption
+        if not text or len(text) < 32:
+            return None  # short texts ("ok", "thanks") repeat legitimately
+        return "h:" + hashlib.blake2b(text.encode("utf-8"), digest_size=12).hexdigest()
+
+    def _contains(self, key):
+        if key in self._recent:
+            self._recent.move_to_end(key)
+            return True
+        return key in self._current or key in self._previous
+
+    def _add(self, key):
+        self._recent[key] = None
+        if len(self._recent) > self.lru_size:
+            self._recent.popitem(last=False)
+        self._current.add(key)
+        if self._current.count >= self.capacity:
+            self._previous = self._current
+            self._current = BloomFilter(self._previous.m, self._previous.k)
+        self._dirty = True
+
+    def _keys(self, message):
+        keys = [self.message_key(message.chat.id, message.id)]
+        if self.content_hash:
+            content = self.content_key(message)
+            if content is not None:
+                keys.append(content)
+        return keys
+
+    def seen(self, message):
+        """True if this message (or, with content_hash, the same text) was already delivered or claimed"""
+        keys = self._keys(message)
+        if any(key in self._inflight or self._contains(key) for key in keys):
+            self.duplicates += 1
+            return True
+        self._inflight.update(keys)
+        return False
+
+    def record(self, messages):
+        """Remember delivered messages (persisted with the next save)"""
+        for message in messages:
+            for key in self._keys(message):
+                self._inflight.discard(key)
+                self._add(key)
+
+    def release(self, messages):
+        """Forget claims for messages that never reached the vault, so a later poll can deliver them"""
+        for message in messages:
+            for key in self._keys(message):
+                self._inflight.discard(key)
+
+    @property
+    def inflight(self):
+        return len(self._inflight)
+
+    def load(self):
+        try:
+            with open(self.path, "rb") as f:
+                header = json.loads(f.readline())
+                size = (header["m"] + 7) // 8
+                current = bytearray(f.read(size))
+                previous = bytearray(f.read(size))
+        except FileNotFoundError:
+            return False
+        except (OSError, ValueError, KeyError) as e:
+            logger.warning(f"⚠️ Could not load dedup state {self.path}: {e}")
+            return False
+        if header["m"] != self._current.m or header["k"] != self._current.k or len(previous) != size:
+            logger.warning("⚠️ Dedup state was built with different settings, starting fresh")
+            return False
+        self._current = BloomFilter(header["m"], header["k"], current, header["count"])
+        self._previous = BloomFilter(header["m"], header["k"], previous)
+        self._recent = OrderedDict.fromkeys(header["recent"][-self.lru_size:])
+        self._dirty = False
+        return True
+
+    def save(self):
+        if not self._dirty:
+            return
+        header = {
+            "m": self._current.m,
+            "k": self._current.k,
+            "count": self._current.count,
+            "recent": list(self._recent),
+        }
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                f.write(json.dumps(header).encode("utf-8") + b"\n")
+                f.write(self._current.bits)
+                f.write(self._previous.bits)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            logger.warning(f"⚠️ Could not save dedup state {self.path}: {e}")
+
+    async def autosave(self, interval=60):
+        while True:
+            await asyncio.sleep(interval)
+            self.save()
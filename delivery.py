@@ -0,0 +1,263 @@
+"""
+Outbound delivery queue for Telegram Vault Userbot
+Bounded queue of forward batches drained by a worker pool with retries and a dead-letter list
+"""
+import asyncio
+import logging
+import random
+import time
+from collections import deque
+from pyrogram.errors import BadRequest, Forbidden, NotAcceptable
+from rate_limit import flood_wait_seconds
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Errors that will fail the same way however often we retry
+PERMANENT_ERRORS = (BadRequest, Forbidden, NotAcceptable)
+
+
+class PartialDelivery(Exception):
+    """Raised by `send` when only the first `delivered` messages of a batch reached the vault before `error`"""
+
+    def __init__(self, delivered, error):
+        super().__init__(f"{delivered} message(s) delivered, then: {error}")
+        self.delivered = delivered
+        self.error = error
+
+
+class Undelivered(Exception):
+    """
+    Set on a batch's future when it was dead-lettered for a transient reason (attempts or
+    FloodWaits used up): message `first_id` and everything after it should be fetched again
+    """
+
+    def __init__(self, first_id, error):
+        super().__init__(str(error))
+        self.first_id = first_id
+        self.error = error
+
+
+def is_transient(error):
+    return not isinstance(error, PERMANENT_ERRORS)
+
+
+class DeliveryJob:
+    """One batch of messages from a single source chat to one destination vault"""
+    __slots__ = ("chat_id", "messages", "destination", "attempts", "flood_waits", "enqueued_at", "future", "offset")
+
+    def __init__(self, chat_id, messages, future, destination=None):
+        self.chat_id = chat_id
+        self.messages = messages
+        self.destination = destination
+        self.attempts = 0
+        self.flood_waits = 0
+        self.enqueued_at = time.monotonic()
+        self.future = future
+        # Messages before this index already reached the vault (see PartialDelivery)
+        self.offset = 0
+
+    @property
+    def remaining(self):
+        return self.messages[self.offset:] if self.offset else self.messages
+
+
+class DeadLetter:
+    """A batch that failed permanently; only IDs are kept, not the Message objects"""
+    __slots__ = ("chat_id", "message_ids", "destination", "error", "failed_at")
+
+    def __init__(self, chat_id, message_ids, error, destination=None):
+        self.chat_id = chat_id
+        self.message_ids = message_ids
+        self.destination = destination
+        self.error = error
+        self.failed_at = time.time()
+
+
+class DeliveryQueue:
+    """
+    put() only enqueues; `workers` tasks call `send(chat_id, messages, destination)` in the background
+    Transient failures are retried with exponential backoff and full jitter, FloodWaits are
+    retried once the limiter's pause is over (up to `max_flood_waits` times, since a worker and
+    the chat's lock are held meanwhile), and permanent failures go to dead_letters. Batches that
+    run out of retries are dead-lettered too, but their futures fail with Undelivered so the
+    caller can fetch them again instead of moving its checkpoint past them.
+    Jobs for the same chat and destination are delivered in the order they were queued; a
+    destination that keeps failing never holds up (or re-sends to) the others.
+    `on_delivered(chat_id, messages, destination)` is called with the messages that reached the
+    destination, `on_failed(chat_id, messages, destination, error)` with those that were dead-lettered.
+    """
+
+    def __init__(self, send, workers=4, max_size=1000, max_attempts=5, base_delay=1.0, max_delay=60.0,
+                 dead_letter_size=500, on_delivered=None, on_failed=None, max_flood_waits=10):
+        self.send = send
+        self.on_delivered = on_delivered
+        self.on_failed = on_failed
+        self.workers = workers
+        self.max_attempts = max_attempts
+        self.max_flood_waits = max_flood_waits
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.high_water = max(1, int(max_size * 0.8))
+        self.low_water = max(0, int(max_size * 0.5))
+        self.dead_letters = deque(maxlen=dead_letter_size)
+        self.delivered = 0
+        self.retries = 0
+        self._queue = asyncio.Queue(max_size)
+        self._tasks = []
+        self._chat_locks = {}
+        self._outstanding = {}
+        self._drained = asyncio.Event()
+        self._drained.set()
+
+    def __len__(self):
+        return self._queue.qsize()
+
+    @property
+    def saturated(self):
+        """True once the queue passes its high-water mark; producers should hold off"""
+        return self._queue.qsize() >= self.high_water
+
+    async def wait_for_capacity(self):
+        """Block until the queue has drained below its low-water mark"""
+        while self._queue.qsize() > self.low_water:
+            self._drained.clear()
+            await self._drained.wait()
+
+    def start(self):
+        if not self._tasks:
+            self._tasks = [asyncio.ensure_future(self._worker(i)) for i in range(self.workers)]
+
+    async def stop(self, timeout=30):
+        """Give queued jobs up to `timeout` seconds to finish, then stop the workers"""
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout)
+        except asyncio.TimeoutError:
+            logger.warning(f"⚠️ Delivery queue stopped with {self._queue.qsize()} job(s) undelivered")
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+
+    async def put(self, chat_id, messages, destination=None):
+        """Queue a batch (waits only when the queue is full) and return a future for its delivery"""
+        future = asyncio.get_running_loop().create_future()
+        self._outstanding.setdefault(chat_id, set()).add(future)
+        future.add_done_callback(lambda f: self._forget(chat_id, f))
+        await self._queue.put(DeliveryJob(chat_id, messages, future, destination))
+        metrics.queue_depth.set(self._queue.qsize())
+        return future
+
+    def _forget(self, chat_id, future):
+        outstanding = self._outstanding.get(chat_id)
+        if outstanding is not None:
+            outstanding.discard(future)
+            if not outstanding:
+                del self._outstanding[chat_id]
+
+    def when_delivered(self, chat_id, callback):
+        """
+        Call `callback(undelivered)` once every batch currently queued for chat_id (to any destination)
+        is delivered or dead-lettered; `undelivered` is the lowest message ID among them that has to
+        be fetched again (see Undelivered), or None
+        """
+        futures = list(self._outstanding.get(chat_id, ()))
+        if not futures:
+            callback(None)
+            return
+
+        def settled(_):
+            failed = [f.exception().first_id for f in futures
+                      if not f.cancelled() and isinstance(f.exception(), Undelivered)]
+            callback(min(failed) if failed else None)
+
+        asyncio.gather(*futures, return_exceptions=True).add_done_callback(settled)
+
+    def _notify(self, callback, job, messages, *args):
+        if callback is None or not messages:
+            return
+        try:
+            callback(job.chat_id, messages, job.destination, *args)
+        except Exception as e:
+            logger.error(f"Error in delivery callback: {e}")
+
+    def _backoff(self, attempt):
+        return random.uniform(0, min(self.max_delay, self.base_delay * (2 ** attempt)))
+
+    async def _deliver(self, job):
+        metrics.queue_seconds.observe(time.monotonic() - job.enqueued_at)
+        while True:
+            try:
+                with metrics.send_seconds.time():
+                    await self.send(job.chat_id, job.remaining, job.destination)
+                return None
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if isinstance(e, PartialDelivery):
+                    # Retries resume after what was delivered, so nothing is posted to the vault twice
+                    job.offset += e.delivered
+                    e = e.error
+                wait = flood_wait_seconds(e)
+                if wait is not None:
+                    job.flood_waits += 1
+                    if job.flood_waits > self.max_flood_waits:
+                        return e
+                    # The limiter has already paused this method; the retry waits behind that pause
+                    logger.warning("⏳ Delivery from %s hit FloodWait %ss, retry %s/%s",
+                                   job.chat_id, wait, job.flood_waits, self.max_flood_waits)
+                    self.retries += 1
+                    continue
+                job.attempts += 1
+                if isinstance(e, PERMANENT_ERRORS) or job.attempts >= self.max_attempts:
+                    return e
+                delay = self._backoff(job.attempts)
+                self.retries += 1
+                logger.warning("🔁 Delivery from %s failed (%s), retry %s/%s in %.1fs",
+                               job.chat_id, e, job.attempts, self.max_attempts, delay)
+                await asyncio.sleep(delay)
+
+    async def _worker(self, number):
+        while True:
+            job = await self._queue.get()
+            try:
+                # Per chat and destination: a later batch from the same chat can't overtake one that is retrying
+                async with self._chat_locks.setdefault((job.chat_id, job.destination), asyncio.Lock()):
+                    error = await self._deliver(job)
+                if error is None:
+                    self._notify(self.on_delivered, job, job.messages)
+                    self.delivered += len(job.messages)
+                    metrics.observe_delivered(job.chat_id, job.messages)
+                    if not job.future.done():
+                        job.future.set_result(len(job.messages))
+                else:
+                    failed = job.remaining
+                    self._notify(self.on_delivered, job, job.messages[:job.offset])
+                    self._notify(self.on_failed, job, failed, error)
+                    self.dead_letters.append(
+                        DeadLetter(job.chat_id, [m.id for m in failed], str(error), job.destination)
+                    )
+                    metrics.failed.inc(len(failed))
+                    logger.error(
+                        f"💀 Dead-lettered {len(failed)} message(s) from {job.chat_id} to {job.destination} "
+                        f"after {job.attempts} attempt(s) and {job.flood_waits} FloodWait(s): {error}"
+                    )
+                    if not job.future.done():
+                        if is_transient(error):
+                            error = Undelivered(min(m.id for m in failed), error)
+                        job.future.set_exception(error)
+                        job.future.exception()
+            except asyncio.CancelledError:
+                if not job.future.done():
+                    job.future.cancel()
+                raise
+            except Exception as e:
+                logger.error(f"Error in delivery worker {number}: {e}")
+                if not job.future.done():
+                    job.future.set_exception(e)
+                    job.future.exception()
+            finally:
+                self._queue.task_done()
+                metrics.queue_depth.set(self._queue.qsize())
+                if self._queue.qsize() <= self.low_water:
+                    self._drained.set()
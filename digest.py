@@ -0,0 +1,219 @@
+"""
+Digest mode for Telegram Vault Userbot
+Matched messages from targets listed in the pinned DIGEST section are not forwarded one by one;
+they are kept as short text entries and posted to the vault as one summary per target and interval
+"""
+import logging
+import time
+from archive import message_link
+from content_filter import matched_target
+from fanout import parse_chat_id
+
+logger = logging.getLogger(__name__)
+
+# Telegram's message length limit (UTF-16 code units); longer digests are split into several posts
+MESSAGE_LIMIT = 4096
+
+# Characters of each message's text kept in its digest entry
+SNIPPET_LENGTH = 120
+
+# Seconds before a digest that failed to post is tried again
+RETRY_DELAY = 60
+
+INTERVAL_UNITS = {"s": 1, "m": 60, "h": 3600, "d": 86400}
+
+
+def parse_interval(text):
+    """'90' / '90s' / '30m' / '2h' / '1d' -> seconds, or None"""
+    text = text.strip().lower()
+    unit = INTERVAL_UNITS.get(text[-1:]) if text else None
+    try:
+        seconds = float(text[:-1] if unit else text) * (unit or 1)
+    except ValueError:
+        return None
+    return seconds if seconds > 0 else None
+
+
+def parse_digest_line(line, default_interval):
+    """'-1001234 30m' -> (target, seconds); the interval is optional. None if the line is not valid"""
+    parts = line.split()
+    if not parts or len(parts) > 2:
+        return None
+    target = parse_chat_id(parts[0])
+    if isinstance(target, str):
+        if not target.startswith("@"):
+            return None
+        target = target.lower()
+    interval = parse_interval(parts[1]) if len(parts) > 1 else default_interval
+    if interval is None:
+        return None
+    return target, interval
+
+
+def _sender(message):
+    user = message.from_user
+    if user is not None:
+        return user.first_name or user.username or str(user.id)
+    if message.author_signature:
+        return message.author_signature
+    return None
+
+
+class DigestEntry:
+    """What a digest keeps of one message (or one album): no Message object is held"""
+    __slots__ = ("chat_id", "message_id", "username", "date", "sender", "text", "media", "parts", "group_id",
+                 "destinations")
+
+    def __init__(self, message, destinations=()):
+        chat = message.chat
+        self.chat_id = chat.id
+        self.message_id = message.id
+        self.username = chat.username
+        self.date = message.date.timestamp() if message.date is not None else time.time()
+        self.sender = _sender(message)
+        text = " ".join((message.text or message.caption or "").split())
+        self.text = text if len(text) <= SNIPPET_LENGTH else text[:SNIPPET_LENGTH - 1] + "…"
+        self.media = message.media.name.lower() if message.media is not None else None
+        self.parts = 1
+        self.group_id = message.media_group_id
+        # Vaults the message is routed to (see VaultRouter.destinations_for), main vault first
+        self.destinations = list(destinations)
+
+    def render(self):
+        line = f"• {time.strftime('%H:%M', time.localtime(self.date))}"
+        if self.sender:
+            line += f" {self.sender}:"
+        if self.text:
+            line += f" {self.text}"
+        if self.media:
+            line += f" [{self.media}{f' ×{self.parts}' if self.parts > 1 else ''}]"
+        link = message_link(self.chat_id, self.message_id, self.username)
+        return f"{line}\n  {link}" if link else line
+
+
+class DigestBuffer:
+    """
+    Digest entries per DIGEST target, each target posted every `interval` seconds after its first
+    buffered entry, or as soon as it holds `max_entries` entries
+    """
+
+    def __init__(self, default_interval=3600, max_entries=200):
+        self.default_interval = default_interval
+        self.max_entries = max_entries
+        self.intervals = {}
+        self._entries = {}
+        self._titles = {}
+        self._due = {}
+
+    def __len__(self):
+        return sum(len(entries) for entries in self._entries.values())
+
+    def configure(self, lines):
+        """Replace the target -> interval map from DIGEST lines, keeping what is already buffered"""
+        intervals = {}
+        for line in lines:
+            parsed = parse_digest_line(line, self.default_interval)
+            if parsed is None:
+                logger.warning(f"⚠️ Ignoring digest line (expected '<target> [interval]'): {line}")
+                continue
+            intervals[parsed[0]] = parsed[1]
+        self.intervals = intervals
+        # Targets taken out of digest mode post what they hold right away
+        for target in self._entries:
+            if target not in intervals:
+                self._due[target] = 0
+        return self
+
+    def target_for(self, message, reason="chat"):
+        """The DIGEST target `message` belongs to, or None when it is forwarded as usual"""
+        if not self.intervals:
+            return None
+        key, username = matched_target(message, reason)
+        if key in self.intervals:
+            return key
+        if username and "@" + username.lower() in self.intervals:
+            return "@" + username.lower()
+        return None
+
+    def add(self, target, message, reason="chat", destinations=()):
+        entries = self._entries.get(target)
+        if entries is None:
+            entries = self._entries[target] = []
+            self._due[target] = time.monotonic() + self.intervals.get(target, self.default_interval)
+            if reason == "user":
+                self._titles[target] = _sender(message) or str(target)
+            else:
+                self._titles[target] = message.chat.title or message.chat.first_name or str(target)
+        last = entries[-1] if entries else None
+        if (last is not None and message.media_group_id and last.group_id == message.media_group_id
+                and last.chat_id == message.chat.id):
+            # Album parts fold into one entry, posted wherever any part is routed
+            last.parts += 1
+            last.destinations.extend(d for d in destinations if d not in last.destinations)
+            if not last.text and (message.text or message.caption):
+                last.text = DigestEntry(message).text
+            return
+        entries.append(DigestEntry(message, destinations))
+        if len(entries) >= self.max_entries:
+            self._due[target] = 0
+
+    def due(self, now=None):
+        now = time.monotonic() if now is None else now
+        return [target for target, due in self._due.items() if due <= now]
+
+    def seconds_until_next(self):
+        if not self._due:
+            return None
+        return min(self._due.values()) - time.monotonic()
+
+    def take(self, target):
+        """(title, entries) buffered for target, removing them"""
+        self._due.pop(target, None)
+        return self._titles.pop(target, str(target)), self._entries.pop(target, [])
+
+    def restore(self, target, title, entries, delay=RETRY_DELAY):
+        """Put entries that could not be posted back in front of anything buffered since, due again after `delay`"""
+        if not entries:
+            return
+        self._entries[target] = entries + self._entries.get(target, [])
+        self._titles.setdefault(target, title)
+        self._due[target] = time.monotonic() + delay
+
+    def targets(self):
+        return list(self._entries)
+
+
+def _units(text):
+    """Length as Telegram counts it: emoji and other astral characters are two UTF-16 units"""
+    return len(text.encode("utf-16-le")) // 2
+
+
+def render_digest(title, entries, limit=MESSAGE_LIMIT):
+    """
+    Digest posts for one target's entries as [(text, entries in that post)], split between
+    entries so each post fits in `limit`
+    """
+    if not entries:
+        return []
+    start = time.strftime("%Y-%m-%d %H:%M", time.localtime(entries[0].date))
+    end = time.strftime("%H:%M", time.localtime(entries[-1].date))
+    count = sum(entry.parts for entry in entries)
+    header = f"🗞️ Digest: {title} · {count} message(s) · {start}–{end}"
+    # Room for the header, a " (12/34)" part counter and the blank line after it
+    budget = limit - _units(header) - 12
+    posts, current, size, first = [], [], 0, 0
+    for index, entry in enumerate(entries):
+        text = entry.render()[:budget // 2]
+        units = _units(text) + 1
+        if current and size + units > budget:
+            posts.append((current, entries[first:index]))
+            current, size, first = [], 0, index
+        current.append(text)
+        size += units
+    posts.append((current, entries[first:]))
+    if len(posts) == 1:
+        return [(header + "\n\n" + "\n".join(posts[0][0]), entries)]
+    return [
+        (f"{header} ({i}/{len(posts)})\n\n" + "\n".join(lines), part)
+        for i, (lines, part) in enumerate(posts, 1)
+    ]
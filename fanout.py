@@ -0,0 +1,110 @@
+"""
+Multi-vault fan-out for Telegram Vault Userbot
+ROUTES lines in the pinned config send matching messages to extra vaults on top of the main one;
+each batch is split per destination so every vault gets one forward call per batch
+"""
+import logging
+from content_filter import GLOBAL_TARGET, RuleSet, parse_rule_line
+
+logger = logging.getLogger(__name__)
+
+ROUTE_ARROW = "=>"
+
+
+def parse_chat_id(value):
+    """Chat ID from config text: an int for numeric IDs, '@name' / 'name' kept as a string"""
+    if value is None or isinstance(value, int):
+        return value
+    value = str(value).strip()
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+class Route:
+    """Messages from `source` (an ID, @name or '*') that pass `rule_set` also go to `destination`"""
+    __slots__ = ("source", "rule_set", "destination")
+
+    def __init__(self, source, rule_set, destination):
+        self.source = source
+        self.rule_set = rule_set
+        self.destination = destination
+
+
+def parse_route_line(line):
+    """'-1001 +python -senior => -1009' -> Route, or None if the line is not a valid route"""
+    left, arrow, right = line.partition(ROUTE_ARROW)
+    destination = parse_chat_id(right) if arrow and right.strip() else None
+    source, rules = parse_rule_line(left)
+    if source is None or destination is None:
+        return None
+    return Route(source, RuleSet(rules), destination)
+
+
+def _source_keys(message):
+    """Every key a route can name the message by: chat, sender and sender chat IDs and @usernames"""
+    keys = []
+    for peer in (message.chat, message.from_user, message.sender_chat):
+        if peer is not None:
+            keys.append(peer.id)
+            if peer.username:
+                keys.append("@" + peer.username.lower())
+    return keys
+
+
+class VaultRouter:
+    """
+    Immutable map from messages to destination vaults, built from the main vault and ROUTES lines
+    Every delivered message goes to the main vault; routes add destinations. Parts of one album
+    always share the same destinations.
+    """
+
+    def __init__(self, vault_id=None, lines=()):
+        self.vault_id = parse_chat_id(vault_id)
+        self.routes = {}
+        for line in lines:
+            route = parse_route_line(line)
+            if route is None:
+                logger.warning(f"⚠️ Ignoring route line (expected '<source> [rules] => <vault>'): {line}")
+                continue
+            self.routes.setdefault(route.source, []).append(route)
+        self.destinations = tuple(dict.fromkeys(
+            [self.vault_id] + [route.destination for routes in self.routes.values() for route in routes]
+        ))
+
+    def __len__(self):
+        return sum(len(routes) for routes in self.routes.values())
+
+    def destinations_for(self, message):
+        """Destination vaults for one message, main vault first"""
+        destinations = [self.vault_id]
+        if not self.routes:
+            return destinations
+        text = message.text or message.caption
+        candidates = list(self.routes.get(GLOBAL_TARGET, ()))
+        for key in _source_keys(message):
+            candidates.extend(self.routes.get(key, ()))
+        for route in candidates:
+            if route.destination not in destinations and route.rule_set.allows(text):
+                destinations.append(route.destination)
+        return destinations
+
+    def split(self, messages):
+        """[(destination, messages)] for one source batch, each list keeping the batch order"""
+        if not self.routes:
+            return [(self.vault_id, messages)]
+        chosen = [self.destinations_for(message) for message in messages]
+        # An album goes wherever any of its parts (usually the captioned one) is routed
+        albums = {}
+        for message, destinations in zip(messages, chosen):
+            if message.media_group_id:
+                album = albums.setdefault(message.media_group_id, [])
+                album.extend(d for d in destinations if d not in album)
+        by_destination = {destination: [] for destination in self.destinations}
+        for message, destinations in zip(messages, chosen):
+            if message.media_group_id:
+                destinations = albums[message.media_group_id]
+            for destination in destinations:
+                by_destination[destination].append(message)
+        return [(destination, batch) for destination, batch in by_destination.items() if batch]
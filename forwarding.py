@@ -0,0 +1,217 @@
+"""
+Batched forwarding for Telegram Vault Userbot
+Pending messages are grouped per source chat and sent with one forward_messages call per batch
+"""
+import asyncio
+import logging
+from delivery import PartialDelivery
+from rate_limit import limited_call
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Telegram accepts at most 100 message IDs per messages.ForwardMessages call
+MAX_FORWARD_BATCH = 100
+
+# Telegram's caption limit for non-premium accounts
+CAPTION_LIMIT = 1024
+
+
+def format_copy(message, note, limit=None):
+    """
+    Text copy used when a message can't be forwarded (keeps the footer the vault scan parses)
+    With `limit` (e.g. CAPTION_LIMIT for media captions) the message text is cut, never the header
+    """
+    title = message.chat.title if message.chat else "Unknown"
+    text = message.text or message.caption or f"[Media - {note}]"
+    copy = (
+        f"📋 From: {title}\n"
+        f"🆔 Channel: {message.chat.id} | Msg: {message.id}\n"
+        f"📅 {message.date}\n\n{text}"
+    )
+    if limit is not None and len(copy) > limit:
+        copy = copy[:limit - 1] + "…"
+    return copy
+
+
+async def copy_as_text(client, vault_id, message, note, limiter=None, archive=None):
+    sent = await limited_call(
+        limiter, "send_message", lambda: client.send_message(vault_id, format_copy(message, note)), vault_id
+    )
+    if archive is not None:
+        archive.record(message, sent, "copy")
+    return sent
+
+
+def _archive_forwarded(archive, messages, sent):
+    """Record forwarded messages with their vault copies (matched by position when Telegram returned them all)"""
+    if not isinstance(sent, list):
+        sent = [sent] if sent is not None else []
+    if len(sent) != len(messages):
+        sent = [None] * len(messages)
+    for message, vault_message in zip(messages, sent):
+        archive.record(message, vault_message, "forward")
+
+
+async def forward_batch(client, vault_id, chat_id, messages, limiter=None, media_copier=None, archive=None):
+    """
+    Forward messages from one source chat in a single call, in order
+    Falls back to copies for forward-restricted chats (media re-uploaded by media_copier when
+    given, text only otherwise), and to per-message forwarding when one bad ID
+    (MESSAGE_ID_INVALID) fails the whole batch. Delivered messages are recorded in `archive` if given
+    Returns the number of messages that reached the vault; raises PartialDelivery when a message
+    after the first fails on these per-message paths
+    """
+    message_ids = [m.id for m in messages]
+    try:
+        sent = await limited_call(
+            limiter, "forward_messages",
+            lambda: client.forward_messages(vault_id, chat_id, message_ids),
+            vault_id
+        )
+        metrics.forwarded.inc(len(message_ids))
+        if archive is not None:
+            _archive_forwarded(archive, messages, sent)
+        logger.info("✅ SUCCESS: Forwarded %s message(s) from %s to vault", len(message_ids), chat_id,
+                    extra={"event": "forward", "chat_id": chat_id, "count": len(message_ids)})
+        return len(message_ids)
+    except Exception as e:
+        error_str = str(e)
+        if "FORWARDS_RESTRICTED" in error_str:
+            # Copies go out one message at a time, in order; count them so a retry can skip those done
+            copied = 0
+            try:
+                if media_copier is not None:
+                    async def copy_text(message, note):
+                        nonlocal copied
+                        await copy_as_text(client, vault_id, message, note, limiter, archive)
+                        copied += 1
+
+                    def on_copied(message, sent):
+                        nonlocal copied
+                        copied += 1
+                        if archive is not None:
+                            archive.record(message, sent, "copy")
+
+                    await media_copier.copy_messages(
+                        client, vault_id, messages,
+                        lambda message: format_copy(message, "forwarding restricted", CAPTION_LIMIT),
+                        copy_text, limiter, on_copied=on_copied
+                    )
+                else:
+                    for message in messages:
+                        await copy_as_text(client, vault_id, message, "forwarding restricted", limiter, archive)
+                        copied += 1
+            except Exception as copy_error:
+                if copied:
+                    raise PartialDelivery(copied, copy_error) from copy_error
+                raise
+            finally:
+                metrics.copied.inc(copied)
+            logger.info("✅ Copied %s message(s) from %s (forward restricted)", len(messages), chat_id,
+                        extra={"event": "copy", "chat_id": chat_id, "count": len(messages)})
+            return len(messages)
+        if "MESSAGE_ID_INVALID" in error_str and len(messages) > 1:
+            sent = 0
+            for index, message in enumerate(messages):
+                try:
+                    sent += await forward_batch(client, vault_id, chat_id, [message], limiter, media_copier, archive)
+                except Exception as single_error:
+                    if index:
+                        raise PartialDelivery(index, single_error) from single_error
+                    raise
+            return sent
+        if "MESSAGE_ID_INVALID" in error_str:
+            message = messages[0]
+            logger.warning("⏭️ Message %s in %s: MESSAGE_ID_INVALID, copying as text", message.id, chat_id)
+            try:
+                await copy_as_text(client, vault_id, message, "message ID invalid", limiter, archive)
+                metrics.copied.inc()
+                return 1
+            except Exception:
+                return 0
+        raise
+
+
+class ForwardBatcher:
+    """
+    Collects messages per source chat and hands them to `send(chat_id, messages)` in batches
+    A batch is flushed when it reaches max_batch messages or max_delay seconds after its first
+    message. Albums (media_group_id) are never split across batches, and sends for one chat
+    are serialized so the vault keeps the source order.
+    """
+
+    def __init__(self, send, max_batch=MAX_FORWARD_BATCH, max_delay=1.0):
+        self.send = send
+        self.max_batch = min(max_batch, MAX_FORWARD_BATCH)
+        self.max_delay = max_delay
+        self._pending = {}
+        self._timers = {}
+        self._locks = {}
+
+    def __len__(self):
+        return sum(len(batch) for batch in self._pending.values())
+
+    async def add(self, message):
+        chat_id = message.chat.id
+        batch = self._pending.setdefault(chat_id, [])
+        batch.append(message)
+        if len(batch) > self.max_batch:
+            # Wait for one more message before sending a full batch so we know whether its last album is complete
+            await self._send_full(chat_id)
+        if chat_id in self._pending and chat_id not in self._timers:
+            loop = asyncio.get_running_loop()
+            self._timers[chat_id] = loop.call_later(
+                self.max_delay, lambda: asyncio.ensure_future(self.flush(chat_id))
+            )
+
+    def _take(self, chat_id):
+        """Pop the next batch for a chat, ending it before an album that would straddle the size limit"""
+        queue = self._pending.get(chat_id)
+        if not queue:
+            return []
+        cut = min(len(queue), self.max_batch)
+        group_id = queue[cut - 1].media_group_id
+        if group_id and cut < len(queue) and queue[cut].media_group_id == group_id:
+            split = cut
+            while split > 0 and queue[split - 1].media_group_id == group_id:
+                split -= 1
+            if split > 0:
+                cut = split
+        batch, rest = queue[:cut], queue[cut:]
+        if rest:
+            self._pending[chat_id] = rest
+        else:
+            del self._pending[chat_id]
+            timer = self._timers.pop(chat_id, None)
+            if timer is not None:
+                timer.cancel()
+        return batch
+
+    async def _send(self, chat_id, batch):
+        try:
+            await self.send(chat_id, batch)
+        except Exception as e:
+            logger.error("❌ FAILED: Forward batch of %s from %s: %s", len(batch), chat_id, e)
+
+    async def _send_full(self, chat_id):
+        async with self._locks.setdefault(chat_id, asyncio.Lock()):
+            while len(self._pending.get(chat_id, ())) > self.max_batch:
+                batch = self._take(chat_id)
+                if not batch:
+                    break
+                await self._send(chat_id, batch)
+
+    async def flush(self, chat_id=None):
+        """Send everything pending for one chat (or every chat) now"""
+        chat_ids = [chat_id] if chat_id is not None else list(self._pending)
+        for cid in chat_ids:
+            timer = self._timers.pop(cid, None)
+            if timer is not None:
+                timer.cancel()
+            async with self._locks.setdefault(cid, asyncio.Lock()):
+                while True:
+                    batch = self._take(cid)
+                    if not batch:
+                        break
+                    await self._send(cid, batch)
@@ -0,0 +1,54 @@
+"""
+History paging for Telegram Vault Userbot
+Streams messages newer than a checkpoint, oldest first, one page at a time
+"""
+from pyrogram import raw, utils
+from rate_limit import limited_call
+
+# Telegram returns at most 100 messages per messages.GetHistory call
+MAX_PAGE_SIZE = 100
+
+
+async def iter_new_messages(client, chat_id, after_id, page_size=MAX_PAGE_SIZE, max_messages=None, limiter=None):
+    """
+    Async generator yielding every message with id > after_id in ascending order
+
+    Pages forward from the checkpoint with offset_id/add_offset/min_id, so only one page is
+    held in memory at a time and nothing between the checkpoint and the head is skipped.
+    Stops at the head of the chat or after max_messages (the caller resumes from the last
+    yielded id next time).
+    """
+    page_size = min(page_size, MAX_PAGE_SIZE)
+    peer = await client.resolve_peer(chat_id)
+    cursor = after_id
+    remaining = max_messages
+
+    while remaining is None or remaining > 0:
+        limit = page_size if remaining is None else min(page_size, remaining)
+        request = raw.functions.messages.GetHistory(
+            peer=peer,
+            offset_id=cursor + 1,
+            offset_date=0,
+            add_offset=-limit,
+            limit=limit,
+            max_id=0,
+            min_id=cursor,
+            hash=0
+        )
+        response = await limited_call(limiter, "get_chat_history", lambda: client.invoke(request), chat_id)
+
+        fetched = len(response.messages)
+        if not fetched:
+            return
+        page_head = max(m.id for m in response.messages)
+
+        # replies=0: don't spend extra calls resolving reply targets we never read
+        page = await utils.parse_messages(client, response, replies=0)
+        page = sorted((m for m in page if m.id > cursor and not m.empty), key=lambda m: m.id)
+        for message in page:
+            yield message
+        cursor = max(cursor, page_head)
+        if remaining is not None:
+            remaining -= fetched
+        if fetched < limit:
+            return  # reached the head
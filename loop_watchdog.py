@@ -0,0 +1,165 @@
+"""
+Event-loop watchdog and sampling profiler for Telegram Vault Userbot
+A heartbeat task stamps the loop every tick and a helper thread notices when the stamp goes
+stale, so a blocked loop is reported with the stack that blocks it while it is still blocked.
+The profiler samples the loop thread's stack from another thread and writes collapsed stacks
+("outer;inner;leaf count" lines, the input of flamegraph.pl and speedscope)
+"""
+import asyncio
+import logging
+import os
+import sys
+import threading
+import time
+import traceback
+from collections import Counter
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Deepest stack kept in a stall report or a profile sample
+MAX_STACK_DEPTH = 64
+
+
+def _frame_name(frame):
+    code = frame.f_code
+    return f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def collapse_stack(frame, depth=MAX_STACK_DEPTH):
+    """'outermost;...;innermost' for a frame and its callers"""
+    names = []
+    while frame is not None and len(names) < depth:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+class _Timed:
+    __slots__ = ("watchdog", "name", "detail", "start")
+
+    def __init__(self, watchdog, name, detail):
+        self.watchdog = watchdog
+        self.name = name
+        self.detail = detail
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        elapsed = time.monotonic() - self.start
+        if elapsed >= self.watchdog.slow_handler:
+            metrics.slow_handlers.inc(1, self.name)
+            logger.warning("🐢 Slow %s (%s): %.2fs", self.name, self.detail, elapsed,
+                           extra={"event": "loop.slow_handler", "handler": self.name, "seconds": round(elapsed, 3)})
+
+
+class LoopWatchdog:
+    """
+    Measures event-loop lag and reports stalls longer than `threshold` seconds with the loop
+    thread's stack, once per stall. timed() flags handlers that take longer than `slow_handler`
+    seconds in total, awaits included.
+    """
+
+    def __init__(self, threshold=0.5, slow_handler=5.0):
+        self.threshold = threshold
+        self.slow_handler = slow_handler
+        self.tick = threshold / 4
+        self.stalls = 0
+        self._beat = time.monotonic()
+        self._loop_thread = None
+        self._stopped = threading.Event()
+        self._task = None
+
+    def start(self):
+        """Start the heartbeat and the watcher thread; call from the loop thread"""
+        if self._task is not None:
+            return
+        self._loop_thread = threading.get_ident()
+        self._beat = time.monotonic()
+        self._stopped.clear()
+        self._task = asyncio.ensure_future(self._heartbeat())
+        threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+        logger.info(f"🐕 Loop watchdog on: stalls over {self.threshold}s, handlers over {self.slow_handler}s")
+
+    def stop(self):
+        self._stopped.set()
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    def timed(self, name, detail=None):
+        """Context manager around one handler run"""
+        return _Timed(self, name, detail)
+
+    async def _heartbeat(self):
+        while True:
+            expected = time.monotonic() + self.tick
+            await asyncio.sleep(self.tick)
+            self._beat = now = time.monotonic()
+            lag = max(0.0, now - expected)
+            metrics.loop_lag_seconds.observe(lag)
+            if lag >= self.threshold:
+                logger.warning("🐢 Event loop was blocked for %.2fs", lag,
+                               extra={"event": "loop.lag", "seconds": round(lag, 3)})
+
+    def _watch(self):
+        reported = None
+        while not self._stopped.wait(self.tick):
+            beat = self._beat
+            stalled = time.monotonic() - beat
+            if stalled < self.threshold or beat == reported:
+                continue
+            # Still blocked right now: whatever the loop thread is running is the culprit
+            reported = beat
+            self.stalls += 1
+            metrics.loop_stalls.inc()
+            frame = sys._current_frames().get(self._loop_thread)
+            stack = "".join(traceback.format_stack(frame, MAX_STACK_DEPTH)) if frame is not None else "(thread gone)\n"
+            logger.warning("🐢 Event loop blocked for %.2fs so far, in:\n%s", stalled, stack.rstrip(),
+                           extra={"event": "loop.stall", "seconds": round(stalled, 3)})
+
+
+def sample_stacks(thread_id, seconds, interval=0.005):
+    """
+    Collapsed stack -> sample count for `thread_id`, sampled every `interval` seconds for
+    `seconds`; runs in a helper thread (an idle loop shows up as its selector call)
+    """
+    samples = Counter()
+    deadline = time.monotonic() + seconds
+    while time.monotonic() < deadline:
+        frame = sys._current_frames().get(thread_id)
+        if frame is None:
+            break
+        samples[collapse_stack(frame)] += 1
+        del frame
+        time.sleep(interval)
+    return samples
+
+
+def write_collapsed(samples, path):
+    with open(path, "w", encoding="utf-8") as f:
+        for stack, count in samples.most_common():
+            f.write(f"{stack} {count}\n")
+    return path
+
+
+def top_functions(samples, limit=8):
+    """[(innermost frame, share of samples)] busiest first"""
+    total = sum(samples.values())
+    if not total:
+        return []
+    leaves = Counter()
+    for stack, count in samples.items():
+        leaves[stack.rsplit(";", 1)[-1]] += count
+    return [(name, count / total) for name, count in leaves.most_common(limit)]
+
+
+async def profile(seconds, directory=".", interval=0.005):
+    """Sample the calling loop's thread for `seconds`; returns (collapsed-stack file path, samples)"""
+    thread_id = threading.get_ident()
+    samples = await asyncio.get_running_loop().run_in_executor(None, sample_stacks, thread_id, seconds, interval)
+    os.makedirs(directory, exist_ok=True)
+    path = os.path.join(directory, time.strftime("profile-%Y%m%d-%H%M%S.folded"))
+    return write_collapsed(samples, path), samples
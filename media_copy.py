@@ -0,0 +1,339 @@
+"""
+Media copying for Telegram Vault Userbot
+Forward-restricted media is streamed into size-capped spool buffers and re-uploaded to the vault,
+with downloads running ahead of uploads under a global byte budget
+"""
+import asyncio
+import io
+import json
+import logging
+import os
+import tempfile
+from collections import OrderedDict, deque
+from rate_limit import flood_wait_seconds, limited_call
+import metrics
+
+logger = logging.getLogger(__name__)
+
+# Media kinds we can download and send back with client.send_<kind>
+COPYABLE_MEDIA = ("photo", "video", "document", "audio", "voice", "animation", "video_note", "sticker")
+
+# send_sticker / send_video_note take no caption; the copy footer goes out as a separate text message
+CAPTIONLESS_MEDIA = ("sticker", "video_note")
+
+# send_<kind> methods that accept file_name (the others derive it from the buffer)
+NAMED_MEDIA = ("document", "video", "audio", "animation")
+
+DEFAULT_EXTENSIONS = {"photo": ".jpg", "video": ".mp4", "voice": ".ogg", "video_note": ".mp4",
+                      "animation": ".mp4", "sticker": ".webp", "audio": ".mp3", "document": ".bin"}
+
+
+class MediaTooLarge(Exception):
+    pass
+
+
+def media_kind(message):
+    """The copyable media kind of a message ("photo", "video", ...) or None"""
+    if message.media is None:
+        return None
+    kind = message.media.name.lower()
+    return kind if kind in COPYABLE_MEDIA else None
+
+
+class ByteBudget:
+    """
+    FIFO counting semaphore over bytes shared by every transfer
+    Requests larger than the whole budget are clamped to it, so one huge file waits for
+    everything else to finish instead of waiting forever.
+    """
+
+    def __init__(self, capacity):
+        self.capacity = capacity
+        self.available = capacity
+        self._waiters = deque()
+
+    async def acquire(self, size):
+        size = max(0, min(size, self.capacity))
+        if not self._waiters and self.available >= size:
+            self.available -= size
+            return size
+        future = asyncio.get_running_loop().create_future()
+        waiter = (size, future)
+        self._waiters.append(waiter)
+        try:
+            await future
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self.release(size)
+            else:
+                self._waiters.remove(waiter)
+                self._wake()
+            raise
+        return size
+
+    def release(self, size):
+        self.available += size
+        self._wake()
+
+    def _wake(self):
+        while self._waiters and self._waiters[0][0] <= self.available:
+            size, future = self._waiters.popleft()
+            if future.done():
+                continue
+            self.available -= size
+            future.set_result(None)
+
+
+class SpoolBuffer:
+    """Bytes kept in memory up to `threshold`, rolled over to a temporary file beyond it"""
+
+    def __init__(self, name, threshold):
+        self.name = name
+        self.threshold = threshold
+        self.size = 0
+        self._file = io.BytesIO()
+        self._path = None
+
+    def write(self, chunk):
+        if self._path is None and self.size + len(chunk) > self.threshold:
+            fd, self._path = tempfile.mkstemp(prefix="vault-media-", suffix=os.path.splitext(self.name)[1])
+            spilled = open(fd, "w+b")
+            spilled.write(self._file.getbuffer())
+            self._file.close()
+            self._file = spilled
+        self._file.write(chunk)
+        self.size += len(chunk)
+
+    def open_for_upload(self):
+        """Rewound file object for Pyrogram; in-memory uploads need the .name attribute set"""
+        self._file.seek(0)
+        if self._path is None:
+            self._file.name = self.name
+        return self._file
+
+    def close(self):
+        self._file.close()
+        if self._path is not None:
+            try:
+                os.unlink(self._path)
+            except OSError:
+                pass
+
+
+class MediaCache:
+    """file_unique_id -> (kind, vault file_id) of media already copied, LRU-bounded and persisted"""
+
+    def __init__(self, path="media_cache.json", max_size=20000):
+        self.path = path
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._dirty = False
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, file_unique_id):
+        entry = self._entries.get(file_unique_id)
+        if entry is not None:
+            self._entries.move_to_end(file_unique_id)
+        return entry
+
+    def put(self, file_unique_id, kind, file_id):
+        self._entries[file_unique_id] = (kind, file_id)
+        self._entries.move_to_end(file_unique_id)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        self._dirty = True
+
+    def load(self):
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Could not load media cache {self.path}: {e}")
+            return 0
+        for file_unique_id, (kind, file_id) in data.items():
+            self._entries[file_unique_id] = (kind, file_id)
+        self._dirty = False
+        return len(self._entries)
+
+    def save(self):
+        if not self._dirty:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(self._entries, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            logger.warning(f"⚠️ Could not save media cache {self.path}: {e}")
+
+    async def autosave(self, interval=60):
+        while True:
+            await asyncio.sleep(interval)
+            self.save()
+
+
+class MediaCopier:
+    """
+    Copies messages whose media can't be forwarded: download, then re-upload with the copy caption
+    Messages are sent in order while up to `transfers` later downloads proceed in the background.
+    Files over `max_size` are skipped, bytes held by buffers never exceed `budget`, buffers spill
+    to disk past `spool_size`, and media already in the vault is re-sent by file_id from `cache`.
+    """
+
+    def __init__(self, cache, max_size=50 * 2 ** 20, budget=64 * 2 ** 20, spool_size=8 * 2 ** 20, transfers=2):
+        self.cache = cache
+        self.max_size = max_size
+        self.spool_size = spool_size
+        self.transfers = transfers
+        self.budget = ByteBudget(budget)
+        self._downloads = asyncio.Semaphore(transfers)
+
+    def _cached(self, message, kind):
+        media = getattr(message, kind)
+        return self.cache.get(media.file_unique_id)
+
+    async def _download(self, client, message, kind, limiter):
+        media = getattr(message, kind)
+        name = getattr(media, "file_name", None) or f"{kind}_{message.id}{DEFAULT_EXTENSIONS[kind]}"
+        buffer = SpoolBuffer(name, self.spool_size)
+
+        # File references belong to the account that fetched the message, so download with that one
+        source = getattr(message, "_client", None) or client
+
+        async def stream():
+            async for chunk in source.stream_media(message):
+                if buffer.size + len(chunk) > self.max_size:
+                    raise MediaTooLarge(f"{name} is over {self.max_size} bytes")
+                buffer.write(chunk)
+
+        try:
+            async with self._downloads:
+                await limited_call(limiter, "stream_media", stream, message.chat.id)
+        except BaseException:
+            buffer.close()
+            raise
+        return buffer
+
+    async def _send(self, client, vault_id, kind, media, caption, limiter, file_name=None):
+        send = getattr(client, f"send_{kind}")
+        kwargs = {}
+        if kind not in CAPTIONLESS_MEDIA:
+            kwargs["caption"] = caption
+        if file_name and kind in NAMED_MEDIA:
+            kwargs["file_name"] = file_name
+        sent = await limited_call(limiter, f"send_{kind}", lambda: send(vault_id, media, **kwargs), vault_id)
+        if kind in CAPTIONLESS_MEDIA:
+            await limited_call(limiter, "send_message", lambda: client.send_message(vault_id, caption), vault_id)
+        return sent
+
+    async def _deliver(self, client, vault_id, message, kind, download, caption, copy_text, limiter, on_copied):
+        media = getattr(message, kind)
+        cached = self.cache.get(media.file_unique_id)
+        if cached is not None:
+            # Another batch copied the same file while this one was queued
+            if download is not None:
+                await _discard(download)
+            sent = await self._send(client, vault_id, cached[0], cached[1], caption, limiter)
+            metrics.media_copied.inc(1, "cache")
+            if on_copied is not None:
+                on_copied(message, sent)
+            return
+        try:
+            buffer = await download
+        except MediaTooLarge:
+            await copy_text(message, "media too large to copy")
+            return
+        except Exception as e:
+            if flood_wait_seconds(e) is not None:
+                raise
+            logger.warning("⚠️ Could not download media %s from %s: %s", message.id, message.chat.id, e)
+            await copy_text(message, "media download failed")
+            return
+        try:
+            sent = await self._send(client, vault_id, kind, buffer.open_for_upload(), caption, limiter, buffer.name)
+            metrics.media_copied.inc(1, "download")
+            metrics.media_bytes.inc(buffer.size)
+        finally:
+            buffer.close()
+        if on_copied is not None:
+            on_copied(message, sent)
+        sent_media = getattr(sent, kind, None) if sent is not None else None
+        if sent_media is not None:
+            self.cache.put(media.file_unique_id, kind, sent_media.file_id)
+
+    async def copy_messages(self, client, vault_id, messages, format_caption, copy_text, limiter=None,
+                            on_copied=None):
+        """
+        Copy `messages` (all from one chat) to the vault in order
+        format_caption(message) builds the caption; copy_text(message, note) handles messages
+        without copyable media and media that can't be copied; on_copied(message, sent) is
+        called for every media copy that reached the vault
+        """
+        pipeline = asyncio.Queue(self.transfers)
+
+        async def produce():
+            for message in messages:
+                kind = media_kind(message)
+                download, reserved = None, 0
+                if kind is not None and self._cached(message, kind) is None:
+                    size = getattr(message, kind).file_size or self.max_size
+                    if size <= self.max_size:
+                        # Budget is taken in message order, so the message being uploaded always holds its share
+                        reserved = await self.budget.acquire(size)
+                        download = asyncio.ensure_future(self._download(client, message, kind, limiter))
+                    else:
+                        kind = "too_large"
+                try:
+                    await pipeline.put((message, kind, download, reserved))
+                except asyncio.CancelledError:
+                    # Cancelled while the queue was full: this item never reaches the drain loop below
+                    if download is not None:
+                        await _discard(download)
+                    self.budget.release(reserved)
+                    raise
+            await pipeline.put(None)
+
+        producer = asyncio.ensure_future(produce())
+        try:
+            while True:
+                item = await pipeline.get()
+                if item is None:
+                    break
+                message, kind, download, reserved = item
+                try:
+                    if kind is None:
+                        await copy_text(message, "forwarding restricted")
+                    elif kind == "too_large":
+                        await copy_text(message, "media too large to copy")
+                    else:
+                        caption = format_caption(message)
+                        await self._deliver(
+                            client, vault_id, message, kind, download, caption, copy_text, limiter, on_copied
+                        )
+                finally:
+                    self.budget.release(reserved)
+        finally:
+            producer.cancel()
+            await asyncio.gather(producer, return_exceptions=True)
+            # Abandoned after an error: stop their downloads and give their budget back
+            while not pipeline.empty():
+                item = pipeline.get_nowait()
+                if item is None:
+                    continue
+                _, _, download, reserved = item
+                if download is not None:
+                    await _discard(download)
+                self.budget.release(reserved)
+
+
+async def _discard(download):
+    """Cancel a download task and free its buffer if it already finished"""
+    download.cancel()
+    buffer = (await asyncio.gather(download, return_exceptions=True))[0]
+    if isinstance(buffer, SpoolBuffer):
+        buffer.close()
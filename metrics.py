@@ -0,0 +1,231 @@
+"""
+Metrics for Telegram Vault Userbot
+Counters, gauges and fixed-bucket latency histograms, exported in Prometheus text format
+over a tiny local HTTP endpoint and summarized by the /stats command
+"""
+import asyncio
+import bisect
+import logging
+import time
+
+logger = logging.getLogger(__name__)
+
+# Latency buckets in seconds, 1ms .. ~17min
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120, 300, 1000)
+
+
+class Counter:
+    """Monotonic counter, optionally split by one label"""
+
+    def __init__(self, name, help, label=None):
+        self.name = name
+        self.help = help
+        self.label = label
+        self.values = {}
+
+    def inc(self, amount=1, label_value=None):
+        self.values[label_value] = self.values.get(label_value, 0) + amount
+
+    def total(self):
+        return sum(self.values.values())
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        if not self.values and self.label is None:
+            lines.append(f"{self.name} 0")
+        for label_value, value in sorted(self.values.items(), key=lambda item: str(item[0])):
+            lines.append(f"{self.name}{_labels(self.label, label_value)} {value}")
+        return lines
+
+
+class Gauge(Counter):
+    """Point-in-time value, optionally split by one label"""
+
+    def set(self, value, label_value=None):
+        self.values[label_value] = value
+
+    def remove(self, label_value):
+        self.values.pop(label_value, None)
+
+    def render(self):
+        lines = super().render()
+        lines[1] = f"# TYPE {self.name} gauge"
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram; observe() is a bisect plus two additions"""
+
+    def __init__(self, name, help, buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.sum += value
+        self.count += 1
+
+    def time(self):
+        return _Timer(self)
+
+    def quantile(self, q):
+        """Upper bound of the bucket holding the q-quantile (None when empty)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            seen += bucket_count
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        cumulative = 0
+        for bound, bucket_count in zip(self.buckets, self.counts):
+            cumulative += bucket_count
+            lines.append(f'{self.name}_bucket{{le="{bound}"}} {cumulative}')
+        lines.append(f'{self.name}_bucket{{le="+Inf"}} {self.count}')
+        lines.append(f"{self.name}_sum {self.sum}")
+        lines.append(f"{self.name}_count {self.count}")
+        return lines
+
+
+class _Timer:
+    __slots__ = ("histogram", "start")
+
+    def __init__(self, histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.start = time.monotonic()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.monotonic() - self.start)
+
+
+def _labels(label, value):
+    if label is None or value is None:
+        return ""
+    return f'{{{label}="{value}"}}'
+
+
+REGISTRY = []
+
+
+def _register(metric):
+    REGISTRY.append(metric)
+    return metric
+
+
+# Hot-path metrics shared by the handler, poller, batcher and delivery workers
+matched = _register(Counter("vault_matched_total", "Messages matched to a monitored target", "source"))
+duplicates = _register(Counter("vault_duplicates_total", "Matched messages dropped as already delivered"))
+filtered = _register(Counter("vault_filtered_total", "Matched messages dropped by the content filter rules", "source"))
+forwarded = _register(Counter("vault_forwarded_total", "Messages forwarded to the vault"))
+copied = _register(Counter("vault_copied_total", "Messages copied as text because forwarding failed"))
+media_copied = _register(Counter("vault_media_copied_total", "Restricted media re-uploaded to the vault", "source"))
+media_bytes = _register(Counter("vault_media_copied_bytes_total", "Bytes downloaded to copy restricted media"))
+digested = _register(Counter("vault_digested_total", "Matched messages collected into digests instead of forwarded"))
+digest_posts = _register(Counter("vault_digest_posts_total", "Digest messages posted to the vault"))
+failed = _register(Counter("vault_failed_total", "Messages dead-lettered after permanent failures"))
+flood_waits = _register(Counter("vault_flood_wait_total", "FloodWait errors returned by Telegram", "method"))
+match_seconds = _register(Histogram("vault_match_seconds", "Time from handler entry to match decision"))
+queue_seconds = _register(Histogram("vault_queue_seconds", "Time a batch waited in the delivery queue"))
+send_seconds = _register(Histogram("vault_send_seconds", "Time to deliver one batch to the vault"))
+delivery_lag_seconds = _register(Histogram("vault_delivery_lag_seconds", "Time from posting to vault delivery"))
+poll_seconds = _register(Histogram("vault_poll_seconds", "Duration of one channel poll"))
+channel_lag = _register(Gauge("vault_channel_lag_seconds", "Lag of the newest delivered message per chat", "chat_id"))
+queue_depth = _register(Gauge("vault_delivery_queue_depth", "Batches waiting in the delivery queue"))
+loop_lag_seconds = _register(Histogram("vault_loop_lag_seconds", "How late the event loop ran the watchdog heartbeat"))
+loop_stalls = _register(Counter("vault_loop_stalls_total", "Times the event loop was blocked past the watchdog threshold"))
+slow_handlers = _register(Counter("vault_slow_handlers_total", "Handler runs slower than the watchdog limit", "handler"))
+
+
+def render():
+    lines = []
+    for metric in REGISTRY:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
+
+
+def observe_delivered(chat_id, messages):
+    """Record end-to-end lag for a delivered batch (message.date -> now)"""
+    now = time.time()
+    newest = None
+    for message in messages:
+        if message.date is not None:
+            lag = now - message.date.timestamp()
+            delivery_lag_seconds.observe(lag)
+            newest = lag if newest is None else min(newest, lag)
+    if newest is not None:
+        channel_lag.set(round(newest, 3), chat_id)
+
+
+def _fmt(seconds):
+    if seconds is None:
+        return "-"
+    if seconds == float("inf"):
+        return f">{LATENCY_BUCKETS[-1]}s"
+    return f"{seconds * 1000:.0f}ms" if seconds < 1 else f"{seconds:g}s"
+
+
+def summary():
+    """Short human readable digest for the /stats command"""
+    worst = sorted(channel_lag.values.items(), key=lambda item: item[1], reverse=True)[:5]
+    lines = [
+        "📊 Vault stats",
+        f"Matched: {matched.total()} (realtime {matched.values.get('realtime', 0)}, poll {matched.values.get('poll', 0)})",
+        f"Forwarded: {forwarded.total()} | Copied: {copied.total()} | Failed: {failed.total()}",
+        f"Duplicates skipped: {duplicates.total()} | Filtered: {filtered.total()} | FloodWaits: {flood_waits.total()}",
+        f"Queue depth: {queue_depth.total()}",
+        f"Send p50/p99: {_fmt(send_seconds.quantile(0.5))} / {_fmt(send_seconds.quantile(0.99))}",
+        f"Delivery lag p50/p99: {_fmt(delivery_lag_seconds.quantile(0.5))} / {_fmt(delivery_lag_seconds.quantile(0.99))}",
+        f"Poll p50/p99: {_fmt(poll_seconds.quantile(0.5))} / {_fmt(poll_seconds.quantile(0.99))}",
+    ]
+    if digested.total():
+        lines.append(f"Digested: {digested.total()} message(s) in {digest_posts.total()} post(s)")
+    if loop_lag_seconds.count:
+        lines.append(f"Loop lag p99: {_fmt(loop_lag_seconds.quantile(0.99))} | Stalls: {loop_stalls.total()} | "
+                     f"Slow handlers: {slow_handlers.total()}")
+    if worst:
+        lines.append("Most lagging chats:")
+        lines.extend(f"  {chat_id}: {_fmt(lag)}" for chat_id, lag in worst)
+    return "\n".join(lines)
+
+
+async def _handle_http(reader, writer):
+    try:
+        request_line = await asyncio.wait_for(reader.readline(), 5)
+        # Drain headers; we never need them
+        while (await asyncio.wait_for(reader.readline(), 5)) not in (b"\r\n", b"\n", b""):
+            pass
+        path = request_line.split(b" ")[1] if request_line.count(b" ") >= 2 else b"/"
+        if path.startswith(b"/metrics"):
+            status, body, content_type = "200 OK", render(), "text/plain; version=0.0.4"
+        else:
+            # Anything else doubles as a health check for the hosting platform
+            status, body, content_type = "200 OK", "OK\n", "text/plain"
+        payload = body.encode("utf-8")
+        writer.write(
+            f"HTTP/1.1 {status}\r\nContent-Type: {content_type}\r\n"
+            f"Content-Length: {len(payload)}\r\nConnection: close\r\n\r\n".encode("ascii") + payload
+        )
+        await writer.drain()
+    except (asyncio.TimeoutError, ConnectionError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(port, host="127.0.0.1"):
+    """Start the metrics / health endpoint and return the server"""
+    server = await asyncio.start_server(_handle_http, host, port)
+    logger.info(f"📈 Metrics endpoint listening on http://{host}:{port}/metrics")
+    return server
@@ -0,0 +1,218 @@
+"""
+Peer metadata cache for Telegram Vault Userbot
+TTL expiry, LRU eviction and singleflight around get_chat / get_users / get_me,
+persisted to a local JSON file so it survives restarts
+"""
+import asyncio
+import json
+import logging
+import os
+import time
+from collections import OrderedDict
+from rate_limit import limited_call
+
+logger = logging.getLogger(__name__)
+
+
+# Pyrogram session storage peer types, by ChatType name
+STORAGE_PEER_TYPES = {
+    "USER": "user",
+    "PRIVATE": "user",
+    "BOT": "bot",
+    "GROUP": "group",
+    "SUPERGROUP": "supergroup",
+    "CHANNEL": "channel",
+}
+
+
+class PeerInfo:
+    """Lightweight snapshot of the peer fields the userbot actually reads, plus its access hash"""
+    __slots__ = ("id", "type_name", "title", "username", "first_name", "fetched_at", "access_hash")
+
+    def __init__(self, id, type_name, title=None, username=None, first_name=None, fetched_at=None, access_hash=None):
+        self.id = id
+        self.type_name = type_name
+        self.title = title
+        self.username = username
+        self.first_name = first_name
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+        self.access_hash = access_hash
+
+    @property
+    def storage_type(self):
+        return STORAGE_PEER_TYPES.get(self.type_name)
+
+    @classmethod
+    def from_chat(cls, chat):
+        return cls(chat.id, chat.type.name, chat.title or chat.first_name, chat.username, chat.first_name)
+
+    @classmethod
+    def from_user(cls, user):
+        name = " ".join(part for part in (user.first_name, user.last_name) if part)
+        return cls(user.id, "USER", name or user.username, user.username, user.first_name)
+
+    def to_dict(self):
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(**{slot: data.get(slot) for slot in cls.__slots__})
+
+
+class PeerCache:
+    """
+    Caches peer metadata keyed by "chat:<id>", "user:<id>" or "me"
+    Concurrent lookups of the same key share a single in-flight API request
+    """
+
+    def __init__(self, path="peer_cache.json", ttl=6 * 3600, max_size=4096, limiter=None):
+        self.path = path
+        self.limiter = limiter
+        self.ttl = ttl
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._inflight = {}
+        self._dirty = False
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return self._fresh(key) is not None
+
+    def _fresh(self, key):
+        info = self._entries.get(key)
+        if info is None:
+            return None
+        if time.time() - info.fetched_at > self.ttl:
+            del self._entries[key]
+            return None
+        return info
+
+    def _store(self, key, info):
+        self._entries[key] = info
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+        self._dirty = True
+
+    def peek(self, key):
+        """Return a fresh cached entry without touching the network"""
+        info = self._fresh(key)
+        if info is not None:
+            self._entries.move_to_end(key)
+        return info
+
+    def invalidate(self, key):
+        if self._entries.pop(key, None) is not None:
+            self._dirty = True
+
+    async def _get(self, key, fetch, refresh=False):
+        if not refresh:
+            info = self.peek(key)
+            if info is not None:
+                self.hits += 1
+                return info
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.hits += 1
+            return await asyncio.shield(pending)
+
+        self.misses += 1
+        future = asyncio.get_running_loop().create_future()
+        self._inflight[key] = future
+        try:
+            info = await fetch()
+        except BaseException as e:
+            future.set_exception(e)
+            # Mark retrieved so a lookup nobody else waited on doesn't log a warning
+            future.exception()
+            raise
+        else:
+            self._store(key, info)
+            future.set_result(info)
+            return info
+        finally:
+            del self._inflight[key]
+
+    async def get_chat(self, client, chat_id, refresh=False):
+        async def fetch():
+            return PeerInfo.from_chat(await limited_call(self.limiter, "get_chat", lambda: client.get_chat(chat_id)))
+        return await self._get(f"chat:{chat_id}", fetch, refresh)
+
+    async def get_user(self, client, user_id, refresh=False):
+        async def fetch():
+            return PeerInfo.from_user(await limited_call(self.limiter, "get_users", lambda: client.get_users(user_id)))
+        return await self._get(f"user:{user_id}", fetch, refresh)
+
+    async def get_me(self, client, refresh=False):
+        async def fetch():
+            return PeerInfo.from_user(await limited_call(self.limiter, "get_me", client.get_me))
+        return await self._get("me", fetch, refresh)
+
+    async def record_access_hash(self, client, key):
+        """
+        Copy the access hash Pyrogram learned while resolving `key` into the cache entry
+        resolve_peer is answered from the local session storage at this point, so it costs no API call
+        """
+        info = self._entries.get(key)
+        if info is None or info.storage_type is None:
+            return None
+        input_peer = await client.resolve_peer(info.id)
+        info.access_hash = getattr(input_peer, "access_hash", 0)
+        self._dirty = True
+        return info
+
+    async def restore_to_storage(self, client):
+        """Seed Pyrogram's session storage with every cached access hash so known peers resolve offline"""
+        peers, seen = [], set()
+        for info in self._entries.values():
+            if info.access_hash is None or info.storage_type is None or info.id in seen:
+                continue
+            seen.add(info.id)
+            username = info.username.lower() if info.username else None
+            peers.append((info.id, info.access_hash, info.storage_type, username, None))
+        if peers:
+            await client.storage.update_peers(peers)
+        return len(peers)
+
+    def load(self):
+        """Load persisted entries, dropping anything already expired"""
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except FileNotFoundError:
+            return 0
+        except (OSError, ValueError) as e:
+            logger.warning(f"⚠️ Could not load peer cache {self.path}: {e}")
+            return 0
+
+        now = time.time()
+        for key, record in data.items():
+            info = PeerInfo.from_dict(record)
+            if now - info.fetched_at <= self.ttl:
+                self._entries[key] = info
+        self._dirty = False
+        return len(self._entries)
+
+    def save(self):
+        """Atomically write the cache to disk if anything changed"""
+        if not self._dirty:
+            return
+        tmp_path = f"{self.path}.tmp"
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump({key: info.to_dict() for key, info in self._entries.items()}, f)
+            os.replace(tmp_path, self.path)
+            self._dirty = False
+        except OSError as e:
+            logger.warning(f"⚠️ Could not save peer cache {self.path}: {e}")
+
+    async def autosave(self, interval=60):
+        """Background task that periodically persists the cache"""
+        while True:
+            await asyncio.sleep(interval)
+            self.save()
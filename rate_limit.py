@@ -0,0 +1,122 @@
+"""
+API rate limiting for Telegram Vault Userbot
+A shared token bucket for all API calls plus FloodWait-aware pauses per method or peer
+"""
+import asyncio
+import logging
+import re
+import time
+from pyrogram.errors import FloodWait
+import metrics
+
+logger = logging.getLogger(__name__)
+
+FLOOD_WAIT_RE = re.compile(r"(?:FLOOD_WAIT_|SLOWMODE_WAIT_|A wait of )(\d+)")
+
+
+def flood_wait_seconds(error):
+    """Return the wait Telegram asked for, or None if the error is not a flood wait"""
+    if isinstance(error, FloodWait):
+        return int(error.value)
+    match = FLOOD_WAIT_RE.search(str(error))
+    return int(match.group(1)) if match else None
+
+
+async def limited_call(limiter, method, factory, peer=None):
+    """await factory() through `limiter` (ApiLimiter.call), or directly when there is none"""
+    if limiter is None:
+        return await factory()
+    return await limiter.call(method, factory, peer=peer)
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, bursts up to `capacity`"""
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens=1):
+        # The lock keeps waiters FIFO so one busy task can't starve the others
+        async with self._lock:
+            self._refill()
+            while self._tokens < tokens:
+                await asyncio.sleep((tokens - self._tokens) / self.rate)
+                self._refill()
+            self._tokens -= tokens
+
+
+class FloodGate:
+    """Tracks keys (API methods or peers) that Telegram told us to leave alone for a while"""
+
+    def __init__(self):
+        self._until = {}
+
+    def pause(self, key, seconds):
+        until = time.monotonic() + seconds
+        if until > self._until.get(key, 0):
+            self._until[key] = until
+
+    def remaining(self, key):
+        until = self._until.get(key)
+        if until is None:
+            return 0
+        left = until - time.monotonic()
+        if left <= 0:
+            del self._until[key]
+            return 0
+        return left
+
+    async def wait(self, key):
+        left = self.remaining(key)
+        while left > 0:
+            await asyncio.sleep(left)
+            left = self.remaining(key)
+
+
+class ApiLimiter:
+    """
+    Gate every Telegram API call through one token bucket
+    A FloodWait pauses only the method it was raised for (SLOWMODE_WAIT pauses only the peer),
+    then the error is re-raised so the caller can move on to other work
+    """
+
+    def __init__(self, rate=5, burst=10):
+        self.bucket = TokenBucket(rate, burst)
+        self.gate = FloodGate()
+        self.flood_waits = 0
+
+    def paused_for(self, method, peer=None):
+        """Seconds until a call to `method` on `peer` would be allowed again"""
+        left = self.gate.remaining(method)
+        if peer is not None:
+            left = max(left, self.gate.remaining(("peer", peer)))
+        return left
+
+    async def call(self, method, factory, peer=None):
+        await self.gate.wait(method)
+        if peer is not None:
+            await self.gate.wait(("peer", peer))
+        await self.bucket.acquire()
+        try:
+            return await factory()
+        except Exception as e:
+            seconds = flood_wait_seconds(e)
+            if seconds is not None:
+                self.flood_waits += 1
+                metrics.flood_waits.inc(1, method)
+                if "SLOWMODE_WAIT" in str(e) and peer is not None:
+                    self.gate.pause(("peer", peer), seconds)
+                    logger.warning("⏳ Slow mode on %s: pausing it for %ss", peer, seconds)
+                else:
+                    self.gate.pause(method, seconds)
+                    logger.warning("⏳ FloodWait on %s: pausing it for %ss", method, seconds)
+            raise
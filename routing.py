@@ -0,0 +1,103 @@
+"""
+Routing table for Telegram Vault Userbot
+Immutable lookup structures built from the pinned config, usable as a dispatch filter
+"""
+import re
+from pyrogram import filters
+from pyrogram.enums import ChatType
+
+# Admin commands are handled by admin_command_handler, never forwarded
+ADMIN_COMMAND_RE = re.compile(r"^/(add|remove)\s+(user|channel|group)\s+(-?\d+)", re.I)
+
+
+def _normalize_username(value):
+    """Lowercase a username and strip the leading @"""
+    return value.lstrip("@").lower()
+
+
+class RoutingTable:
+    """
+    Frozen snapshot of the monitored targets
+    Every check is a set lookup, so the cost per update does not grow with the target count
+    """
+    __slots__ = ("user_ids", "chat_ids", "usernames", "owner_id")
+
+    def __init__(self, user_ids=(), chat_ids=(), owner_id=None):
+        chats, usernames = set(), set()
+        for target in chat_ids:
+            if isinstance(target, str):
+                if target.lstrip("-").isdigit():
+                    chats.add(int(target))
+                else:
+                    usernames.add(_normalize_username(target))
+            else:
+                chats.add(target)
+        self.user_ids = frozenset(int(u) for u in user_ids)
+        self.chat_ids = frozenset(chats)
+        self.usernames = frozenset(usernames)
+        self.owner_id = owner_id
+
+    def __len__(self):
+        return len(self.user_ids) + len(self.chat_ids) + len(self.usernames)
+
+    def _chat_matches(self, chat):
+        if chat.id in self.chat_ids:
+            return True
+        return bool(self.usernames and chat.username and _normalize_username(chat.username) in self.usernames)
+
+    def match(self, message):
+        """
+        Return the reason a message is monitored ("chat", "user", "saved", "sender_chat") or None
+        Ordered cheapest first; only integer set lookups happen for unmatched traffic
+        """
+        chat = message.chat
+        if chat is not None and self._chat_matches(chat):
+            return "chat"
+        user = message.from_user
+        if user is not None:
+            if user.id in self.user_ids:
+                return "user"
+        elif chat is not None and chat.id == self.owner_id and chat.type == ChatType.PRIVATE:
+            return "saved"
+        sender_chat = message.sender_chat
+        if sender_chat is not None and self._chat_matches(sender_chat):
+            return "sender_chat"
+        return None
+
+    def describe(self, message, reason):
+        """Build the human readable source line for a matched message (only called after a match)"""
+        chat = message.chat
+        chat_title = chat.title if chat else "Private Chat"
+        if reason == "chat":
+            sender = ""
+            if message.from_user:
+                sender = message.from_user.username or message.from_user.first_name
+            elif message.sender_chat:
+                sender = message.sender_chat.title or message.sender_chat.username
+            title = chat.title or chat.username or "Unknown"
+            return f"Group/Channel: {title} (ID: {chat.id}) | Sender: {sender}"
+        if reason == "user":
+            user = message.from_user
+            return f"User: {user.username or user.first_name} (ID: {user.id}) | Chat: {chat_title}"
+        if reason == "saved":
+            return f"User: me (ID: {self.owner_id}) | Chat: Saved Messages"
+        sender_chat = message.sender_chat
+        sender_title = sender_chat.title or sender_chat.username or "Unknown"
+        return f"Anonymous Admin: {sender_title} (ID: {sender_chat.id}) | Chat: {chat_title}"
+
+
+def dispatch_filter(get_table):
+    """
+    Build a Pyrogram filter that drops non-monitored updates at dispatch time
+    get_table is called per update so admin commands can swap the table without re-registering handlers
+    """
+    # Must be a coroutine: Pyrogram runs plain-function filters in its thread pool executor
+    async def func(flt, client, message):
+        if message.edit_date:
+            return False
+        if get_table().match(message) is None:
+            return False
+        text = message.text
+        return not (text and ADMIN_COMMAND_RE.match(text.strip()))
+
+    return filters.create(func, "RoutingFilter")
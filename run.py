@@ -1,14 +1,28 @@
 """
 Telegram Vault - Userbot Launcher
+Usage: python run.py                              run the userbot
+       python run.py backfill [<chat> [from] [to]]  copy a chat's history to the vault and exit
+                                                  (no chat: resume every unfinished backfill)
 """
 import sys
 from config import Config
+from backfill import parse_backfill_args
 
-def main():
+def main(args=()):
     """
-    Launch the userbot
+    Launch the userbot, or run a backfill with `backfill` as the first argument
     """
     try:
+        if args and args[0] == "backfill":
+            try:
+                backfill = parse_backfill_args(args[1:])
+            except ValueError as e:
+                print(f"❌ Usage: python run.py backfill [<chat> [from] [to]] ({e})")
+                sys.exit(2)
+            print("⏮️ Starting Telegram Vault backfill...")
+            import userbot
+            userbot.main(backfill=backfill)
+            return
         print("👤 Starting Telegram Vault Userbot...")
         import userbot
         userbot.main()
@@ -26,4 +40,4 @@ if __name__ == '__main__':
     print("      TELEGRAM VAULT - USERBOT")
     print("=" * 60)
     print()
-    main()
+    main(sys.argv[1:])
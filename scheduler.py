@@ -0,0 +1,140 @@
+"""
+Adaptive polling scheduler for Telegram Vault Userbot
+Priority queue of channels keyed by next due time; each channel's interval follows its posting rate
+"""
+import heapq
+import time
+from chat_state import ChatTable
+
+
+class PollScheduler:
+    """
+    Min-heap of (due_time, chat_id) with lazy deletion
+    After every poll the channel's posting rate is folded into an EWMA and the next interval is
+    chosen so that roughly one new message is expected per poll, clamped to [min_interval, max_interval].
+    Channels in the fast lane are always polled every fast_interval seconds.
+    Per-channel state lives in the interval/rate/last_polled/next_due/errors columns of a ChatTable.
+    """
+
+    def __init__(self, default_interval=180, min_interval=30, max_interval=1800, fast_interval=15, smoothing=0.3,
+                 table=None):
+        self.default_interval = default_interval
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.fast_interval = fast_interval
+        self.smoothing = smoothing
+        self.fast_lane = frozenset()
+        self.table = table if table is not None else ChatTable()
+        self._interval = self.table.column("interval")
+        self._rate = self.table.column("rate")
+        self._last_polled = self.table.column("last_polled")
+        self._due = self.table.column("next_due")
+        self._errors = self.table.column("errors")
+        self._heap = []
+        self._count = 0
+
+    def __len__(self):
+        return self._count
+
+    def _push(self, chat_id, due):
+        self._due[chat_id] = due
+        heapq.heappush(self._heap, (due, chat_id))
+
+    def sync(self, chat_ids, now=None):
+        """Track exactly `chat_ids`: new channels are due immediately, removed ones are dropped"""
+        now = time.monotonic() if now is None else now
+        wanted = set(chat_ids)
+        added = 0
+        for chat_id in wanted:
+            if chat_id in self._interval:
+                continue
+            added += 1
+            interval = self.fast_interval if chat_id in self.fast_lane else self.default_interval
+            self._interval[chat_id] = interval
+            # EWMA of messages per second, seeded so a new channel starts at its default interval
+            self._rate[chat_id] = 1.0 / interval
+            self._errors[chat_id] = 0
+            self._push(chat_id, now)
+        if self._count + added != len(wanted):
+            for chat_id in [c for c in self._interval if c not in wanted]:
+                for column in (self._interval, self._rate, self._last_polled, self._due, self._errors):
+                    column.pop(chat_id, None)
+        self._count = len(wanted)
+
+    def set_fast_lane(self, chat_ids, now=None):
+        """Pin channels to the fast lane; newly pinned channels are pulled forward"""
+        now = time.monotonic() if now is None else now
+        fast_lane = frozenset(chat_ids)
+        for chat_id in fast_lane.difference(self.fast_lane):
+            if chat_id not in self._interval:
+                continue
+            self._interval[chat_id] = self.fast_interval
+            due = self._due.get(chat_id)
+            if due is not None and due > now + self.fast_interval:
+                self._push(chat_id, now)
+        self.fast_lane = fast_lane
+
+    def pop_due(self, now=None):
+        """Remove and return every channel whose due time has passed; they are in flight until record()/defer()"""
+        now = time.monotonic() if now is None else now
+        due_ids = []
+        heap = self._heap
+        while heap and heap[0][0] <= now:
+            due, chat_id = heapq.heappop(heap)
+            if self._due.get(chat_id) != due:
+                continue  # stale entry: rescheduled or removed since it was pushed
+            del self._due[chat_id]
+            due_ids.append(chat_id)
+        return due_ids
+
+    def seconds_until_next(self, now=None):
+        now = time.monotonic() if now is None else now
+        heap = self._heap
+        while heap and self._due.get(heap[0][1]) != heap[0][0]:
+            heapq.heappop(heap)
+        if not heap:
+            return None
+        return max(0.0, heap[0][0] - now)
+
+    def record(self, chat_id, new_messages, now=None):
+        """Fold a poll result into the channel's rate estimate and schedule its next poll"""
+        now = time.monotonic() if now is None else now
+        if chat_id not in self._interval:
+            return None
+        rate = self._rate[chat_id]
+        last_polled = self._last_polled.get(chat_id)
+        if last_polled is not None:
+            elapsed = max(now - last_polled, 1.0)
+            rate += self.smoothing * (new_messages / elapsed - rate)
+            self._rate[chat_id] = rate
+        self._last_polled[chat_id] = now
+        self._errors[chat_id] = 0
+
+        if chat_id in self.fast_lane:
+            interval = self.fast_interval
+        else:
+            ideal = 1.0 / rate if rate > 0 else self.max_interval
+            interval = min(self.max_interval, max(self.min_interval, ideal))
+        self._interval[chat_id] = interval
+        self._push(chat_id, now + interval)
+        return interval
+
+    def defer(self, chat_id, seconds, now=None, error=False):
+        """
+        Put a channel back without a rate observation (errors, FloodWait, non-pollable chats)
+        With error=True the delay doubles with every consecutive failure, up to max_interval
+        """
+        now = time.monotonic() if now is None else now
+        if chat_id not in self._interval:
+            return
+        if error:
+            errors = self._errors.get(chat_id, 0) + 1
+            self._errors[chat_id] = errors
+            seconds = max(seconds, min(self.max_interval, seconds * 2 ** (errors - 1)))
+        self._push(chat_id, now + seconds)
+
+    def interval_of(self, chat_id):
+        return self._interval.get(chat_id)
+
+    def errors_of(self, chat_id):
+        return self._errors.get(chat_id, 0)
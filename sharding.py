@@ -0,0 +1,208 @@
+"""
+Multi-account sharding for Telegram Vault Userbot
+Monitored channels are spread over several sessions with a consistent-hash ring; an account
+that is flood-limited, disconnected or can't see a chat is skipped and the chat moves to the
+next account on the ring until it is usable again
+"""
+import bisect
+import hashlib
+import logging
+from pyrogram.errors import Forbidden, Unauthorized
+from rate_limit import flood_wait_seconds
+
+logger = logging.getLogger(__name__)
+
+
+def _point(key):
+    return int.from_bytes(hashlib.blake2b(key.encode("utf-8"), digest_size=8).digest(), "big")
+
+
+def is_channel_id(chat_id):
+    """Channel/supergroup IDs (-100...) have the same message IDs on every account"""
+    return isinstance(chat_id, int) and chat_id <= -1000000000000
+
+
+class HashRing:
+    """Consistent-hash ring with `replicas` virtual points per node"""
+
+    def __init__(self, nodes=(), replicas=100):
+        self.replicas = replicas
+        self._points = []
+        self._owners = {}
+        for node in nodes:
+            self.add(node)
+
+    def __len__(self):
+        return len(set(self._owners.values()))
+
+    def add(self, node):
+        for i in range(self.replicas):
+            point = _point(f"{node}#{i}")
+            if point not in self._owners:
+                self._owners[point] = node
+                bisect.insort(self._points, point)
+
+    def remove(self, node):
+        self._points = [p for p in self._points if self._owners[p] != node]
+        self._owners = {p: n for p, n in self._owners.items() if n != node}
+
+    def candidates(self, key):
+        """Every node in ring order starting from the owner of `key`"""
+        if not self._points:
+            return []
+        start = bisect.bisect(self._points, _point(str(key)))
+        seen = []
+        for i in range(len(self._points)):
+            node = self._owners[self._points[(start + i) % len(self._points)]]
+            if node not in seen:
+                seen.append(node)
+        return seen
+
+
+class Account:
+    """One logged-in session with its own API limiter (flood limits are per account)"""
+    __slots__ = ("name", "client", "limiter", "resolved", "inaccessible", "read_only")
+
+    def __init__(self, name, client, limiter):
+        self.name = name
+        self.client = client
+        self.limiter = limiter
+        self.resolved = set()
+        self.inaccessible = set()
+        # Chats (vaults) the account can see but not post in
+        self.read_only = set()
+
+    @property
+    def connected(self):
+        return getattr(self.client, "is_connected", True)
+
+
+class ShardManager:
+    """
+    Picks the account that handles a channel
+    Channels map to accounts by consistent hashing, so adding or removing an account only
+    moves that account's share. Non-channel chats always use the primary account because
+    their message IDs are per account.
+    """
+
+    def __init__(self, primary, rebalance_after=10, replicas=100):
+        self.primary = primary
+        self.rebalance_after = rebalance_after
+        self.accounts = {primary.name: primary}
+        self.ring = HashRing([primary.name], replicas)
+
+    def __len__(self):
+        return len(self.accounts)
+
+    def add(self, account):
+        self.accounts[account.name] = account
+        self.ring.add(account.name)
+
+    def remove(self, name):
+        if name != self.primary.name and self.accounts.pop(name, None) is not None:
+            self.ring.remove(name)
+            logger.warning(f"⚠️ Account {name} removed, its chats move to the remaining accounts")
+
+    def owner(self, chat_id):
+        """The account a channel hashes to, ignoring flood limits"""
+        if not is_channel_id(chat_id):
+            return self.primary
+        return self.accounts[self.ring.candidates(chat_id)[0]]
+
+    def pick(self, chat_id, method, skip=()):
+        """
+        First account in ring order that is connected, can see the chat and is not paused for
+        longer than rebalance_after; otherwise the least paused one (the primary as a last resort)
+        Accounts named in `skip` are passed over.
+        """
+        if not is_channel_id(chat_id):
+            return self.primary
+        best, best_wait = None, None
+        for name in self.ring.candidates(chat_id):
+            if name in skip:
+                continue
+            account = self.accounts[name]
+            if not account.connected or chat_id in account.inaccessible:
+                continue
+            wait = account.limiter.paused_for(method, chat_id)
+            if wait <= self.rebalance_after:
+                return account
+            if best is None or wait < best_wait:
+                best, best_wait = account, wait
+        return best or self.primary
+
+    def paused_for(self, chat_id, method):
+        """Seconds until any account may call `method` on chat_id"""
+        if not is_channel_id(chat_id):
+            return self.primary.limiter.paused_for(method, chat_id)
+        waits = [a.limiter.paused_for(method, chat_id) for a in self.accounts.values()
+                 if a.connected and chat_id not in a.inaccessible]
+        return min(waits) if waits else 0
+
+    async def ensure_peer(self, account, chat_id):
+        """
+        Make sure `account` can resolve chat_id, fetching it once if its session has never seen it
+        Returns False (and remembers it) when the account can't access the chat
+        """
+        if account is self.primary or chat_id in account.resolved:
+            return True
+        if chat_id in account.inaccessible:
+            return False
+        try:
+            await account.client.resolve_peer(chat_id)
+        except Exception:
+            try:
+                await account.limiter.call("get_chat", lambda: account.client.get_chat(chat_id))
+            except Exception as e:
+                if flood_wait_seconds(e) is not None:
+                    raise
+                logger.warning(f"⚠️ Account {account.name} can't access {chat_id}: {e}")
+                account.inaccessible.add(chat_id)
+                return False
+        account.resolved.add(chat_id)
+        return True
+
+    async def acquire(self, chat_id, method, also=()):
+        """
+        pick() an account that can resolve chat_id and every peer in `also` (e.g. the vault), and
+        is not known to be unable to post in one of them
+        """
+        skip = set()
+        while True:
+            account = self.pick(chat_id, method, skip)
+            if account is self.primary:
+                return account
+            if any(peer in account.read_only for peer in also):
+                skip.add(account.name)
+                continue
+            usable = await self.ensure_peer(account, chat_id)
+            for peer in also:
+                usable = usable and await self.ensure_peer(account, peer)
+            if usable:
+                return account
+            # Forget the chat on this account and try the next one on the ring
+            account.inaccessible.add(chat_id)
+
+    def retry_elsewhere(self, account, error, destination=None):
+        """
+        After `error` from an extra account, decide whether another account should take over:
+        a revoked session leaves the ring, and an account that may not post in `destination`
+        stops being picked for it. The primary is never rebalanced away from.
+        """
+        if account is self.primary:
+            return False
+        if isinstance(error, Unauthorized):
+            self.remove(account.name)
+            return True
+        if destination is not None and isinstance(error, Forbidden):
+            account.read_only.add(destination)
+            logger.warning(f"⚠️ Account {account.name} can't post in {destination}, its batches move on: {error}")
+            return True
+        return False
+
+    def assignment(self, chat_ids):
+        """{account name: number of channels it owns} for logging"""
+        counts = {name: 0 for name in self.accounts}
+        for chat_id in chat_ids:
+            counts[self.owner(chat_id).name] += 1
+        return counts
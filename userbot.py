@@ -1,429 +1,1028 @@
-async def get_monitored_ids_from_pinned(app, saved_messages_id):
-    """Read and parse monitored user/channel/group IDs from pinned message in Saved Messages."""
-    try:
-        chat = await app.get_chat(saved_messages_id)
-        pinned = chat.pinned_message
-        if not pinned or not pinned.text:
-            logger.warning("No pinned message found in Saved Messages.")
-            return [], [], []
-        # Example format:
-        # USERS: 123456789, 987654321
-        # CHANNELS: -1001234567890, -1009876543210
-        # GROUPS: -1001122334455
-        users, channels, groups = [], [], []
-        for line in pinned.text.splitlines():
-            if line.startswith("USERS:"):
-                users = [int(x.strip()) for x in line.replace("USERS:","").split(",") if x.strip()]
-            elif line.startswith("CHANNELS:"):
-                channels = [int(x.strip()) for x in line.replace("CHANNELS:","").split(",") if x.strip()]
-            elif line.startswith("GROUPS:"):
-                groups = [int(x.strip()) for x in line.replace("GROUPS:","").split(",") if x.strip()]
-        logger.info(f"Loaded from pinned: USERS={users}, CHANNELS={channels}, GROUPS={groups}")
-        return users, channels, groups
-    except Exception as e:
-        logger.error(f"Error reading pinned message in Saved Messages: {e}")
-        return [], [], []
 """
 Telegram Vault Userbot - User Mode
 Monitors all groups using your personal Telegram account
 """
 import logging
 import os
+import re
 import asyncio
+import time
 from pyrogram import Client, filters
 from pyrogram.types import Message
-from pyrogram.enums import ChatType
+from pyrogram.enums import ChatType, ParseMode
 from config import Config
+from routing import RoutingTable, ADMIN_COMMAND_RE, dispatch_filter
+from config_store import ConfigStore
+from content_filter import ContentFilter
+from peer_cache import PeerCache
+from rate_limit import ApiLimiter, flood_wait_seconds
+from scheduler import PollScheduler
+from chat_state import ChatTable
+from channel_sync import ChannelSync
+from history import MAX_PAGE_SIZE, iter_new_messages
+from checkpoints import CheckpointStore
+from archive import Archive
+from backfill import BackfillJob, BackfillStore, parse_backfill_args
+from forwarding import ForwardBatcher, forward_batch
+from fanout import VaultRouter
+from digest import RETRY_DELAY, DigestBuffer, render_digest
+from delivery import DeliveryQueue, PartialDelivery, is_transient
+from dedup import Deduplicator
+from media_copy import MediaCache, MediaCopier
+from sharding import Account, ShardManager
+from loop_watchdog import LoopWatchdog, profile as profile_loop, top_functions
+import metrics
+from log_config import HOT_DEBUG, setup_logging, parse_sample_rates
 
-# Configure logging
-logging.basicConfig(
-    format='%(asctime)s - %(name)s - %(levelname)s - %(message)s',
-    level=logging.INFO
-)
+# Configure logging - records are written by a background thread, never from the event loop
+setup_logging(Config.LOG_LEVEL, Config.LOG_JSON, parse_sample_rates(Config.LOG_SAMPLE))
 logger = logging.getLogger(__name__)
 
 # Suppress Pyrogram and asyncio errors for unknown peers
 logging.getLogger("pyrogram").setLevel(logging.WARNING)
 logging.getLogger("asyncio").setLevel(logging.WARNING)
 
+# Per-chat tracking state, one row of typed array columns per chat (see chat_state)
+chat_table = ChatTable()
+
 # Track last seen message ID for each channel (for polling)
-last_message_ids = {}
+last_message_ids = chat_table.column("last_id")
+
+# Channel pts delivered up to, the starting point of the next updates.GetChannelDifference
+channel_pts = chat_table.column("pts")
+
+# Channel message ID and pts polled up to, ahead of the two checkpoints above while fetched
+# batches are still being delivered, so a re-poll in the meantime doesn't queue them again
+poll_cursors = {}
+
+# Lowest message ID per channel whose batch was dead-lettered for a transient reason; the
+# checkpoints stay below it and the next poll fetches the channel again from there
+poll_holds = {}
+
+# Channels without a dialog pts (e.g. not joined); these stay on history paging
+pts_unsupported = set()
+
+# Durable copy of last_message_ids and channel_pts, flushed in batches
+checkpoint_store = CheckpointStore(Config.CHECKPOINT_DB)
+
+# Highest delivered message ID per realtime-only chat (supergroups, groups, private chats), so
+# the gap left by a restart or disconnect can be fetched and forwarded afterwards
+realtime_marks = chat_table.column("mark")
+realtime_store = CheckpointStore(Config.CHECKPOINT_DB, table="realtime_marks")
+
+# Set while a gap recovery pass is running; another disconnect in the meantime queues one more pass
+recovery_running = False
+recovery_again = False
+
+# Marks stay put while a gap may be unrecovered, so a live post can't move one past it: for every
+# chat from startup and each disconnect until a pass reaches every head. realtime_holds keeps a
+# chat's mark below the lowest message ID that may not have reached the vault (a failed recovery,
+# a dead-lettered batch) until the next recovery pass fetches the chat again
+recovery_pending = True
+realtime_holds = {}
+
+# Resumable historical backfills, stored next to the checkpoints; chat_id -> running task,
+# at most Config.BACKFILL_CONCURRENCY of them copying at once
+backfill_store = BackfillStore(Config.CHECKPOINT_DB)
+backfill_tasks = {}
+# Lowest message ID per backfilled chat that was dead-lettered for a transient reason; the job's cursor stays below it
+backfill_holds = {}
+backfill_slots = asyncio.Semaphore(Config.BACKFILL_CONCURRENCY)
+
+# Searchable local copy of everything delivered to the vault (optional)
+archive = Archive(Config.ARCHIVE_DB) if Config.ARCHIVE_DB else None
+
+# Footer written on text copies of forward-restricted messages: "🆔 Channel: <id> | Msg: <id>"
+COPIED_MESSAGE_RE = re.compile(r"🆔 Channel:\s*(-?\d+)\s*\|\s*Msg:\s*(\d+)")
 
-# Polling interval in seconds (3 minutes)
+# Default polling interval in seconds (3 minutes) - the scheduler adapts it per channel
 POLL_INTERVAL = 180
 
+# Longest the poll loop sleeps before re-checking the schedule and the target list
+POLL_TICK = 5
+
+# Seconds the poll loop waits after startup for the client to be fully ready
+POLL_STARTUP_DELAY = 10
+
+# API methods a poll calls; after a FloodWait the channel is retried once they are allowed again
+POLL_METHODS = ("get_chat", "get_chat_history", "get_peer_dialogs", "get_channel_difference")
+
+# Global API rate limiter shared by polling, metadata lookups and forwarding
+api_limiter = ApiLimiter(Config.API_RATE, Config.API_BURST)
+
+# Adaptive per-channel poll schedule
+poll_scheduler = PollScheduler(
+    POLL_INTERVAL, Config.POLL_MIN_INTERVAL, Config.POLL_MAX_INTERVAL, Config.POLL_FAST_INTERVAL, table=chat_table
+)
+
+# Shared peer metadata cache (get_chat / get_users / get_me)
+peer_cache = PeerCache(Config.PEER_CACHE_PATH, Config.PEER_CACHE_TTL, Config.PEER_CACHE_SIZE, limiter=api_limiter)
+
+# Bounded-memory record of already delivered messages (realtime and polled)
+deduplicator = Deduplicator(
+    Config.DEDUP_PATH, Config.DEDUP_LRU_SIZE, Config.DEDUP_CAPACITY, content_hash=Config.DEDUP_CONTENT_HASH
+)
+
+# Re-uploads media from forward-restricted chats; file_unique_id cache avoids copying a file twice
+media_cache = MediaCache(Config.MEDIA_CACHE_PATH)
+media_copier = MediaCopier(
+    media_cache, Config.MEDIA_MAX_SIZE, Config.MEDIA_BUDGET, Config.MEDIA_SPOOL_SIZE, Config.MEDIA_TRANSFERS
+)
+
+# Spreads channel polling and forwarding over every logged-in account, created in main()
+shards = None
+
+# Per-chat forward batcher feeding the background delivery queue, both created in main()
+forward_batcher = None
+delivery_queue = None
+
+# Immutable routing table, rebuilt whenever the monitored targets change
+routing_table = RoutingTable()
+
+# Compiled keyword/regex rules from the pinned RULES section, replaced with each config snapshot
+content_filter = ContentFilter()
+
+# Main vault plus the extra vaults from the pinned ROUTES section, IDs parsed once
+vault_router = VaultRouter(Config.VAULT_CHAT_ID)
+
+
+# Matched messages from DIGEST targets, posted as periodic summaries instead of forwarded one by one
+digest_buffer = DigestBuffer(Config.DIGEST_INTERVAL, Config.DIGEST_MAX_ENTRIES)
+
+# Opt-in event-loop watchdog (stalls and slow handlers); /profile works without it
+watchdog = LoopWatchdog(Config.WATCHDOG_THRESHOLD, Config.WATCHDOG_SLOW_HANDLER) if Config.WATCHDOG_THRESHOLD > 0 else None
 
-async def message_handler(client: Client, message: Message):
+# Set while a /profile capture runs; one at a time
+profiling = False
+
+
+# Versioned monitored-target config backed by the pinned message in Saved Messages
+config_store = ConfigStore(write_delay=Config.CONFIG_WRITE_DELAY)
+
+
+def rebuild_routing_table(owner_id=None):
+    """Swap in a fresh routing table built from the current Config target lists"""
+    global routing_table
+    routing_table = RoutingTable(
+        Config.TARGET_USER_IDS,
+        Config.TARGET_CHANNEL_IDS,
+        owner_id if owner_id is not None else routing_table.owner_id
+    )
+    return routing_table
+
+
+def apply_config_snapshot(old, new):
+    """Publish a new config snapshot: fresh Config tuples (never mutated in place), routing table, filter, routes and digests"""
+    global content_filter, vault_router
+    Config.TARGET_USER_IDS = new.users
+    Config.TARGET_CHANNEL_IDS = new.channels + new.groups
+    Config.FAST_CHANNEL_IDS = new.fast
+    rebuild_routing_table()
+    if new.rules != old.rules:
+        content_filter = ContentFilter(new.rules)
+        logger.info(f"🔎 Content filter: {content_filter.rule_count} rule(s) for "
+                    f"{len(content_filter.rule_sets)} target(s)" + (" + global" if content_filter.default else ""))
+    if new.routes != old.routes:
+        vault_router = VaultRouter(Config.VAULT_CHAT_ID, new.routes)
+        logger.info(f"🧭 Vault routes: {len(vault_router)} route(s) to {len(vault_router.destinations)} vault(s)")
+    if new.digest != old.digest:
+        digest_buffer.configure(new.digest)
+        logger.info(f"🗞️ Digest mode for {len(digest_buffer.intervals)} target(s)")
+    logger.info(f"🔄 Config v{new.version}: USERS={list(new.users)}, CHANNELS={list(new.channels)}, "
+                f"GROUPS={list(new.groups)}, FAST={list(new.fast)}")
+
+
+config_store.subscribe(apply_config_snapshot)
+
+
+async def load_pinned_config(app, saved_messages_id):
+    """
+    Read monitored user/channel/group IDs from the pinned message in Saved Messages into config_store
+    Both "USERS: 1, 2" lines and the multi-line "👤 USERS:" layout from README.md are accepted
+    """
+    try:
+        chat = await api_limiter.call("get_chat", lambda: app.get_chat(saved_messages_id))
+        pinned = chat.pinned_message
+        if not pinned or not pinned.text:
+            logger.warning("No pinned message found in Saved Messages.")
+            return config_store.snapshot
+        config_store.load_text(pinned.text, pinned.id)
+    except Exception as e:
+        logger.error(f"Error reading pinned message in Saved Messages: {e}")
+    return config_store.snapshot
+
+
+async def message_handler(client: Client, message: Message, source="realtime"):
     """
     Handle incoming messages and forward if from target user, channel, or anonymous admin
+    Non-monitored updates are already dropped by the routing dispatch filter; gap recovery
+    feeds the messages it fetches through here too (source="recovery")
     """
     try:
-        should_forward = False
-        source_info = ""
-        
-        # Check 1: Message from a target channel/group (regardless of sender)
-        if message.chat.id in Config.TARGET_CHANNEL_IDS:
-            should_forward = True
-            chat_title = message.chat.title or message.chat.username or "Unknown"
-            sender = ""
-            if message.from_user:
-                sender = f"{message.from_user.username or message.from_user.first_name}"
-            elif message.sender_chat:
-                sender = f"{message.sender_chat.title or message.sender_chat.username}"
-            source_info = f"Group/Channel: {chat_title} (ID: {message.chat.id}) | Sender: {sender}"
-            logger.info(f"✅ Matched monitored channel/group: {source_info}")
-        
-        # Check 2: Regular user message (from target user) - check this regardless of chat
-        if message.from_user and message.from_user.id in Config.TARGET_USER_IDS:
-            should_forward = True
-            user_name = message.from_user.username or message.from_user.first_name
-            chat_title = message.chat.title if message.chat else "Private Chat"
-            source_info = f"User: {user_name} (ID: {message.from_user.id}) | Chat: {chat_title}"
-            logger.info(f"✅ Matched monitored user: {source_info}")
-        
-        # Debug: Log if message is from Anand specifically
-        if message.from_user and message.from_user.id == 1163970079:
-            logger.info(f"🔍 DEBUG: Message from Anand (1163970079) in chat {message.chat.id} - Monitored users: {Config.TARGET_USER_IDS}")
+        with metrics.match_seconds.time():
+            reason = routing_table.match(message)
+        if reason is None:
+            return
+        metrics.matched.inc(1, source)
+        if HOT_DEBUG:
+            logger.debug("✅ Matched monitored %s: %s", reason, routing_table.describe(message, reason))
         
-        # Check 3: Message from userbot owner in Saved Messages (special case)
-        if not message.from_user and message.chat.type.name == "PRIVATE":
-            me = await client.get_me()
-            if message.chat.id == me.id:
-                should_forward = True
-                source_info = f"User: {me.first_name} (ID: {me.id}) | Chat: Saved Messages"
-                logger.info(f"✅ Matched saved messages: {source_info}")
+        if not content_filter.allows(message, reason):
+            metrics.filtered.inc(1, source)
+            if HOT_DEBUG:
+                logger.debug("🔎 Filtered out message %s from %s", message.id, message.chat.id)
+            return
         
-        # Check 4: Anonymous admin or channel message (sender_chat) - for supergroups
-        if message.sender_chat:
-            sender_chat_id = message.sender_chat.id
-            sender_chat_title = message.sender_chat.title or message.sender_chat.username or "Unknown"
-            chat_title = message.chat.title if message.chat else "Private Chat"
-            
-            # Check if message is from target channel/group
-            if sender_chat_id in Config.TARGET_CHANNEL_IDS or \
-               (message.sender_chat.username and f"@{message.sender_chat.username}" in Config.TARGET_CHANNEL_IDS):
-                should_forward = True
-                source_info = f"Anonymous Admin: {sender_chat_title} (ID: {sender_chat_id}) | Chat: {chat_title}"
-                logger.info(f"✅ [REALTIME] Matched anonymous admin: {source_info}")
+        # The poller may already have delivered this post (or will, for polled channels)
+        if deduplicator.seen(message):
+            metrics.duplicates.inc()
+            logger.info("♻️ Skipping duplicate message %s from %s", message.id, message.chat.id,
+                        extra={"event": "duplicate", "chat_id": message.chat.id, "message_id": message.id})
+            return
         
-        if not should_forward:
-            # Debug: Always log if it's from Anand to see why it's not matching
-            from_user_id = message.from_user.id if message.from_user else "None"
-            if from_user_id == "1163970079":
-                logger.info(f"❌ DEBUG: Anand's message {message.id} not forwarded - Chat: {message.chat.id}, Monitored: {Config.TARGET_USER_IDS}")
-            elif from_user_id != "None" and int(from_user_id) % 10 == 0:  # Log every 10th user
-                logger.info(f"❌ No match found for message {message.id} from user {from_user_id}")
+        # Low-priority targets are summarized in their next digest instead
+        target = digest_buffer.target_for(message, reason)
+        if target is not None:
+            digest_buffer.add(target, message, reason, vault_router.destinations_for(message))
+            # Digest entries keep no Message to record on delivery, so buffering counts as accepted
+            deduplicator.record([message])
+            metrics.digested.inc()
             return
         
-        # Forward if matched
-        if should_forward:
-            logger.info(f"📩 FORWARDING: {source_info}")
+        # Forward if matched - album parts and bursts from the same chat share one forward call
+        logger.info("📩 FORWARDING: %s message %s from %s", reason, message.id, message.chat.id,
+                    extra={"event": "match", "chat_id": message.chat.id, "message_id": message.id, "reason": reason})
+        await enqueue(message)
             
+    except Exception as e:
+        logger.error("Error in message_handler: %s", e)
+
+
+async def enqueue(message):
+    """Hand a message claimed by deduplicator.seen() to the batcher, giving the claim back if that fails"""
+    try:
+        await forward_batcher.add(message)
+    except BaseException:
+        # Otherwise the message stays in flight forever and later polls or recovery skip it
+        deduplicator.release([message])
+        raise
+
+
+def advance_checkpoint(chat_id, message_id, pts=None):
+    """Record that everything up to message_id (and the channel's pts) in chat_id has been processed"""
+    if message_id is not None and message_id > last_message_ids.get(chat_id, 0):
+        last_message_ids[chat_id] = message_id
+        checkpoint_store.update(chat_id, message_id)
+    if pts is not None and pts > channel_pts.get(chat_id, 0):
+        channel_pts[chat_id] = pts
+        checkpoint_store.update_pts(chat_id, pts)
+
+
+def settled_up_to(message_id, *undelivered):
+    """message_id, or the ID before the lowest of `undelivered` (Nones ignored) when that is lower"""
+    held = [u for u in undelivered if u is not None]
+    if message_id is None or not held:
+        return message_id
+    return min(message_id, min(held) - 1)
+
+
+def poll_settled(channel_id, fetched_id, pts, held, undelivered):
+    """when_delivered callback of a poll: move the checkpoints, but not past a batch that has to be fetched again"""
+    if undelivered is not None:
+        poll_holds[channel_id] = min(undelivered, poll_holds.get(channel_id, undelivered))
+    limit = settled_up_to(fetched_id, held, undelivered, poll_holds.get(channel_id))
+    # The pts is past whatever is held back, so it only moves when nothing is
+    advance_checkpoint(channel_id, limit, pts if limit == fetched_id else None)
+
+
+def poll_cursor(channel_id):
+    """(message ID, pts) the next poll of channel_id starts after: whichever of fetched and delivered is further"""
+    fetched_id, fetched_pts = poll_cursors.get(channel_id, (0, None))
+    pts = channel_pts.get(channel_id)
+    if fetched_pts is not None and (pts is None or fetched_pts > pts):
+        pts = fetched_pts
+    return max(last_message_ids.get(channel_id, 0), fetched_id), pts
+
+
+def hold_realtime_mark(chat_id, message_id):
+    """Keep chat_id's mark below message_id until the next recovery pass fetches the chat again"""
+    realtime_holds[chat_id] = min(message_id, realtime_holds.get(chat_id, message_id))
+
+
+def realtime_settled(chat_id, message_id, held, undelivered):
+    """when_delivered callback of a recovery: move the mark, but not past a batch that has to be fetched again"""
+    if undelivered is not None:
+        hold_realtime_mark(chat_id, undelivered)
+    advance_realtime_mark(chat_id, settled_up_to(message_id, held, undelivered, realtime_holds.get(chat_id)))
+
+
+def advance_realtime_mark(chat_id, message_id):
+    if message_id is not None and message_id > realtime_marks.get(chat_id, 0):
+        realtime_marks[chat_id] = message_id
+        realtime_store.update(chat_id, message_id)
+
+
+async def initialize_realtime_marks(client: Client):
+    """
+    Load the stored high-water marks and start a mark at the current head for realtime targets
+    (supergroups, groups, private chats of monitored users) that don't have one yet
+    """
+    realtime_marks.update(realtime_store.load())
+    chat_ids = [user_id for user_id in Config.TARGET_USER_IDS if not isinstance(user_id, str)]
+    for chat_id in Config.TARGET_CHANNEL_IDS:
+        if isinstance(chat_id, str) or chat_id in realtime_marks:
+            continue
+        try:
+            chat = await peer_cache.get_chat(client, chat_id)
+        except Exception:
+            continue
+        if chat.type_name in ("SUPERGROUP", "GROUP"):
+            chat_ids.append(chat_id)
+    missing = [chat_id for chat_id in dict.fromkeys(chat_ids) if chat_id not in realtime_marks]
+    semaphore = asyncio.Semaphore(Config.RECOVERY_CONCURRENCY)
+
+    async def start_mark(chat_id):
+        async with semaphore:
             try:
-                # Try to parse vault chat ID as integer (for user/group IDs)
-                try:
-                    vault_id = int(Config.VAULT_CHAT_ID)
-                except ValueError:
-                    # If not an integer, use as-is (could be @username)
-                    vault_id = Config.VAULT_CHAT_ID
-                
-                await message.forward(vault_id)
-                
-                logger.info(f"✅ SUCCESS: Forwarded message {message.id} to vault")
-                
+                async def fetch_head():
+                    return [msg async for msg in client.get_chat_history(chat_id, limit=1)]
+                head = await api_limiter.call("get_chat_history", fetch_head, peer=chat_id)
+                advance_realtime_mark(chat_id, head[0].id if head else 0)
             except Exception as e:
-                logger.error(f"❌ FAILED: Forward message {message.id}: {str(e)}")
-            
-    except Exception as e:
-        logger.error(f"Error in message_handler: {str(e)}")
+                logger.warning(f"⚠️ Could not start a recovery mark for {chat_id}: {e}")
+
+    await asyncio.gather(*(start_mark(chat_id) for chat_id in missing))
+    realtime_store.flush()
+    logger.info(f"🧷 {len(realtime_marks)} realtime chat(s) tracked for gap recovery ({len(missing)} new)")
+
+
+async def recover_chat_gap(client: Client, chat_id):
+    """
+    Feed every message after chat_id's mark through message_handler, oldest first, up to the head;
+    the mark moves every Config.RECOVERY_MAX_PER_CHAT messages once those are delivered. Returns how many
+    """
+    account = await shards.acquire(chat_id, "get_chat_history")
+    scanned = 0
+    last_id = None
+    # Everything after the mark is fetched again, including what an earlier failure held back
+    realtime_holds.pop(chat_id, None)
+
+    async def settle():
+        # Unmatched messages are done too, so the mark moves past everything scanned so far
+        await forward_batcher.flush(chat_id)
+        settled, held = last_id, realtime_holds.get(chat_id)
+        delivery_queue.when_delivered(
+            chat_id, lambda undelivered: realtime_settled(chat_id, settled, held, undelivered)
+        )
+
+    async for msg in iter_new_messages(account.client, chat_id, realtime_marks.get(chat_id, 0), limiter=account.limiter):
+        last_id = msg.id
+        scanned += 1
+        await message_handler(client, msg, source="recovery")
+        if scanned % Config.RECOVERY_MAX_PER_CHAT == 0:
+            await settle()
+            if delivery_queue.saturated:
+                await delivery_queue.wait_for_capacity()
+    if last_id is not None and scanned % Config.RECOVERY_MAX_PER_CHAT:
+        await settle()
+    return scanned
+
+
+async def recover_realtime_gaps(client: Client):
+    """
+    Catch up every realtime-only chat from its high-water mark after a startup or reconnect
+    Chats are fetched Config.RECOVERY_CONCURRENCY at a time under their account's limiter;
+    messages that also arrive live are dropped by the deduplicator
+    """
+    global recovery_running, recovery_again, recovery_pending
+    if recovery_running:
+        recovery_again = True
+        return
+    recovery_running = True
+    try:
+        while True:
+            recovery_again = False
+            started = time.monotonic()
+            semaphore = asyncio.Semaphore(Config.RECOVERY_CONCURRENCY)
+
+            async def recover(chat_id):
+                async with semaphore:
+                    try:
+                        scanned = await recover_chat_gap(client, chat_id)
+                    except Exception as e:
+                        # Nothing after the mark is known to be delivered
+                        hold_realtime_mark(chat_id, realtime_marks.get(chat_id, 0) + 1)
+                        logger.warning(f"⚠️ Gap recovery failed for {chat_id}, its mark stays frozen: {e}")
+                        return 0
+                    return scanned
+
+            counts = await asyncio.gather(*(recover(chat_id) for chat_id in list(realtime_marks)))
+            logger.info(f"🩹 Gap recovery scanned {sum(counts)} message(s) in {sum(1 for c in counts if c)} "
+                        f"of {len(counts)} chat(s) in {time.monotonic() - started:.1f}s")
+            if not recovery_again:
+                # Every chat reached its head (or is in realtime_holds); live delivery may move marks again
+                recovery_pending = False
+                break
+    finally:
+        recovery_running = False
+
+
+def album_tail(messages):
+    """Index where the album `messages` ends with starts (len(messages) if the last one is not in an album)"""
+    group_id = messages[-1].media_group_id if messages else None
+    cut = len(messages)
+    while group_id and cut > 0 and messages[cut - 1].media_group_id == group_id:
+        cut -= 1
+    return cut
+
+
+async def deliver_backfill_page(job, page, hold_album=False):
+    """
+    Queue one page of a backfill and move the job's cursor once the vault has it; with hold_album
+    an album cut off by the page end is returned instead, to go out whole with the next page
+    """
+    held = []
+    if hold_album:
+        cut = album_tail(page)
+        if cut > 0:
+            page, held = page[:cut], page[cut:]
+    for msg in page:
+        metrics.matched.inc(1, "backfill")
+        if not content_filter.allows(msg):
+            metrics.filtered.inc(1, "backfill")
+            continue
+        if deduplicator.seen(msg):
+            metrics.duplicates.inc()
+            continue
+        await enqueue(msg)
+    await forward_batcher.flush(job.chat_id)
+    cursor, held = page[-1].id, backfill_holds.get(job.chat_id)
+    delivery_queue.when_delivered(job.chat_id, lambda undelivered: backfill_settled(job, cursor, held, undelivered))
+    # Live traffic shares the queue; a long backfill waits for it to drain instead of filling it
+    if delivery_queue.saturated:
+        await delivery_queue.wait_for_capacity()
+    return held
+
+
+def backfill_settled(job, cursor, held, undelivered):
+    """when_delivered callback of a backfill page: move the job's cursor, but not past a batch that has to be fetched again"""
+    if undelivered is not None:
+        backfill_holds[job.chat_id] = min(undelivered, backfill_holds.get(job.chat_id, undelivered))
+    limit = settled_up_to(cursor, held, undelivered, backfill_holds.get(job.chat_id))
+    backfill_store.advance(job, limit)
+
+
+async def backfill_chat(client: Client, job):
+    """Copy the rest of job's range to the vault oldest first, one history page at a time; returns how many were scanned"""
+    # The cursor never passed what an earlier run failed to deliver, so this run fetches it again
+    backfill_holds.pop(job.chat_id, None)
+    account = await shards.acquire(job.chat_id, "get_chat_history")
+    scanned = 0
+    page = []
+    async for msg in iter_new_messages(
+        account.client, job.chat_id, job.cursor, max_messages=job.last_id - job.cursor, limiter=account.limiter
+    ):
+        if msg.id > job.last_id:
+            break
+        scanned += 1
+        page.append(msg)
+        if len(page) >= MAX_PAGE_SIZE:
+            page = await deliver_backfill_page(job, page, hold_album=True)
+    if page:
+        await deliver_backfill_page(job, page)
+    delivered = asyncio.get_running_loop().create_future()
+    delivery_queue.when_delivered(job.chat_id, lambda undelivered: delivered.done() or delivered.set_result(undelivered))
+    undelivered = await delivered
+    if undelivered is not None or job.chat_id in backfill_holds:
+        # The cursor stays before it, so the next run (or the next start) copies the rest
+        held = min(u for u in (undelivered, backfill_holds.get(job.chat_id)) if u is not None)
+        raise RuntimeError(f"message {held} and later were not delivered")
+    # Deleted messages at the end of the range leave nothing to deliver, but the job is done
+    backfill_store.advance(job, job.last_id)
+    backfill_store.flush()
+    return scanned
+
+
+async def run_backfill(client: Client, job):
+    async with backfill_slots:
+        started = time.monotonic()
+        logger.info(f"⏮️ Backfilling {job.describe()}")
+        try:
+            scanned = await backfill_chat(client, job)
+            logger.info(f"✅ Backfill of {job.chat_id} finished: {scanned} message(s) in {time.monotonic() - started:.0f}s")
+        except Exception as e:
+            logger.warning(f"⚠️ Backfill of {job.chat_id} stopped at {job.cursor}, it resumes from there: {e}")
+        finally:
+            backfill_tasks.pop(job.chat_id, None)
+
+
+def start_backfill(client: Client, job):
+    """Run a job in the background (it waits for a free slot); returns its task"""
+    task = backfill_tasks[job.chat_id] = asyncio.ensure_future(run_backfill(client, job))
+    return task
+
+
+async def new_backfill_job(client: Client, chat_id, first_id=None, last_id=None):
+    """
+    Store a job for chat_id (an ID or @username), replacing any earlier one for that chat
+    `first_id` defaults to the start of the chat and `last_id` to its current head; newer posts
+    are left to the live handler and the poller
+    """
+    chat = await peer_cache.get_chat(client, chat_id)
+    if last_id is None:
+        account = await shards.acquire(chat.id, "get_chat_history")
+        async def fetch_head():
+            return [msg.id async for msg in account.client.get_chat_history(chat.id, limit=1)]
+        head = await account.limiter.call("get_chat_history", fetch_head, peer=chat.id)
+        last_id = head[0] if head else 0
+    return backfill_store.start(BackfillJob(chat.id, first_id or 1, last_id))
+
+
+async def run_backfill_command(client: Client, args):
+    """`run.py backfill`: run the given job, or resume every unfinished one, and return when all are done"""
+    jobs = [await new_backfill_job(client, *args)] if args else backfill_store.unfinished()
+    if not jobs:
+        logger.info("⏮️ No unfinished backfill jobs")
+        return
+    await asyncio.gather(*(start_backfill(client, job) for job in jobs))
+    unfinished = backfill_store.unfinished()
+    if unfinished:
+        logger.warning(f"⚠️ {len(unfinished)} backfill job(s) stopped early, run again to resume")
+
+
+async def recover_checkpoints_from_vault(client: Client, missing):
+    """
+    Fallback recovery: rebuild checkpoints for `missing` chats from the last 100 vault posts
+    Used only for chats the checkpoint store has never seen (first run, lost database)
+    """
+    vault_id = vault_router.vault_id
+    
+    # Check last 100 messages in vault to find latest from each channel
+    async for msg in client.get_chat_history(vault_id, limit=100):
+        # Check forwarded messages
+        if msg.forward_from_chat:
+            source_chat_id = msg.forward_from_chat.id
+            if msg.forward_from_message_id and source_chat_id in missing:
+                missing.discard(source_chat_id)
+                advance_checkpoint(source_chat_id, msg.forward_from_message_id)
+                logger.info(f"   📌 {msg.forward_from_chat.title}: last forwarded ID = {msg.forward_from_message_id}")
+        
+        # Check copied messages (for forward-restricted channels)
+        elif msg.text:
+            # Parse: "🆔 Channel: -1002083547614 | Msg: 1942"
+            match = COPIED_MESSAGE_RE.search(msg.text)
+            if match:
+                source_chat_id, message_id = int(match.group(1)), int(match.group(2))
+                if source_chat_id in missing:
+                    missing.discard(source_chat_id)
+                    advance_checkpoint(source_chat_id, message_id)
+                    logger.info(f"   📌 Copied message from {source_chat_id}: last ID = {message_id}")
+        
+        if not missing:
+            break
 
 
 async def initialize_last_message_ids(client: Client):
     """
-    Initialize last_message_ids by reading vault to find last forwarded message from each channel
-    This allows the bot to survive restarts without missing messages
+    Initialize last_message_ids from the local checkpoint store (a single local read)
+    Chats without a stored checkpoint fall back to the local archive, a vault scan, then their current head
     """
     global last_message_ids
     
-    logger.info("🔍 Initializing last message IDs from vault...")
+    logger.info("🔍 Initializing last message IDs from checkpoint store...")
     
     try:
-        vault_id = int(Config.VAULT_CHAT_ID)
+        stored = checkpoint_store.load()
+        last_message_ids.update(stored)
+        channel_pts.update(checkpoint_store.load_pts())
+        logger.info(f"   💾 Loaded {len(stored)} checkpoint(s) and {len(channel_pts)} channel pts "
+                    f"from {Config.CHECKPOINT_DB}")
         
-        # Check last 100 messages in vault to find latest from each channel
-        async for msg in client.get_chat_history(vault_id, limit=100):
-            # Check forwarded messages
-            if msg.forward_from_chat:
-                source_chat_id = msg.forward_from_chat.id
-                if msg.forward_from_message_id and source_chat_id not in last_message_ids:
-                    last_message_ids[source_chat_id] = msg.forward_from_message_id
-                    logger.info(f"   📌 {msg.forward_from_chat.title}: last forwarded ID = {msg.forward_from_message_id}")
-            
-            # Check copied messages (for forward-restricted channels)
-            elif msg.text and "🆔 Channel:" in msg.text and "| Msg:" in msg.text:
-                try:
-                    # Parse: "🆔 Channel: -1002083547614 | Msg: 1942"
-                    lines = msg.text.split('\n')
-                    for line in lines:
-                        if "🆔 Channel:" in line:
-                            parts = line.split('|')
-                            channel_part = parts[0].replace("🆔 Channel:", "").strip()
-                            msg_part = parts[1].replace("Msg:", "").strip()
-                            
-                            source_chat_id = int(channel_part)
-                            message_id = int(msg_part)
-                            
-                            if source_chat_id not in last_message_ids:
-                                last_message_ids[source_chat_id] = message_id
-                                logger.info(f"   📌 Copied message from {source_chat_id}: last ID = {message_id}")
-                            break
-                except:
-                    pass
+        missing = {c for c in Config.TARGET_CHANNEL_IDS if not isinstance(c, str) and c not in last_message_ids}
+        if missing and archive is not None:
+            archived = archive.last_ids()
+            for channel_id in list(missing):
+                if channel_id in archived:
+                    missing.discard(channel_id)
+                    advance_checkpoint(channel_id, archived[channel_id])
+                    logger.info(f"   🗄️ {channel_id}: last archived ID = {archived[channel_id]}")
+        if missing:
+            logger.info(f"   🔍 Recovering {len(missing)} channel(s) from vault history...")
+            await recover_checkpoints_from_vault(client, missing)
         
         # For channels not in vault yet (or forward-restricted), get their current latest
-        for channel_id in Config.TARGET_CHANNEL_IDS:
-            if isinstance(channel_id, str) or channel_id in last_message_ids:
-                continue
-            
+        for channel_id in missing:
             try:
-                chat = await client.get_chat(channel_id)
+                chat = await peer_cache.get_chat(client, channel_id)
                 # Only initialize channels, skip supergroups
-                if chat.type.name == "SUPERGROUP":
+                if chat.type_name == "SUPERGROUP":
                     logger.info(f"   ⏭️ Skipping supergroup {chat.title} initialization - real-time only")
                     continue
                     
-                logger.info(f"   📍 Initializing {chat.title} (Type: {chat.type.name})")
+                logger.info(f"   📍 Initializing {chat.title} (Type: {chat.type_name})")
                 
                 # Get latest message ID
                 async for msg in client.get_chat_history(channel_id, limit=1):
-                    last_message_ids[channel_id] = msg.id
+                    advance_checkpoint(channel_id, msg.id)
                     logger.info(f"   📌 {chat.title}: initialized at current ID = {msg.id}")
                     break
             except:
                 pass
         
+        checkpoint_store.flush()
         logger.info(f"✅ Initialized tracking for {len(last_message_ids)} channels")
         
     except Exception as e:
-        logger.error(f"⚠️  Error initializing from vault: {e}")
+        logger.error(f"⚠️  Error initializing checkpoints: {e}")
 
 
 async def cache_all_peers_startup(app: Client):
-    """Cache all monitored targets and vault channel on startup"""
-    logger.info("🚀 Caching all peers on startup...")
-    
-    # All target IDs
-    user_ids = [993339693, 1290365086, 941927047, 582868822, 1010500439, 
-                1303354830, 6096714326, 1163970079, 1078883294, 5515536284, 5058858285]
-    
-    channel_ids = [-1003074469948, -1001150779891, -1001177289429, -1001521790999,
-                   -1002095518645, -1002083547614, -1001475939687, -1001827108721,
-                   -1001409153549, -1001515619731, -1001885622550]
+    """
+    Resolve every monitored target from the pinned config plus the vaults so their access hashes are
+    in the session before the first forward or poll. Peers restored from the local cache are skipped;
+    only new or stale ones hit the network, Config.WARMUP_CONCURRENCY at a time under api_limiter.
+    """
+    targets = [("user", user_id) for user_id in Config.TARGET_USER_IDS]
+    targets += [("chat", chat_id) for chat_id in Config.TARGET_CHANNEL_IDS]
+    targets += [("chat", vault_id) for vault_id in vault_router.destinations]
     
-    vault_id = int(Config.VAULT_CHAT_ID)
+    targets = list(dict.fromkeys(targets))
+    pending = []
+    for kind, peer_id in targets:
+        cached = peer_cache.peek(f"{kind}:{peer_id}")
+        if cached is None or cached.access_hash is None:
+            pending.append((kind, peer_id))
+    logger.info(f"🚀 Warming up {len(pending)} of {len(targets)} peer(s), {len(targets) - len(pending)} already cached")
+    if not pending:
+        return
     
-    # Cache users
-    for user_id in user_ids:
-        try:
-            user = await app.get_users(user_id)
-            logger.info(f"✅ Cached user: {user.first_name}")
-        except:
-            pass
+    semaphore = asyncio.Semaphore(Config.WARMUP_CONCURRENCY)
     
-    # Cache channels
-    for channel_id in channel_ids:
-        try:
-            chat = await app.get_chat(channel_id)
-            logger.info(f"✅ Cached channel: {chat.title}")
-        except:
-            pass
+    async def warm(kind, peer_id):
+        async with semaphore:
+            try:
+                if kind == "user":
+                    info = await peer_cache.get_user(app, peer_id, refresh=True)
+                else:
+                    info = await peer_cache.get_chat(app, peer_id, refresh=True)
+                await peer_cache.record_access_hash(app, f"{kind}:{peer_id}")
+                if HOT_DEBUG:
+                    logger.debug("✅ Cached %s %s: %s", kind, peer_id, info.title)
+                return True
+            except Exception as e:
+                level = logging.ERROR if peer_id in vault_router.destinations else logging.WARNING
+                logger.log(level, f"❌ Failed to cache {kind} {peer_id}: {e}")
+                return False
     
-    # Cache vault (CRITICAL)
+    started = time.monotonic()
+    results = await asyncio.gather(*(warm(kind, peer_id) for kind, peer_id in pending))
+    peer_cache.save()
+    logger.info(f"🎉 Cached {sum(results)}/{len(pending)} peer(s) in {time.monotonic() - started:.1f}s")
+
+
+async def poll_channel(client: Client, channel_id):
+    """
+    Poll a single channel for messages newer than its last seen ID and forward them in order
+    Returns the number of new messages, or None if the chat is not pollable or the poll failed;
+    FloodWaits are raised so the caller can retry as soon as the pause is over
+    """
     try:
-        vault = await app.get_chat(vault_id)
-        logger.info(f"✅ Cached vault: {vault.title}")
+        # Check if this is actually a channel (not a supergroup)
+        chat = await peer_cache.get_chat(client, channel_id)
+        
+        # Skip supergroups - only poll channels
+        if chat.type_name == "SUPERGROUP":
+            if HOT_DEBUG:
+                logger.debug("  ⏭️ Skipping supergroup %s - waiting for real-time admin messages", chat.title)
+            return None
+        
+        # Poll only channels
+        if HOT_DEBUG:
+            logger.debug("  📊 Polling %s (ID: %s, Type: %s)", chat.title, channel_id, chat.type_name)
+        
+        # History is read by whichever account the channel is sharded to
+        account = await shards.acquire(channel_id, "get_chat_history")
+        
+        # If not initialized from vault, start from 10 messages back to catch recent ones
+        if channel_id not in last_message_ids:
+            async def fetch_latest_ids():
+                # Keep only the IDs; each Message is released as soon as its id is read
+                return [msg.id async for msg in account.client.get_chat_history(channel_id, limit=10)]
+            message_ids = await account.limiter.call("get_chat_history", fetch_latest_ids, peer=channel_id)
+            if not message_ids:
+                return 0
+            # Start from 10 messages back (or earliest available)
+            start_id = message_ids[-1]
+            last_message_ids[channel_id] = start_id - 1  # Subtract 1 so we forward the last 10
+            logger.info(f"📌 New channel tracked: {chat.title} (will catch up from ID {start_id})")
+        
+        # A batch dead-lettered for a transient reason is fetched again, from the pts delivered before it
+        undelivered = poll_holds.pop(channel_id, None)
+        if undelivered is not None:
+            poll_cursors[channel_id] = (undelivered - 1, None)
+            logger.info(f"🔁 Fetching {chat.title} again from ID {undelivered}, an earlier batch was not delivered")
+        
+        # Stream everything after the poll cursor oldest-first, from the channel's difference since
+        # its pts (history pages when there is none); the batcher sends each full batch of 100 as it fills
+        new_count = 0
+        last_id = None
+        start_id, start_pts = poll_cursor(channel_id)
+        sync = ChannelSync(
+            account.client, channel_id, start_id, start_pts,
+            max_messages=Config.POLL_MAX_PER_CYCLE, limiter=account.limiter,
+            bootstrap=channel_id not in pts_unsupported
+        )
+        complete = False
+        try:
+            async for msg in sync:
+                # Log edited messages but don't skip them - channels often edit posts
+                if HOT_DEBUG and msg.edit_date:
+                    logger.debug("✏️ [POLL] Processing edited message %s from %s", msg.id, chat.title)
+                last_id = msg.id
+                new_count += 1
+                metrics.matched.inc(1, "poll")
+                # Filtered posts still count as processed so the checkpoint moves past them
+                if not content_filter.allows(msg):
+                    metrics.filtered.inc(1, "poll")
+                    continue
+                if deduplicator.seen(msg):
+                    metrics.duplicates.inc()
+                    continue
+                target = digest_buffer.target_for(msg)
+                if target is not None:
+                    digest_buffer.add(target, msg, destinations=vault_router.destinations_for(msg))
+                    deduplicator.record([msg])
+                    metrics.digested.inc()
+                    continue
+                await enqueue(msg)
+            complete = True
+        finally:
+            # Whatever reached the batcher is not fetched again, even if the rest of the poll failed;
+            # the pts only moves after a complete pass
+            pts = sync.pts if complete and sync.pts is not None else start_pts
+            if last_id is not None or pts is not None:
+                poll_cursors[channel_id] = (last_id or start_id, pts)
+        
+        if sync.bootstrap_failed:
+            pts_unsupported.add(channel_id)
+        fetched_id = poll_cursors[channel_id][0] if channel_id in poll_cursors else None
+        if fetched_id is not None and fetched_id > last_message_ids.get(channel_id, 0):
+            # Queue the tail of the burst (and anything an earlier failed poll left behind); the
+            # checkpoint moves once the vault has everything fetched so far
+            await forward_batcher.flush(channel_id)
+        else:
+            fetched_id = None
+        if fetched_id is not None or sync.pts is not None:
+            pts, held = sync.pts, poll_holds.get(channel_id)
+            delivery_queue.when_delivered(
+                channel_id, lambda undelivered: poll_settled(channel_id, fetched_id, pts, held, undelivered)
+            )
+        if sync.too_long:
+            logger.info("📜 Difference for %s was too long, caught up from history", chat.title)
+        
+        if HOT_DEBUG and (sync.edited or sync.deleted):
+            logger.debug("✏️ %s: %s edit(s), %s deletion(s) since the last sync", chat.title, sync.edited, sync.deleted)
+        logger.info("📬 Checked %s: %s new message(s)", chat.title, new_count,
+                    extra={"event": "poll.checked", "chat_id": channel_id, "new": new_count,
+                           "mode": "difference" if sync.used_difference and not sync.too_long else "history"})
+        return new_count
+        
     except Exception as e:
-        logger.error(f"❌ Failed to cache vault: {e}")
-    
-    # Cache Silicon Stories by username
-    try:
-        silicon = await app.get_chat("@GetHired01")
-        logger.info(f"✅ Cached Silicon Stories: {silicon.title}")
-    except:
-        pass
-    
-    logger.info("🎉 All peers cached successfully!")
+        if flood_wait_seconds(e) is not None:
+            raise
+        logger.warning("⚠️  Error polling channel %s: %s", channel_id, e)
+        return None
 
 
 async def poll_channels(client: Client):
     """
     Background task to poll channels for new messages
-    Channels don't send real-time updates to regular subscribers, so we poll them periodically
+    Channels don't send real-time updates to regular subscribers, so we poll them periodically;
+    a channel with a known pts costs one updates.GetChannelDifference call per poll (see channel_sync)
+    poll_scheduler decides when each channel is due: busy channels are polled often, quiet ones
+    back off towards Config.POLL_MAX_INTERVAL, and FAST channels from the pinned config stay on
+    the fast lane. Up to Config.POLL_CONCURRENCY channels are polled at once, each by the account
+    it is sharded to; every account's limiter keeps its request rate in check and isolates
+    FloodWaits to the method that caused them
     """
     global last_message_ids
     
     # Wait for client to be fully ready
-    await asyncio.sleep(10)
+    await asyncio.sleep(POLL_STARTUP_DELAY)
     
     logger.info("🔄 Starting channel polling task...")
     
     # Initialize by reading vault to find last forwarded messages
     await initialize_last_message_ids(client)
     
-    logger.info(f"⏱️  Checking channels every {POLL_INTERVAL} seconds")
+    logger.info(
+        f"⏱️  Polling channels every {Config.POLL_MIN_INTERVAL}-{Config.POLL_MAX_INTERVAL}s depending on activity "
+        f"(fast lane {Config.POLL_FAST_INTERVAL}s, {Config.POLL_CONCURRENCY} at a time)"
+    )
+    
+    semaphore = asyncio.Semaphore(Config.POLL_CONCURRENCY)
+    in_flight = set()
+    
+    async def poll_scheduled(channel_id):
+        async with semaphore:
+            with metrics.poll_seconds.time():
+                try:
+                    new_count = await poll_channel(client, channel_id)
+                except Exception:
+                    # A FloodWait: the limiter has paused the method, so come back once it is allowed
+                    # again, but no later than the channel's own interval (a paused call just waits there)
+                    paused = max(shards.paused_for(channel_id, method) for method in POLL_METHODS)
+                    retry_in = min(max(paused, 1), poll_scheduler.interval_of(channel_id) or POLL_INTERVAL)
+                    logger.info(f"⏳ Polling {channel_id} hit a FloodWait, retrying in {retry_in:.0f}s")
+                    poll_scheduler.defer(channel_id, retry_in)
+                    return
+        if new_count is not None and new_count >= Config.POLL_MAX_PER_CYCLE:
+            # Hit the per-cycle cap mid-burst - come straight back for the rest
+            poll_scheduler.record(channel_id, new_count)
+            poll_scheduler.defer(channel_id, 1)
+        elif new_count is None:
+            # Supergroups are real-time only and errors shouldn't be retried in a tight loop;
+            # each consecutive failure doubles the wait up to POLL_MAX_INTERVAL
+            retry_in = POLL_INTERVAL
+            poll_scheduler.defer(channel_id, retry_in, error=True)
+        else:
+            interval = poll_scheduler.record(channel_id, new_count)
+            # None when the channel was removed from the config while it was being polled
+            if HOT_DEBUG and interval is not None:
+                logger.debug("  ⏱️ Next poll of %s in %.0fs", channel_id, interval)
     
     while True:
         try:
-            logger.info("🔄 Starting poll cycle...")
-            # Remove duplicates from channel list
-            unique_channels = list(set(Config.TARGET_CHANNEL_IDS))
-            for channel_id in unique_channels:
-                # Skip @username entries (handle them separately if needed)
-                if isinstance(channel_id, str):
-                    continue
-                
-                try:
-                    # Check if this is actually a channel (not a supergroup)
-                    chat = await client.get_chat(channel_id)
-                    
-                    logger.info(f"  🔍 Checking {chat.title} (ID: {channel_id}, Type: {chat.type.name})")
-                    
-                    # Skip supergroups - only poll channels
-                    if chat.type.name == "SUPERGROUP":
-                        logger.info(f"  ⏭️ Skipping supergroup {chat.title} - waiting for real-time admin messages")
-                        continue
-                    
-                    # Poll only channels
-                    logger.info(f"  📊 Polling {chat.title} (ID: {channel_id}, Type: {chat.type.name})")
-                    
-                    # Get the latest messages
-                    messages = []
-                    async for msg in client.get_chat_history(channel_id, limit=10):
-                        messages.append(msg)
-                    
-                    if not messages:
-                        continue
-                    
-                    # If not initialized from vault, start from 10 messages back to catch recent ones
-                    if channel_id not in last_message_ids:
-                        # Start from 10 messages back (or earliest available)
-                        start_id = messages[min(9, len(messages)-1)].id if len(messages) > 1 else messages[0].id
-                        last_message_ids[channel_id] = start_id - 1  # Subtract 1 so we forward the last 10
-                        logger.info(f"📌 New channel tracked: {chat.title} (will catch up from ID {start_id})")
-                        # Don't continue - let it forward the messages in this cycle
-                        pass
-                    
-                    # Check for new messages (messages are in reverse chronological order)
-                    new_messages = []
-                    for msg in reversed(messages):
-                        if msg.id > last_message_ids[channel_id]:
-                            new_messages.append(msg)
-                    
-                    logger.info(f"� Checked {chat.title}: {len(new_messages)} new message(s)")
-                    # Forward new messages
-                    if new_messages:
-                        last_message_ids[channel_id] = messages[0].id
-                        
-                        for msg in new_messages:
-                            try:
-                                # Log edited messages but don't skip them - channels often edit posts
-                                if msg.edit_date:
-                                    logger.info(f"✏️ [POLL] Processing edited message {msg.id} from {chat.title}")
-                                vault_id = int(Config.VAULT_CHAT_ID)
-                                logger.info(f"🔄 [POLL] Attempting to forward message {msg.id} from {chat.title}")
-                                try:
-                                    # Try to forward first
-                                    await msg.forward(vault_id)
-                                    logger.info(
-                                        f"✅ [POLL] Forwarded message {msg.id} from {chat.title} to vault"
-                                    )
-                                except Exception as forward_error:
-                                    error_str = str(forward_error)
-                                    # If forward fails (restricted), send as text copy instead
-                                    if "FORWARDS_RESTRICTED" in error_str or "CHAT_FORWARDS_RESTRICTED" in error_str:
-                                        text = msg.text or msg.caption or "[Media - forwarding restricted]"
-                                        await client.send_message(
-                                            vault_id,
-                                            f"📋 From: {chat.title}\n"
-                                            f"🆔 Channel: {channel_id} | Msg: {msg.id}\n"
-                                            f"📅 {msg.date}\n\n{text}"
-                                        )
-                                        logger.info(
-                                            f"✅ [POLL] Copied message {msg.id} from {chat.title} (forward restricted)"
-                                        )
-                                    elif "MESSAGE_ID_INVALID" in error_str:
-                                        logger.warning(f"⏭️ Skipped message {msg.id} in {chat.title}: MESSAGE_ID_INVALID")
-                                        # Try to copy as text instead
-                                        try:
-                                            text = msg.text or msg.caption or "[Media - message ID invalid]"
-                                            await client.send_message(
-                                                vault_id,
-                                                f"📋 From: {chat.title}\n"
-                                                f"🆔 Channel: {channel_id} | Msg: {msg.id}\n"
-                                                f"📅 {msg.date}\n\n{text}"
-                                            )
-                                            logger.info(f"✅ [POLL] Copied invalid message {msg.id} from {chat.title} as text")
-                                        except:
-                                            pass
-                                        continue
-                                    else:
-                                        raise  # Re-raise if it's a different error
-                            except Exception as e:
-                                logger.error(f"❌ Failed to forward polled message: {str(e)}")
-                    
-                except Exception as e:
-                    logger.warning(f"⚠️  Error polling channel {channel_id}: {str(e)}")
-                    continue
-                
-                # Small delay between channels to avoid rate limits
-                await asyncio.sleep(2)
+            # Skip @username entries (handle them separately if needed); duplicates collapse in the scheduler
+            poll_scheduler.sync(c for c in Config.TARGET_CHANNEL_IDS if not isinstance(c, str))
+            poll_scheduler.set_fast_lane(Config.FAST_CHANNEL_IDS)
+            if delivery_queue.saturated:
+                # Backpressure: leave due channels queued until the delivery workers catch up
+                logger.warning(f"⏸️ Delivery queue saturated ({len(delivery_queue)} batches), pausing polls")
+                await delivery_queue.wait_for_capacity()
+            for channel_id in poll_scheduler.pop_due():
+                task = asyncio.create_task(poll_scheduled(channel_id))
+                # Keep a reference until done so in-flight polls aren't garbage collected
+                in_flight.add(task)
+                task.add_done_callback(in_flight.discard)
             
         except Exception as e:
             logger.error(f"Error in polling task: {str(e)}")
         
-        # Wait before next poll cycle
-        await asyncio.sleep(POLL_INTERVAL)
+        # Sleep until the next channel is due (re-checking the target list at least every POLL_TICK)
+        wait = poll_scheduler.seconds_until_next()
+        await asyncio.sleep(POLL_TICK if wait is None else min(max(wait, 0.1), POLL_TICK))
 
 
-def main():
+async def post_digests(client: Client, force=False):
     """
-    Start the userbot
+    Post every due digest (every buffered one with force); like forwarded batches, each vault
+    gets the entries routed to it (the main vault all of them)
     """
-    try:
-        # Restore session from environment (supports chunked session for large files)
-        import base64
-        
-        # Try to get session from chunks first (for large sessions)
-        session_parts = []
-        for i in range(1, 11):  # Support up to 10 chunks
-            part = os.environ.get(f'SESSION_PART{i}')
-            if part:
-                session_parts.append(part)
-            else:
-                break
-        
-        if session_parts:
-            # Combine all chunks
+    for target in (digest_buffer.targets() if force else digest_buffer.due()):
+        title, entries = digest_buffer.take(target)
+        for entry in entries:
+            entry.destinations = entry.destinations or [vault_router.vault_id]
+        unsent, retry_in, sent = {}, 0, 0
+        for destination in dict.fromkeys(d for entry in entries for d in entry.destinations):
+            posts = render_digest(title, [entry for entry in entries if destination in entry.destinations])
+            for number, (text, _) in enumerate(posts):
+                try:
+                    await api_limiter.call(
+                        "send_message",
+                        lambda text=text, destination=destination: client.send_message(
+                            destination, text, parse_mode=ParseMode.DISABLED, disable_web_page_preview=True
+                        ),
+                        peer=destination
+                    )
+                except Exception as e:
+                    # This post and the ones after it go back into the buffer for a later tick, for this vault only
+                    for _, rest in posts[number:]:
+                        for entry in rest:
+                            unsent.setdefault(entry, []).append(destination)
+                    retry_in = max(retry_in, flood_wait_seconds(e) or RETRY_DELAY)
+                    logger.error(f"❌ FAILED: Digest for {title} to {destination}: {e}")
+                    break
+                sent += 1
+                metrics.digest_posts.inc()
+        if unsent:
+            for entry, destinations in unsent.items():
+                entry.destinations = destinations
+            digest_buffer.restore(target, title, [entry for entry in entries if entry in unsent], retry_in)
+            logger.warning(f"⚠️ Digest for {title}: {len(unsent)} entries kept for a retry in {retry_in}s")
+        else:
+            logger.info(f"🗞️ Posted digest for {title}: {len(entries)} entries in {sent} post(s)")
+
+
+async def digest_loop(client: Client):
+    while True:
+        wait = digest_buffer.seconds_until_next()
+        await asyncio.sleep(POLL_TICK if wait is None else min(max(wait, 0.1), POLL_TICK))
+        await post_digests(client)
+
+
+async def send_to_vault(chat_id, messages, destination):
+    """
+    Deliver one batch to one vault through the chat's shard (rebalanced while it is flood-limited,
+    and when an extra account turns out to be unable to post in the vault)
+    """
+    done = 0
+    while True:
+        account = await shards.acquire(chat_id, "forward_messages", also=(destination,))
+        try:
+            # Only main vault copies are archived, so /search links and recovered checkpoints point there
+            await forward_batch(
+                account.client, destination, chat_id, messages[done:], account.limiter, media_copier,
+                archive if destination == vault_router.vault_id else None
+            )
+            break
+        except Exception as e:
+            delivered, error = (e.delivered, e.error) if isinstance(e, PartialDelivery) else (0, e)
+            done += delivered
+            if not shards.retry_elsewhere(account, error, destination):
+                if done:
+                    raise PartialDelivery(done, error) from error
+                raise
+    # Only configured realtime targets have a mark (see initialize_realtime_marks), other chats a monitored
+    # user posts in are not tracked. Until recovery has fetched a chat's gap (or a dead-lettered batch)
+    # it owns the mark, so a live post can't move it past them
+    if (destination == vault_router.vault_id and chat_id in realtime_marks and not recovery_pending
+            and chat_id not in realtime_holds):
+        advance_realtime_mark(chat_id, messages[-1].id)
+
+
+def delivery_settled(chat_id, messages, destination):
+    """DeliveryQueue hook: what reached the main vault becomes a durable duplicate key"""
+    if destination == vault_router.vault_id:
+        deduplicator.record(messages)
+
+
+def delivery_failed(chat_id, messages, destination, error):
+    """
+    DeliveryQueue hook: dead-lettered messages are no longer duplicates. After a transient failure
+    they are fetched again: polled channels by their next poll (see poll_settled), realtime chats
+    by the next gap recovery, which until then keeps the chat's mark below them
+    """
+    if destination != vault_router.vault_id:
+        return
+    deduplicator.release(messages)
+    if is_transient(error) and chat_id in realtime_marks:
+        hold_realtime_mark(chat_id, min(m.id for m in messages))
+
+
+async def fan_out(chat_id, messages):
+    """ForwardBatcher sink: queue the batch once per destination vault, with only the messages routed there"""
+    for destination, batch in vault_router.split(messages):
+        await delivery_queue.put(chat_id, batch, destination)
+
+
+def restore_session(session_name, suffix=""):
+    """Write <session_name>.session from SESSION_PART1..10<suffix> chunks or SESSION_STRING<suffix>"""
+    import base64
+    
+    # Try to get session from chunks first (for large sessions)
+    session_parts = []
+    for i in range(1, 11):  # Support up to 10 chunks
+        part = os.environ.get(f'SESSION_PART{i}{suffix}')
+        if part:
+            session_parts.append(part)
+        else:
+            break
+    
+    if session_parts:
+        # Combine all chunks
+        try:
+            session_base64 = ''.join(session_parts)
+            session_data = base64.b64decode(session_base64)
+            with open(f"{session_name}.session", "wb") as f:
+                f.write(session_data)
+            logger.info(f"✓ Session {session_name} restored from {len(session_parts)} chunks")
+        except Exception as e:
+            logger.error(f"Error restoring session {session_name}: {str(e)}")
+    else:
+        # Try single SESSION_STRING (for backwards compatibility)
+        session_base64 = os.environ.get(f'SESSION_STRING{suffix}')
+        if session_base64:
             try:
-                session_base64 = ''.join(session_parts)
                 session_data = base64.b64decode(session_base64)
-                with open("vault_userbot.session", "wb") as f:
+                with open(f"{session_name}.session", "wb") as f:
                     f.write(session_data)
-                logger.info(f"✓ Session restored from {len(session_parts)} chunks")
+                logger.info(f"✓ Session {session_name} restored from environment variable")
             except Exception as e:
-                logger.error(f"Error restoring session: {str(e)}")
-        else:
-            # Try single SESSION_STRING (for backwards compatibility)
-            session_base64 = os.environ.get('SESSION_STRING')
-            if session_base64:
-                try:
-                    session_data = base64.b64decode(session_base64)
-                    with open("vault_userbot.session", "wb") as f:
-                        f.write(session_data)
-                    logger.info("✓ Session restored from environment variable")
-                except Exception as e:
-                    logger.warning(f"Could not restore session: {e}")
-        
+                logger.warning(f"Could not restore session {session_name}: {e}")
+
+
+def main(backfill=None):
+    """
+    Start the userbot
+    With `backfill` ((chat, from, to) from parse_backfill_args, or () to resume unfinished jobs)
+    run that backfill to the end and stop instead of running forever
+    """
+    try:
+        # Restore sessions from environment (supports chunked session for large files)
+        restore_session("vault_userbot")
+        for name in Config.EXTRA_SESSIONS:
+            restore_session(name, f"_{name.upper()}")
 
         # Create Pyrogram client
         app = Client(
@@ -433,26 +1032,54 @@ def main():
             phone_number=Config.PHONE_NUMBER
         )
         
+        # Extra accounts share the primary's checkpoints, dedup state and delivery queue
+        global forward_batcher, delivery_queue, shards
+        shards = ShardManager(Account("vault_userbot", app, api_limiter), Config.SHARD_REBALANCE_AFTER)
+        extra_clients = [
+            Client(name, api_id=Config.API_ID, api_hash=Config.API_HASH) for name in Config.EXTRA_SESSIONS
+        ]
+        
+        delivery_queue = DeliveryQueue(
+            send_to_vault,
+            workers=Config.DELIVERY_WORKERS,
+            max_size=Config.DELIVERY_QUEUE_SIZE,
+            max_attempts=Config.DELIVERY_MAX_ATTEMPTS,
+            max_flood_waits=Config.DELIVERY_MAX_FLOOD_WAITS,
+            on_delivered=delivery_settled,
+            on_failed=delivery_failed
+        )
+        # Handlers and the poller only enqueue; each batch becomes one delivery job per vault
+        forward_batcher = ForwardBatcher(fan_out, max_delay=Config.FORWARD_BATCH_DELAY)
+        
+        async def write_pinned_config(text):
+            # Edit the pinned config in place, or post and pin a new one if there is none yet
+            my_id = routing_table.owner_id
+            if config_store.pinned_id is not None:
+                await api_limiter.call(
+                    "edit_message_text", lambda: app.edit_message_text(my_id, config_store.pinned_id, text)
+                )
+            else:
+                sent = await api_limiter.call("send_message", lambda: app.send_message(my_id, text))
+                await api_limiter.call("pin_chat_message", lambda: sent.pin())
+                config_store.pinned_id = sent.id
+        
+        config_store.write = write_pinned_config
 
 
         async def startup_config():
             # Get own user ID after starting client
-            me = await app.get_me()
+            me = await peer_cache.get_me(app)
             my_id = me.id
+            rebuild_routing_table(my_id)
             # Read monitored IDs from pinned message in Saved Messages
-            users, channels, groups = await get_monitored_ids_from_pinned(app, my_id)
-            # Set config for monitoring
-            Config.TARGET_USER_IDS = users
-            Config.TARGET_CHANNEL_IDS = channels + groups
-            logger.info(f"Monitoring USERS: {users}")
-            logger.info(f"Monitoring CHANNELS/GROUPS: {channels + groups}")
+            await load_pinned_config(app, my_id)
             return my_id
 
         # Register admin command handler BEFORE generic handler - only for actual commands
-        @app.on_message(filters.me & filters.text & filters.regex(r"^/(add|remove)\s+(user|channel|group)\s+(-?\d+)"))
+        @app.on_message(filters.me & filters.text & filters.regex(ADMIN_COMMAND_RE))
         async def admin_command_handler(client, message):
             # Only handle commands in saved messages
-            me = await client.get_me()
+            me = await peer_cache.get_me(client)
             my_id = me.id
             if message.chat.id != my_id:
                 return
@@ -466,105 +1093,259 @@ def main():
             /remove channel <id>
             /remove group <id>
             """
-            import re
             cmd = message.text.strip()
             logger.info(f"🔧 Admin handler: Processing command: {cmd}")
-            match = re.match(r"/(add|remove)\s+(user|channel|group)\s+(-?\d+)", cmd, re.I)
+            match = ADMIN_COMMAND_RE.match(cmd)
             if not match:
                 return
             action, typ, id_str = match.groups()
-            id_val = int(id_str)
-            users, channels, groups = await get_monitored_ids_from_pinned(client, my_id)
-            changed = False
-            if action.lower() == "add":
-                if typ == "user" and id_val not in users:
-                    users.append(id_val)
-                    changed = True
-                elif typ == "channel" and id_val not in channels:
-                    channels.append(id_val)
-                    changed = True
-                elif typ == "group" and id_val not in groups:
-                    groups.append(id_val)
-                    changed = True
-            elif action.lower() == "remove":
-                if typ == "user" and id_val in users:
-                    users.remove(id_val)
-                    changed = True
-                elif typ == "channel" and id_val in channels:
-                    channels.remove(id_val)
-                    changed = True
-                elif typ == "group" and id_val in groups:
-                    groups.remove(id_val)
-                    changed = True
-            if changed:
-                # Build new config text
-                config_text = (
-                    f"USERS: {', '.join(str(u) for u in users)}\n"
-                    f"CHANNELS: {', '.join(str(c) for c in channels)}\n"
-                    f"GROUPS: {', '.join(str(g) for g in groups)}"
-                )
-                # Update pinned message in Saved Messages
-                chat = await client.get_chat(my_id)
-                pinned = chat.pinned_message
-                if pinned:
-                    await pinned.edit_text(config_text)
-                else:
-                    sent = await client.send_message(my_id, config_text)
-                    await sent.pin()
-                # Reload config instantly
-                Config.TARGET_USER_IDS = users
-                Config.TARGET_CHANNEL_IDS = channels + groups
-                # Auto-cache new ID immediately
+            action, typ, id_val = action.lower(), typ.lower(), int(id_str)
+            # Applied in memory right away; the pinned message is rewritten once per burst of commands
+            snapshot = config_store.apply(action, typ, id_val)
+            if snapshot is None:
+                await message.reply(f"ℹ️ No change: {typ} {action} {id_val}")
+                return
+            # Auto-cache new ID immediately
+            if action == "add":
                 try:
-                    if action.lower() == "add":
-                        if typ == "user":
-                            user = await client.get_users(id_val)
-                            logger.info(f"✅ Auto-cached user: {user.first_name}")
-                        elif typ == "channel" or typ == "group":
-                            chat_obj = await client.get_chat(id_val)
-                            logger.info(f"✅ Auto-cached {typ}: {chat_obj.title}")
+                    if typ == "user":
+                        user = await peer_cache.get_user(client, id_val, refresh=True)
+                        await peer_cache.record_access_hash(client, f"user:{id_val}")
+                        logger.info(f"✅ Auto-cached user: {user.first_name}")
+                    else:
+                        chat_obj = await peer_cache.get_chat(client, id_val, refresh=True)
+                        await peer_cache.record_access_hash(client, f"chat:{id_val}")
+                        logger.info(f"✅ Auto-cached {typ}: {chat_obj.title}")
                 except Exception as e:
                     logger.warning(f"⚠️ Auto-cache failed for {typ} {id_val}: {e}")
-                logger.info(f"🔄 Updated monitored IDs via admin command: USERS={users}, CHANNELS={channels}, GROUPS={groups}")
-                await message.reply(f"✅ Updated config: {typ} {action} {id_val}")
-            else:
-                await message.reply(f"ℹ️ No change: {typ} {action} {id_val}")
+            await message.reply(f"✅ Updated config v{snapshot.version}: {typ} {action} {id_val}")
 
-        # Register generic message handler - no filters to catch everything
-        @app.on_message()
-        async def handle_message(client, message):
-            # Skip edited messages
-            if message.edit_date:
+        # Hot reload: a hand edit of the pinned config, or a newly pinned config, applies without a restart
+        @app.on_edited_message(filters.me & filters.text)
+        async def pinned_config_edited(client, message):
+            if message.chat.id != routing_table.owner_id or message.id != config_store.pinned_id:
                 return
-            # Only skip admin commands, allow all other messages including from saved messages
-            if message.text:
-                import re
-                if re.match(r"/(add|remove)\s+(user|channel|group)\s+(-?\d+)", message.text.strip(), re.I):
+            if config_store.load_text(message.text) is not None:
+                app.loop.create_task(cache_all_peers_startup(client))
+
+        @app.on_message(filters.me & filters.pinned_message)
+        async def pinned_config_replaced(client, message):
+            if message.chat.id != routing_table.owner_id:
+                return
+            pinned = message.pinned_message
+            if pinned is None or not pinned.text or pinned.id == config_store.pinned_id:
+                return
+            if config_store.load_text(pinned.text, pinned.id) is not None:
+                app.loop.create_task(cache_all_peers_startup(client))
+
+        @app.on_disconnect()
+        async def connection_lost(client):
+            # Pyrogram reconnects on its own; once it is back, fetch what the live handler missed.
+            # Marks freeze now, not when the pass starts, so posts delivered in between can't skip the gap
+            global recovery_pending
+            recovery_pending = True
+            async def recover_after_reconnect():
+                await asyncio.sleep(Config.RECOVERY_RECONNECT_DELAY)
+                if client.is_connected:
+                    await recover_realtime_gaps(client)
+            logger.warning("🔌 Disconnected from Telegram, gap recovery scheduled")
+            client.loop.create_task(recover_after_reconnect())
+
+        @app.on_message(filters.me & filters.command("stats"))
+        async def stats_command_handler(client, message):
+            """Reply in Saved Messages with throughput, latency and lag numbers"""
+            if message.chat.id != routing_table.owner_id:
+                return
+            await message.reply(metrics.summary())
+
+        @app.on_message(filters.me & filters.command("search"))
+        async def search_command_handler(client, message):
+            """Search the local archive: /search <words or FTS5 query>"""
+            if message.chat.id != routing_table.owner_id:
+                return
+            if archive is None:
+                await message.reply("🗄️ The archive is disabled, set ARCHIVE_DB to enable /search")
+                return
+            query = message.text.split(None, 1)[1].strip() if len(message.command) > 1 else ""
+            if not query:
+                await message.reply("Usage: /search <query>")
+                return
+            started = time.perf_counter()
+            hits = archive.search(query)
+            elapsed = (time.perf_counter() - started) * 1000
+            lines = [f"🔎 {len(hits)} result(s) for \"{query}\" ({elapsed:.0f}ms)"]
+            for hit in hits:
+                day = time.strftime("%Y-%m-%d", time.localtime(hit.date)) if hit.date else "?"
+                lines.append(f"\n📢 {hit.chat_title or hit.chat_id} · {day}\n{hit.snippet}")
+                if hit.link:
+                    lines.append(hit.link)
+            await message.reply("\n".join(lines)[:4096], parse_mode=ParseMode.DISABLED, disable_web_page_preview=True)
+
+        @app.on_message(filters.me & filters.command("backfill"))
+        async def backfill_command_handler(client, message):
+            """Copy a chat's history to the vault: /backfill <chat> [from] [to]; /backfill alone shows progress"""
+            if message.chat.id != routing_table.owner_id:
+                return
+            try:
+                args = parse_backfill_args(message.command[1:])
+            except ValueError as e:
+                await message.reply(f"Usage: /backfill <chat> [from] [to] ({e})")
+                return
+            if not args:
+                jobs = backfill_store.unfinished()
+                lines = [f"⏮️ {len(jobs)} unfinished backfill(s), {len(backfill_tasks)} running"]
+                lines.extend(job.describe() for job in jobs)
+                await message.reply("\n".join(lines))
+                return
+            try:
+                chat = await peer_cache.get_chat(client, args[0])
+                if chat.id in backfill_tasks:
+                    await message.reply(f"ℹ️ A backfill of {chat.title or chat.id} is already running")
                     return
-            await message_handler(client, message)
+                job = await new_backfill_job(client, chat.id, *args[1:])
+            except Exception as e:
+                await message.reply(f"❌ Can't backfill {args[0]}: {e}")
+                return
+            start_backfill(client, job)
+            await message.reply(f"⏮️ Backfill queued: {job.describe()}")
+
+        @app.on_message(filters.me & filters.command("profile"))
+        async def profile_command_handler(client, message):
+            """Sample the live event loop: /profile [seconds]; replies with the hottest frames and a collapsed-stack file"""
+            global profiling
+            if message.chat.id != routing_table.owner_id:
+                return
+            try:
+                seconds = int(message.command[1]) if len(message.command) > 1 else 30
+            except ValueError:
+                await message.reply("Usage: /profile [seconds]")
+                return
+            seconds = max(1, min(seconds, Config.PROFILE_MAX_SECONDS))
+            if profiling:
+                await message.reply("ℹ️ A profile is already being captured")
+                return
+            profiling = True
+            try:
+                await message.reply(f"🔬 Profiling the event loop for {seconds}s...")
+                path, samples = await profile_loop(seconds, Config.PROFILE_DIR)
+            finally:
+                profiling = False
+            lines = [f"🔬 {sum(samples.values())} samples in {seconds}s, busiest frames:"]
+            lines.extend(f"{share:6.1%}  {name}" for name, share in top_functions(samples))
+            lines.append(f"Collapsed stacks: {path}")
+            await message.reply("\n".join(lines)[:4096], parse_mode=ParseMode.DISABLED)
+            try:
+                await message.reply_document(path, caption="flamegraph.pl / speedscope input")
+            except Exception as e:
+                logger.warning(f"⚠️ Could not upload profile {path}: {e}")
+
+        # Register generic message handler - the routing filter drops edits, admin commands
+        # and every update that is not from a monitored target before a handler task is created
+        @app.on_message(dispatch_filter(lambda: routing_table))
+        async def handle_message(client, message):
+            if watchdog is None:
+                await message_handler(client, message)
+                return
+            with watchdog.timed("message_handler", message.chat.id):
+                await message_handler(client, message)
 
         # Start the client and run startup tasks
         with app:
+            # Restore peer metadata from the previous run
+            restored = peer_cache.load()
+            if restored:
+                logger.info(f"🗂️ Restored {restored} cached peers from {Config.PEER_CACHE_PATH}")
+            # Known access hashes go straight into the session so those peers resolve without the network
+            injected = app.loop.run_until_complete(peer_cache.restore_to_storage(app))
+            if injected:
+                logger.info(f"🔑 Restored {injected} access hash(es) into the session")
+            app.loop.create_task(peer_cache.autosave())
+            if deduplicator.load():
+                logger.info(f"🗂️ Restored dedup state from {Config.DEDUP_PATH}")
+            app.loop.create_task(deduplicator.autosave())
+            media_cache.load()
+            app.loop.create_task(media_cache.autosave())
+            app.loop.create_task(checkpoint_store.autoflush(Config.CHECKPOINT_FLUSH_INTERVAL))
+            app.loop.create_task(realtime_store.autoflush(Config.CHECKPOINT_FLUSH_INTERVAL))
+            app.loop.create_task(backfill_store.autoflush(Config.CHECKPOINT_FLUSH_INTERVAL))
+            if archive is not None:
+                archive.open()
+                app.loop.create_task(archive.autoflush(Config.CHECKPOINT_FLUSH_INTERVAL))
+            delivery_queue.start()
+            if watchdog is not None:
+                watchdog.start()
+            if Config.METRICS_PORT:
+                app.loop.run_until_complete(metrics.serve(Config.METRICS_PORT, Config.METRICS_HOST))
+            
             # Load config from pinned message
             my_id = app.loop.run_until_complete(startup_config())
             
-            # Cache all peers on startup to prevent "Peer id invalid" errors
+            # Resolve monitored peers on startup to prevent "Peer id invalid" errors
             app.loop.run_until_complete(cache_all_peers_startup(app))
             
+            # Bring up the extra accounts; one that fails to start is simply left off the ring
+            for extra in extra_clients:
+                try:
+                    app.loop.run_until_complete(extra.start())
+                    shards.add(Account(extra.name, extra, ApiLimiter(Config.API_RATE, Config.API_BURST)))
+                    logger.info(f"👥 Extra account {extra.name} started")
+                except Exception as e:
+                    logger.error(f"❌ Could not start extra account {extra.name}: {e}")
+            if len(shards) > 1:
+                channels = [c for c in Config.TARGET_CHANNEL_IDS if not isinstance(c, str)]
+                logger.info(f"🧩 Channels per account: {shards.assignment(channels)}")
+            
             logger.info("👤 Telegram Vault Userbot started successfully!")
             if Config.TARGET_USER_IDS:
                 logger.info(f"📌 Monitoring user IDs: {Config.TARGET_USER_IDS}")
             if Config.TARGET_CHANNEL_IDS:
                 logger.info(f"📢 Monitoring channels/groups: {Config.TARGET_CHANNEL_IDS}")
             logger.info(f"📦 Vault chat ID: {Config.VAULT_CHAT_ID}")
+            if len(vault_router.destinations) > 1:
+                logger.info(f"🧭 Routing to extra vaults: {list(vault_router.destinations[1:])}")
             logger.info("⏳ Running in USER MODE...")
             logger.info("💡 This will monitor ALL groups you're a member of")
             
-            # Start background polling task for channels
-            app.loop.create_task(poll_channels(app))
+            if backfill is None:
+                # Start background polling task for channels
+                app.loop.create_task(poll_channels(app))
+                app.loop.create_task(digest_loop(app))
+                
+                # Forward what supergroups and monitored users posted while we were offline
+                async def startup_recovery():
+                    await initialize_realtime_marks(app)
+                    await recover_realtime_gaps(app)
+                app.loop.create_task(startup_recovery())
+                
+                # Pick up backfills an earlier run was interrupted in
+                for job in backfill_store.unfinished():
+                    start_backfill(app, job)
             
-            # Keep running
-            app.loop.run_forever()
+            # Keep running (or only until the backfill is done)
+            try:
+                if backfill is None:
+                    app.loop.run_forever()
+                else:
+                    app.loop.run_until_complete(run_backfill_command(app, backfill))
+            finally:
+                # Send anything still batched, then persist local state even when stopped with Ctrl+C
+                app.loop.run_until_complete(config_store.flush())
+                app.loop.run_until_complete(forward_batcher.flush())
+                app.loop.run_until_complete(post_digests(app, force=True))
+                app.loop.run_until_complete(delivery_queue.stop())
+                if watchdog is not None:
+                    watchdog.stop()
+                peer_cache.save()
+                deduplicator.save()
+                media_cache.save()
+                checkpoint_store.close()
+                realtime_store.close()
+                backfill_store.close()
+                if archive is not None:
+                    archive.close()
+                for account in list(shards.accounts.values()):
+                    if account.client is not app and account.client.is_connected:
+                        app.loop.run_until_complete(account.client.stop())
         logger.info("Userbot client stopped cleanly.")
 
     except ValueError as e: